@@ -1,20 +1,34 @@
+import json
+import subprocess
 import textwrap
 import os
+from typing import List, Optional
 
 from cloud.aws.templates.aws_oidc.bin import resources
 from cloud.aws.templates.aws_oidc.bin.aws_cli import AwsCli
+from cloud.shared.bin.lib import deploy_timings
+from cloud.shared.bin.lib import deployment_fingerprint
 from cloud.shared.bin.lib import terraform
+from cloud.shared.bin.lib import template_layers
+from cloud.shared.bin.lib import terraform_events
 from cloud.shared.bin.lib.print import print
 from cloud.shared.bin.lib.color import red, yellow, cyan
 from cloud.shared.bin.lib.config_loader import ConfigLoader
 
+# Object in the Terraform state bucket with the fingerprint of the last
+# successful deploy.
+FINGERPRINT_KEY = 'deploy/fingerprint.json'
 
-def run(config: ConfigLoader):
+
+def run(config: ConfigLoader, force: bool = False):
     aws = AwsCli(config)
 
     if not config.is_test():
         _check_application_secret_length(config, aws)
-        _check_for_postgres_upgrade(config, aws)
+        # The upgrade check can set several config values, write the tfvars
+        # file once afterwards.
+        with config.edit_session():
+            _check_for_postgres_upgrade(config, aws)
 
     if config.get_config_var('POSTGRES_RESTORE_SNAPSHOT_IDENTIFIER'):
         answer = input(
@@ -32,7 +46,14 @@ def run(config: ConfigLoader):
             """))
         if answer.lower().strip() not in ['y', 'yes']:
             exit(1)
-    if not terraform.perform_apply(config):
+
+    targets = None
+    if not config.is_test() and not force:
+        if _is_unchanged(config, aws):
+            return
+        targets = _changed_layer_targets(config, aws)
+
+    if not terraform.perform_apply(config, targets=targets):
         print('Terraform deployment failed.')
         # TODO(#2606): write and upload logs.
         raise ValueError('Terraform deployment failed.')
@@ -51,6 +72,11 @@ def run(config: ConfigLoader):
         aws.sync_database_password_with_secret(config)
 
     aws.wait_for_ecs_service_healthy()
+    _save_fingerprint(config, aws)
+    deploy_timings.record_deploy(
+        'deploy',
+        app_prefix=config.app_prefix,
+        image_tag=os.getenv('TF_VAR_image_tag'))
     lb_dns = aws.get_load_balancer_dns(f'{config.app_prefix}-civiform-lb')
     base_url = config.get_base_url()
     print(
@@ -58,6 +84,163 @@ def run(config: ConfigLoader):
     )
 
 
+def _is_unchanged(config: ConfigLoader, aws: AwsCli) -> bool:
+    """Returns whether the deployment inputs match the last successful
+    deploy, after printing a report.
+
+    The local record is checked first since it is free. If it matches, the
+    record in the state bucket must match too, as someone else may have
+    deployed since, and the Terraform state must not be empty.
+    """
+    current = deployment_fingerprint.compute(config)
+    record = deployment_fingerprint.load_local_record(config)
+    last = record and deployment_fingerprint.DeploymentFingerprint.from_record(
+        record)
+    if last and not current.changed_components(
+            last) and not config.use_local_backend:
+        record = _load_remote_fingerprint_record(config, aws)
+        last = record and deployment_fingerprint.DeploymentFingerprint.from_record(
+            record)
+
+    changed = current.changed_components(last)
+    if changed:
+        if last:
+            print(
+                f'Changed since the last deploy: {", ".join(changed)}. Applying.'
+            )
+        return False
+    # The records outlive the resources if they were destroyed some other way
+    # than bin/run destroy.
+    if not _state_has_resources(config, aws):
+        print('The Terraform state has no resources. Applying.')
+        return False
+
+    print(
+        cyan(
+            textwrap.dedent(
+                f'''
+        Nothing changed since the last successful deploy of {record.get("image_tag")} at {record.get("deployed_at")}
+        (fingerprint {current.digest[:12]}). Skipping terraform apply.
+        Rerun the deploy with --force to apply anyway.
+        ''')))
+    return True
+
+
+def _changed_layer_targets(config: ConfigLoader,
+                           aws: AwsCli) -> Optional[List[str]]:
+    """Returns the addresses of the template layers whose variables changed
+    since the last successful deploy, or None to apply the whole template.
+    See template_layers.py."""
+    try:
+        layers = template_layers.load(config.get_template_dir())
+    except template_layers.LayerError as e:
+        print(yellow(f'Applying all layers of the template: {e}'))
+        return None
+    if layers is None:
+        return None
+
+    if config.use_local_backend:
+        record = deployment_fingerprint.load_local_record(config)
+    else:
+        record = _load_remote_fingerprint_record(config, aws)
+    last = record and deployment_fingerprint.DeploymentFingerprint.from_record(
+        record)
+    changed = deployment_fingerprint.compute(config).changed_variables(last)
+    affected = layers.affected(changed) if changed else None
+    if affected is None or len(affected) == len(layers.layers):
+        return None
+
+    print(
+        cyan(
+            f'Only some variables changed ({", ".join(changed)}). Applying the {", ".join(layer.name for layer in affected)} layers, which use them or depend on layers that do. Rerun the deploy with --force to apply all layers.'
+        ))
+    return template_layers.targets(affected)
+
+
+def _save_fingerprint(config: ConfigLoader, aws: AwsCli):
+    # Computed after the apply, since terraform init can update the lock file.
+    record = deployment_fingerprint.compute(config).to_record(
+        os.getenv('TF_VAR_image_tag'))
+    try:
+        deployment_fingerprint.save_local_record(config, record)
+    except OSError as e:
+        print(yellow(f'Could not save the deployment fingerprint: {e}'))
+    if config.use_local_backend:
+        return
+    try:
+        aws.put_s3_object(
+            _state_bucket(config), FINGERPRINT_KEY,
+            json.dumps(record, indent=2).encode('utf-8'))
+    except subprocess.CalledProcessError as e:
+        print(
+            yellow(
+                f'Could not save the deployment fingerprint to the state bucket: {e.output.decode()}'
+            ))
+
+
+def clear_fingerprint(config: ConfigLoader, aws: AwsCli):
+    """Deletes the records of the last successful deploy, so that the next
+    deploy applies the template."""
+    deployment_fingerprint.delete_local_record(config)
+    if config.use_local_backend:
+        return
+    try:
+        aws.delete_s3_object(_state_bucket(config), FINGERPRINT_KEY)
+    except subprocess.CalledProcessError as e:
+        print(
+            yellow(
+                f'Could not delete the deployment fingerprint from the state bucket: {e.output.decode()}'
+            ))
+
+
+def _state_has_resources(config: ConfigLoader, aws: AwsCli) -> bool:
+    try:
+        if config.use_local_backend:
+            with open(os.path.join(config.get_template_dir(),
+                                   'terraform.tfstate'), 'rb') as f:
+                body = f.read()
+        else:
+            body = aws.get_s3_object(
+                _state_bucket(config), resources.S3_TERRAFORM_STATE_KEY)
+        return bool(body and json.loads(body).get('resources'))
+    except FileNotFoundError:
+        return False
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        print(
+            yellow(
+                f'Could not read the Terraform state, deploying anyway: {e}'))
+        return False
+
+
+def _load_remote_fingerprint_record(config: ConfigLoader,
+                                    aws: AwsCli) -> Optional[dict]:
+    try:
+        body = aws.get_s3_object(_state_bucket(config), FINGERPRINT_KEY)
+        return json.loads(body) if body else None
+    except (subprocess.CalledProcessError, ValueError) as e:
+        print(
+            yellow(
+                f'Could not read the deployment fingerprint from the state bucket, deploying anyway: {e}'
+            ))
+        return None
+
+
+def _state_bucket(config: ConfigLoader) -> str:
+    return f'{config.app_prefix}-{resources.S3_TERRAFORM_STATE_BUCKET}'
+
+
+def _print_upgrade_history():
+    upgrade = deploy_timings.PlannedChange(
+        'aws_db_instance', 'update', deploy_timings.RDS_ENGINE_UPGRADE)
+    seconds = deploy_timings.historical_seconds(
+        upgrade, terraform_events.load_history())
+    if seconds:
+        print(
+            cyan(
+                f'Previous PostgreSQL engine upgrades on this machine took {deploy_timings.format_range(min(seconds), max(seconds))}.'
+            ))
+
+
 def _check_application_secret_length(config: ConfigLoader, aws: AwsCli):
     if not config.is_test():
         secret_length = aws.get_application_secret_length()
@@ -108,6 +291,7 @@ def _check_for_postgres_upgrade(config: ConfigLoader, aws: AwsCli):
                 
                 Additionally, a snapshot will be performed just prior to the upgrade. The snapshot will have a name that starts with "preupgrade". You may also have a snapshot called "{config.app_prefix}-civiform-db-finalsnapshot".
                 ''')))
+            _print_upgrade_history()
             if major_to_apply < current_major:
                 print(
                     red(
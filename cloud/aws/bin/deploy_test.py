@@ -0,0 +1,110 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from cloud.aws.bin import deploy
+from cloud.aws.templates.aws_oidc.bin import resources
+from cloud.aws.templates.aws_oidc.bin.destroy import Destroy
+from cloud.shared.bin.lib import deployment_fingerprint
+"""
+Tests for skipping unchanged deploys in deploy.py.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/aws/bin/deploy_test.py
+"""
+
+STATE_BUCKET = f'test-{resources.S3_TERRAFORM_STATE_BUCKET}'
+
+
+class FakeAwsCli:
+    """Keeps the objects of the state bucket in memory."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def get_s3_object(self, bucket_name, key):
+        return self.objects.get((bucket_name, key))
+
+    def put_s3_object(self, bucket_name, key, body):
+        self.objects[(bucket_name, key)] = body
+
+    def delete_s3_object(self, bucket_name, key):
+        self.objects.pop((bucket_name, key), None)
+
+    def get_url_of_s3_bucket(self, bucket_name):
+        return f'https://s3.console.aws.amazon.com/s3/buckets/{bucket_name}'
+
+
+class TestDeploy(unittest.TestCase):
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        env = patch.dict(
+            os.environ, {'CIVIFORM_DEPLOY_CACHE_DIR': cache_dir.name})
+        env.start()
+        self.addCleanup(env.stop)
+
+        fingerprint = deployment_fingerprint.DeploymentFingerprint(
+            {'tfvars': 'a'}, {'image_tag': 'b'})
+        compute = patch.object(
+            deployment_fingerprint, 'compute', return_value=fingerprint)
+        compute.start()
+        self.addCleanup(compute.stop)
+
+        self.config = MagicMock(app_prefix='test', use_local_backend=False)
+        self.config.get_cloud_provider.return_value = 'aws'
+        self.aws = FakeAwsCli()
+
+    def apply(self):
+        """Stands in for a successful terraform apply."""
+        state = {'resources': [{'type': 'aws_ecs_service'}]}
+        self.aws.put_s3_object(
+            STATE_BUCKET, resources.S3_TERRAFORM_STATE_KEY,
+            json.dumps(state).encode('utf-8'))
+        deploy._save_fingerprint(self.config, self.aws)
+
+    def test_unchanged_deploy_is_skipped(self):
+        self.assertFalse(deploy._is_unchanged(self.config, self.aws))
+        self.apply()
+
+        self.assertTrue(deploy._is_unchanged(self.config, self.aws))
+
+    def test_deploy_after_destroy_applies(self):
+        self.apply()
+
+        # terraform destroy leaves the state in the bucket without resources.
+        state = json.dumps({'resources': []}).encode('utf-8')
+        self.aws.put_s3_object(
+            STATE_BUCKET, resources.S3_TERRAFORM_STATE_KEY, state)
+        with patch('cloud.aws.templates.aws_oidc.bin.destroy.AwsCli',
+                   return_value=self.aws):
+            Destroy(self.config).post_terraform_destroy()
+
+        self.assertIsNone(deployment_fingerprint.load_local_record(self.config))
+        self.assertIsNone(
+            self.aws.get_s3_object(STATE_BUCKET, deploy.FINGERPRINT_KEY))
+        self.assertFalse(deploy._is_unchanged(self.config, self.aws))
+
+    def test_deploy_with_empty_state_applies(self):
+        self.apply()
+
+        # The resources were destroyed without bin/run destroy, which left
+        # the fingerprint records behind.
+        state = json.dumps({'resources': []}).encode('utf-8')
+        self.aws.put_s3_object(
+            STATE_BUCKET, resources.S3_TERRAFORM_STATE_KEY, state)
+
+        self.assertFalse(deploy._is_unchanged(self.config, self.aws))
+
+    def test_deploy_without_state_applies(self):
+        self.apply()
+        self.aws.delete_s3_object(
+            STATE_BUCKET, resources.S3_TERRAFORM_STATE_KEY)
+
+        self.assertFalse(deploy._is_unchanged(self.config, self.aws))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -72,10 +72,12 @@ def run(config: ConfigLoader):
             print(f'EC2 host IP is {ec2_host_ip}')
 
             db_hostname = aws.get_database_hostname()
-            db_user = aws.get_secret_value(
-                config.app_prefix + '-civiform_postgres_username')
-            db_pwd = aws.get_secret_value(
-                config.app_prefix + '-civiform_postgres_password')
+            db_user_secret = config.app_prefix + '-civiform_postgres_username'
+            db_pwd_secret = config.app_prefix + '-civiform_postgres_password'
+            secret_values = aws.get_secret_values(
+                [db_user_secret, db_pwd_secret])
+            db_user = secret_values[db_user_secret]
+            db_pwd = secret_values[db_pwd_secret]
 
             args = f'-o "UserKnownHostsFile=/dev/null" -o "StrictHostKeyChecking=no" -o "IdentitiesOnly=yes" -i {tmpdir}/dbaccess'
             ssh = f'ssh -q {args} "ubuntu@{ec2_host_ip}" '
@@ -141,7 +143,9 @@ def run(config: ConfigLoader):
             print('Cleaning up resources')
             os.unsetenv("TF_VAR_dbaccess_cidr_allowlist")
             os.unsetenv("TF_VAR_dbaccess")
-            _run_terraform(config)
+            # The state of the temporary resources was refreshed when they were
+            # created, so the teardown does not refresh them again.
+            _run_terraform(config, refresh=False)
 
 
 def _detect_public_ip() -> str:
@@ -184,7 +188,10 @@ def _run_cmd(cmd, quiet=False):
             raise e
 
 
-def _run_terraform(config: ConfigLoader):
-    if not terraform.perform_apply(config):
+def _run_terraform(config: ConfigLoader, refresh=True):
+    # Only the dbaccess resources change, so only they and their
+    # dependencies are planned and refreshed instead of the whole stack.
+    targets = resources.DBACCESS_TERRAFORM_TARGETS
+    if not terraform.perform_apply(config, targets=targets, refresh=refresh):
         sys.stderr.write("Terraform deployment failed.")
         raise ValueError("Terraform deployment failed.")
@@ -1,5 +1,6 @@
 import os
 from cloud.aws.templates.aws_oidc.bin import resources
+from cloud.aws.templates.aws_oidc.bin.aws_cli import AwsCli
 from cloud.shared.bin.lib import terraform
 
 
@@ -7,15 +8,33 @@ def setup_backend_config(config):
     if config.use_local_backend:
         terraform.copy_backend_override(config)
         return
+    lock_table = f'{config.app_prefix}-{resources.S3_TERRAFORM_LOCK_TABLE}'
+    use_lock_table = _uses_lock_table(config, lock_table)
     backend_file_location = os.path.join(
         config.get_template_dir(), config.backend_vars_filename)
     with open(backend_file_location, 'w') as f:
         f.write(
             f'bucket         = "{config.app_prefix}-{resources.S3_TERRAFORM_STATE_BUCKET}"\n'
         )
-        f.write(f'key            = "tfstate/terraform.tfstate"\n')
+        f.write(f'key            = "{resources.S3_TERRAFORM_STATE_KEY}"\n')
         f.write(f'region         = "{config.aws_region}"\n')
-        f.write(
-            f'dynamodb_table = "{config.app_prefix}-{resources.S3_TERRAFORM_LOCK_TABLE}"\n'
-        )
+        if config.terraform_state_locking == 's3':
+            # Requires Terraform 1.10 or later.
+            f.write(f'use_lockfile   = true\n')
+        if use_lock_table:
+            f.write(f'dynamodb_table = "{lock_table}"\n')
         f.write(f'encrypt        = true\n')
+
+
+def _uses_lock_table(config, lock_table: str) -> bool:
+    """Returns whether to lock the state with the DynamoDB lock table.
+
+    Every machine writes the backend config from its own config file, so
+    while some still lock only with the table, machines with
+    TERRAFORM_STATE_LOCKING=s3 lock with both the lock file and the table.
+    They stop using the table once migrate_state_locking --delete-lock-table
+    deleted it.
+    """
+    if config.terraform_state_locking != 's3':
+        return True
+    return AwsCli(config).resource_exists('table', lock_table)
@@ -0,0 +1,121 @@
+"""Implements the migrate_state_locking command for aws.
+
+Moves a deployment from locking the Terraform state with the DynamoDB lock
+table to Terraform's S3 lock file (use_lockfile), which needs no extra
+service and avoids the lock table's state digest, see
+AwsCli.set_lock_table_digest_value.
+
+To migrate, set TERRAFORM_STATE_LOCKING=s3 in the config file and run this
+command on each machine that deploys, or commit the config file and run it
+once per checkout. The state stays where it is, only the backend is
+reconfigured. Until the lock table is deleted, migrated machines lock with
+both the lock file and the table, so they still exclude the deploys of
+machines that were not migrated yet. Once every machine is migrated, rerun
+the command with --delete-lock-table to delete the table, after which
+machines lock with the lock file only. See backend_setup.py.
+
+This module is dynamically loaded from cloud/shared/bin/run.py.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+from typing import List, Optional, Tuple
+
+from cloud.aws.bin.lib import backend_setup
+from cloud.aws.templates.aws_oidc.bin import resources
+from cloud.aws.templates.aws_oidc.bin.aws_cli import AwsCli
+from cloud.shared.bin.lib import state_lock
+from cloud.shared.bin.lib import terraform
+from cloud.shared.bin.lib.config_loader import ConfigLoader
+from cloud.shared.bin.lib.print import print
+from cloud.shared.bin.lib.color import cyan, yellow
+
+# First version with the use_lockfile backend option.
+MIN_TERRAFORM_VERSION = (1, 10, 0)
+
+
+def run(config: ConfigLoader, params: List[str]):
+    parser = argparse.ArgumentParser(prog='migrate_state_locking')
+    parser.add_argument(
+        '--delete-lock-table',
+        action='store_true',
+        help=
+        'Delete the DynamoDB lock table after migrating. Only do this once every machine that deploys uses TERRAFORM_STATE_LOCKING=s3.'
+    )
+    args = parser.parse_args(params)
+
+    if config.use_local_backend:
+        exit('The local backend has no lock table to migrate from.')
+    if config.terraform_state_locking != 's3':
+        exit(
+            'Set TERRAFORM_STATE_LOCKING=s3 in the config file, then rerun the command.'
+        )
+    version = _terraform_version()
+    if version is None or version < MIN_TERRAFORM_VERSION:
+        exit(
+            f'Locking with an S3 lock file requires Terraform {".".join(map(str, MIN_TERRAFORM_VERSION))} or later. Upgrade Terraform, then rerun the command.'
+        )
+
+    terraform.perform_init(config, reconfigure=True)
+    table = f'{config.app_prefix}-{resources.S3_TERRAFORM_LOCK_TABLE}'
+    aws = AwsCli(config)
+    if not aws.resource_exists('table', table):
+        print(
+            cyan(
+                'The Terraform state is now locked with a lock file in the state bucket.'
+            ))
+        return
+    print(
+        cyan(
+            f'The Terraform state is now locked with a lock file in the state bucket, and with the lock table {table}.'
+        ))
+    if not args.delete_lock_table:
+        print(
+            'Migrate the other machines that deploy too, then rerun the command with --delete-lock-table to lock with the lock file only.'
+        )
+        return
+
+    if not os.getenv('SKIP_USER_INPUT'):
+        answer = input(
+            yellow(
+                f'Delete {table}? Deploys from machines that still use it will fail. [y/N] > '
+            ))
+        if answer.lower().strip() not in ['y', 'yes']:
+            exit(1)
+    # Checked after the prompt, which can take a while to answer.
+    _exit_if_locked(aws)
+    if not aws.delete_table(table):
+        exit(1)
+    print(f'Deleted {table}.')
+    backend_setup.setup_backend_config(config)
+    terraform.perform_init(config, reconfigure=True)
+    print(
+        cyan(
+            'The Terraform state is now locked with a lock file in the state bucket only. Other machines are asked to rerun this command on their next deploy.'
+        ))
+
+
+def _exit_if_locked(aws: AwsCli):
+    """Exits if the state is locked with the lock table, since deleting the
+    table would let an operation that locks with the lock file only run
+    alongside the one that holds the lock."""
+    try:
+        info = aws.get_terraform_lock_info(locking='dynamodb')
+    except subprocess.CalledProcessError as e:
+        exit(f'Could not read the lock table: {e.output.decode()}')
+    lock = state_lock.LockInfo.from_json(info) if info else None
+    if lock:
+        exit(
+            f'The state is locked with the lock table ({lock.describe()}). Wait for that operation to finish, then rerun the command.'
+        )
+
+
+def _terraform_version() -> Optional[Tuple[int, ...]]:
+    try:
+        output = subprocess.check_output(['terraform', 'version', '-json'])
+        version = json.loads(output)['terraform_version']
+        return tuple(int(part) for part in version.split('-')[0].split('.'))
+    except (OSError, subprocess.CalledProcessError, ValueError, KeyError):
+        return None
@@ -0,0 +1,127 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cloud.aws.bin import migrate_state_locking
+from cloud.aws.bin.lib import backend_setup
+from cloud.shared.bin.lib.config_loader import ConfigLoader
+"""
+ Tests for the migrate_state_locking command.
+
+ To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/aws/bin/migrate_state_locking_test.py
+"""
+
+
+def _config(template_dir, **fields):
+    config = ConfigLoader()
+    config._config_fields = {
+        "TERRAFORM_TEMPLATE_DIR": template_dir,
+        "CIVIFORM_CLOUD_PROVIDER": "aws",
+        "APP_PREFIX": "test",
+        **fields
+    }
+    return config
+
+
+class TestMigrateStateLocking(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.template_dir = tmpdir.name
+
+    def _backend_vars(self, config):
+        backend_setup.setup_backend_config(config)
+        with open(os.path.join(self.template_dir,
+                               config.backend_vars_filename)) as f:
+            return f.read()
+
+    @patch('cloud.aws.bin.lib.backend_setup.AwsCli')
+    def test_backend_config(self, mock_aws_cli):
+        backend_vars = self._backend_vars(_config(self.template_dir))
+        self.assertIn(
+            'dynamodb_table = "test-civiform-locktable"', backend_vars)
+        self.assertNotIn("use_lockfile", backend_vars)
+        mock_aws_cli.assert_not_called()
+
+        # Until the lock table is deleted, both locks are taken.
+        config = _config(self.template_dir, TERRAFORM_STATE_LOCKING="s3")
+        mock_aws_cli.return_value.resource_exists.return_value = True
+        backend_vars = self._backend_vars(config)
+        self.assertIn("use_lockfile   = true", backend_vars)
+        self.assertIn(
+            'dynamodb_table = "test-civiform-locktable"', backend_vars)
+        mock_aws_cli.return_value.resource_exists.assert_called_with(
+            "table", "test-civiform-locktable")
+
+        mock_aws_cli.return_value.resource_exists.return_value = False
+        backend_vars = self._backend_vars(config)
+        self.assertIn("use_lockfile   = true", backend_vars)
+        self.assertNotIn("dynamodb_table", backend_vars)
+
+    def test_requires_s3_locking_in_config(self):
+        with self.assertRaises(SystemExit):
+            migrate_state_locking.run(_config(self.template_dir), [])
+
+    @patch('cloud.aws.bin.migrate_state_locking._terraform_version')
+    def test_requires_terraform_with_lockfile_support(self, mock_version):
+        mock_version.return_value = (1, 9, 8)
+
+        with self.assertRaises(SystemExit):
+            migrate_state_locking.run(
+                _config(self.template_dir, TERRAFORM_STATE_LOCKING="s3"), [])
+
+    def _migrate(self, *params):
+        config = _config(self.template_dir, TERRAFORM_STATE_LOCKING="s3")
+        with patch.dict(os.environ, {"SKIP_USER_INPUT": "true"}):
+            migrate_state_locking.run(config, list(params))
+
+    @patch('cloud.aws.bin.migrate_state_locking.backend_setup')
+    @patch('cloud.aws.bin.migrate_state_locking.terraform.perform_init')
+    @patch('cloud.aws.bin.migrate_state_locking.AwsCli')
+    @patch('cloud.aws.bin.migrate_state_locking._terraform_version')
+    def test_keeps_lock_table_until_asked_to_delete_it(
+            self, mock_version, mock_aws_cli, mock_init, mock_backend_setup):
+        mock_version.return_value = (1, 11, 0)
+        aws = mock_aws_cli.return_value
+        aws.resource_exists.return_value = True
+
+        self._migrate()
+
+        mock_init.assert_called_once()
+        self.assertTrue(mock_init.call_args.kwargs["reconfigure"])
+        aws.delete_table.assert_not_called()
+        mock_backend_setup.setup_backend_config.assert_not_called()
+
+    @patch('cloud.aws.bin.migrate_state_locking.backend_setup')
+    @patch('cloud.aws.bin.migrate_state_locking.terraform.perform_init')
+    @patch('cloud.aws.bin.migrate_state_locking.AwsCli')
+    @patch('cloud.aws.bin.migrate_state_locking._terraform_version')
+    def test_does_not_delete_lock_table_while_locked(
+            self, mock_version, mock_aws_cli, mock_init, mock_backend_setup):
+        mock_version.return_value = (1, 11, 0)
+        aws = mock_aws_cli.return_value
+        aws.resource_exists.return_value = True
+        aws.get_terraform_lock_info.return_value = json.dumps(
+            {
+                "ID": "0b8d6b6e-8b8e-4d5a-9a3c-2f1e6f4f1a2b",
+                "Who": "runner@ci-host"
+            })
+
+        with self.assertRaises(SystemExit):
+            self._migrate("--delete-lock-table")
+        aws.get_terraform_lock_info.assert_called_with(locking="dynamodb")
+        aws.delete_table.assert_not_called()
+
+        aws.get_terraform_lock_info.return_value = None
+        self._migrate("--delete-lock-table")
+        aws.delete_table.assert_called_once_with("test-civiform-locktable")
+        # Without the table, the backend is reconfigured to the lock file only.
+        mock_backend_setup.setup_backend_config.assert_called_once()
+        self.assertEqual(mock_init.call_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
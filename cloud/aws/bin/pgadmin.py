@@ -13,6 +13,7 @@ import urllib.request
 from enum import Enum
 from typing import Callable, List
 
+from cloud.aws.templates.aws_oidc.bin import resources
 from cloud.aws.templates.aws_oidc.bin.aws_cli import AwsCli
 from cloud.shared.bin.lib import terraform
 from cloud.shared.bin.lib.config_loader import ConfigLoader
@@ -39,7 +40,9 @@ def run(config: ConfigLoader):
     )
     os.unsetenv("TF_VAR_pgadmin_cidr_allowlist")
     os.unsetenv("TF_VAR_pgadmin")
-    _run_terraform(config)
+    # The state of the temporary resources was refreshed when they were
+    # created, so the teardown does not refresh them again.
+    _run_terraform(config, refresh=False)
 
 
 def _get_cidr_list() -> str:
@@ -74,8 +77,11 @@ def _detect_public_ip() -> str:
         return ""
 
 
-def _run_terraform(config: ConfigLoader):
-    if not terraform.perform_apply(config):
+def _run_terraform(config: ConfigLoader, refresh=True):
+    # Only the pgadmin resources change, so only they and their
+    # dependencies are planned and refreshed instead of the whole stack.
+    targets = resources.PGADMIN_TERRAFORM_TARGETS
+    if not terraform.perform_apply(config, targets=targets, refresh=refresh):
         sys.stderr.write("Terraform deployment failed.")
         raise ValueError("Terraform deployment failed.")
 
@@ -108,6 +114,19 @@ def _print_connection_info(config, url):
     pgadmin_username_secret = prefix + '-cf-pgadmin-default-username'
     pgadmin_password_secret = prefix + '-cf-pgadmin-default-password'
     database_password_secret = prefix + '-civiform_postgres_password'
+    secret_values = {}
+
+    def secret_value(secret_name):
+        # The first secret that is printed fetches all of them at once.
+        if not secret_values:
+            secret_values.update(
+                aws.get_secret_values(
+                    [
+                        pgadmin_username_secret, pgadmin_password_secret,
+                        database_password_secret
+                    ]))
+        return secret_values[secret_name]
+
     print(
         'To use the pgAdmin instance, you will need the pgadmin username, pgadmin password, and the PostgreSQL database password. Because these are sensitive values, you can either choose to print them here, or look them up yourself. To look them up, find the secret in AWS Secrets Manager, or run the "aws secretsmanager get-secret-value --secret-id=<secret name>" command. If you choose not to print them here, the name of the secret will be printed instead.\n'
     )
@@ -115,8 +134,8 @@ def _print_connection_info(config, url):
         'Would you like to print the pgadmin username and password? [y/N] > ')
     if answer.lower().strip() in ['y', 'yes']:
         print(
-            f"  pgAdmin login username: {cyan(aws.get_secret_value(pgadmin_username_secret))}\n"
-            f"  pgAdmin login password: {cyan(aws.get_secret_value(pgadmin_password_secret))}\n"
+            f"  pgAdmin login username: {cyan(secret_value(pgadmin_username_secret))}\n"
+            f"  pgAdmin login password: {cyan(secret_value(pgadmin_password_secret))}\n"
         )
     else:
         print(
@@ -126,7 +145,7 @@ def _print_connection_info(config, url):
     answer = input('Would you like to print the database password? [y/N] > ')
     if answer.lower().strip() in ['y', 'yes']:
         print(
-            f"  PostgreSQL database password: {cyan(aws.get_secret_value(database_password_secret))}"
+            f"  PostgreSQL database password: {cyan(secret_value(database_password_secret))}"
         )
     else:
         print(
@@ -1,18 +1,30 @@
+import concurrent.futures
 import shlex
 import subprocess
 import json
 import time
 import inspect
+import os
 import re
-from typing import Dict, Optional
+import tempfile
+from typing import Dict, Iterable, List, Optional
 
+from cloud.aws.templates.aws_oidc.bin import aws_clients
+from cloud.aws.templates.aws_oidc.bin import ecs_rollout
 from cloud.aws.templates.aws_oidc.bin import resources
+from cloud.shared.bin.lib import deploy_timings
 from cloud.shared.bin.lib.config_loader import ConfigLoader
 from cloud.shared.bin.lib.print import print
 
 
 class AwsCli:
-    """Wrapper class that encapsulates calls to AWS CLI."""
+    """Wrapper class that encapsulates calls to AWS, in process with boto3
+    when it is installed, or with the AWS CLI. See aws_clients.py."""
+
+    # BatchGetSecretValue takes up to 20 secrets per call.
+    MAX_BATCH_SECRETS = 20
+    # Threads that fetch secrets one by one when the batch call fails.
+    MAX_SECRET_THREADS = 8
 
     def __init__(self, config: ConfigLoader):
         self.config: ConfigLoader = config
@@ -20,10 +32,55 @@ class AwsCli:
         self._ecs_service = f"{config.app_prefix}-{resources.FARGATE_SERVICE}"
 
     def get_secret_value(self, secret_name: str) -> str:
-        res = self._call_cli(
-            f"secretsmanager get-secret-value --secret-id={secret_name}")
+        res = self._call(
+            "secretsmanager", "get_secret_value", SecretId=secret_name)
         return res["SecretString"]
 
+    def get_secret_values(self, secret_names: Iterable[str]) -> Dict[str, str]:
+        """
+        Returns the values of the secrets, keyed by name, with as few round
+        trips as possible.
+
+        The secrets are fetched with BatchGetSecretValue. If that fails,
+        e.g. because an older CLI doesn't have it or the caller isn't
+        allowed to use it, the secrets it didn't return are fetched one by
+        one on a few threads. Like get_secret_value, raises if a secret
+        can't be read.
+        """
+        secret_names = list(dict.fromkeys(secret_names))
+        values = {}
+        for i in range(0, len(secret_names), self.MAX_BATCH_SECRETS):
+            try:
+                values.update(
+                    self._batch_get_secret_values(
+                        secret_names[i:i + self.MAX_BATCH_SECRETS]))
+            except (subprocess.CalledProcessError, AttributeError):
+                break
+
+        missing = [name for name in secret_names if name not in values]
+        if missing:
+            workers = min(self.MAX_SECRET_THREADS, len(missing))
+            with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                values.update(
+                    zip(missing, executor.map(self.get_secret_value, missing)))
+        return values
+
+    def _batch_get_secret_values(self,
+                                 secret_names: List[str]) -> Dict[str, str]:
+        """Returns the values BatchGetSecretValue could read. Secrets it
+        reports errors for are left out."""
+        values = {}
+        params = {"SecretIdList": secret_names}
+        while True:
+            res = self._call(
+                "secretsmanager", "batch_get_secret_value", **params)
+            for secret in res.get("SecretValues", []):
+                if "SecretString" in secret:
+                    values[secret["Name"]] = secret["SecretString"]
+            if not res.get("NextToken"):
+                return values
+            params["NextToken"] = res["NextToken"]
+
     def is_secret_empty(self, secret_name: str) -> bool:
         return self.get_secret_value(secret_name).strip() == ""
 
@@ -31,18 +88,22 @@ class AwsCli:
         return self.get_secret_value(secret_name).startswith("default-")
 
     def set_secret_value(self, secret_name: str, new_value: str):
-        self._call_cli(
-            f"secretsmanager update-secret --secret-id={secret_name} --secret-string={new_value}"
-        )
+        self._call(
+            "secretsmanager",
+            "update_secret",
+            SecretId=secret_name,
+            SecretString=new_value)
 
     def get_current_user(self) -> str:
-        res = self._call_cli("sts get-caller-identity")
+        res = self._call("sts", "get_caller_identity")
         return res["UserId"]
 
     def update_master_password_in_database(self, db_name: str, password: str):
-        self._call_cli(
-            f"rds modify-db-instance --db-instance-identifier={db_name} --master-user-password={password} "
-        )
+        self._call(
+            "rds",
+            "modify_db_instance",
+            DBInstanceIdentifier=db_name,
+            MasterUserPassword=password)
 
     def sync_database_password_with_secret(self, config: ConfigLoader):
         """
@@ -85,10 +146,14 @@ class AwsCli:
         """
         Restarts the CiviForm ECS service.
         """
-        self._call_cli(
-            f"ecs update-service --force-new-deployment --cluster={self._ecs_cluster} --service={self._ecs_service}"
-        )
-
+        self._call(
+            "ecs",
+            "update_service",
+            cluster=self._ecs_cluster,
+            service=self._ecs_service,
+            forceNewDeployment=True)
+
+    @deploy_timings.phase("ecs_wait")
     def wait_for_ecs_service_healthy(self):
         """
         Polls the CiviForm ECS service, waiting for the PRIMARY deployment to
@@ -96,7 +161,9 @@ class AwsCli:
         being different than the ID we attempting to deploy, then the deployment
         failed and we've rolled back.
 
-        Gives up after 60 tries, sleeps 30 seconds between each try.
+        Polls often at first and backs off, see ecs_rollout.py, printing the
+        service events and the task counts and health on the way. Gives up
+        after 30 minutes.
         """
         print(
             "\nWaiting for CiviForm ECS service to become healthy.\n"
@@ -109,11 +176,16 @@ class AwsCli:
             """)
 
         current_deployment_id = None
-        tries = 60
+        rollout = ecs_rollout.Rollout()
+        backoff = ecs_rollout.Backoff()
+        deadline = time.monotonic() + ecs_rollout.TIMEOUT_SECONDS
         while True:
-            info = self._ecs_service_state()
-            id = info["id"]
-            state = info["state"]
+            service = self._describe_ecs_service()
+            for message in rollout.new_events(service):
+                print(f"  Event: {message}")
+            info = self._ecs_service_state(service)
+            id = info.get("id")
+            state = info.get("state")
             current_deployment_id = id if current_deployment_id is None else current_deployment_id
 
             if state == "COMPLETED":
@@ -132,19 +204,21 @@ class AwsCli:
                     "To view the logs to see what happened, " + error_text)
                 raise Exception("Service failed")
 
-            tries -= 1
-            if tries == 0:
+            if info:
+                status = rollout.status_change(
+                    info["deployment"], self._ecs_target_health(service))
+                if status:
+                    print(f"  {status}")
+
+            interval = backoff.next_interval()
+            if time.monotonic() + interval > deadline:
                 print(
                     "ERROR: service did not become healthy in expected amount of time.\n"
                     "This usually means the new tasks are crash-looping, but can mean the check timed out before the service finished starting.\n"
                     "To check the health of the service, " + error_text)
                 raise Exception(
                     "Service did not become healthy in expected duration")
-
-            print(
-                f"  Service in state {state}. Retrying ({tries} left) in 30 seconds..."
-            )
-            time.sleep(30)
+            time.sleep(interval)
 
     def set_lock_table_digest_value(self, value):
         """
@@ -161,14 +235,65 @@ class AwsCli:
         """
         table = f'{self.config.app_prefix}-{resources.S3_TERRAFORM_LOCK_TABLE}'
         file = f'{self.config.app_prefix}-{resources.S3_TERRAFORM_STATE_BUCKET}'
-        command = f'dynamodb put-item --table-name={table} --item=\'{{"LockID":{{"S":"{file}/tfstate/terraform.tfstate-md5"}},"Digest":{{"S":"{value}"}}}}\''
-        self._call_cli(command, False)  # output = False
+        self._call(
+            "dynamodb",
+            "put_item",
+            TableName=table,
+            Item={
+                "LockID": {
+                    "S": f"{file}/tfstate/terraform.tfstate-md5"
+                },
+                "Digest": {
+                    "S": value
+                }
+            })
+
+    def get_terraform_lock_info(self,
+                                locking: Optional[str] = None) -> Optional[str]:
+        """
+        Returns the Info attribute of the Terraform state lock item in the
+        DynamoDB lock table, which describes who holds the lock, or None if
+        the state is not locked.
+
+        With TERRAFORM_STATE_LOCKING=s3, the same info is read from the lock
+        file next to the state instead. locking overrides the config.
+        """
+        table = f'{self.config.app_prefix}-{resources.S3_TERRAFORM_LOCK_TABLE}'
+        file = f'{self.config.app_prefix}-{resources.S3_TERRAFORM_STATE_BUCKET}'
+        if (locking or self.config.terraform_state_locking) == 's3':
+            body = self.get_s3_object(file, 'tfstate/terraform.tfstate.tflock')
+            return body.decode('utf-8') if body else None
+        res = self._call(
+            "dynamodb",
+            "get_item",
+            TableName=table,
+            ConsistentRead=True,
+            Key={"LockID": {
+                "S": f"{file}/tfstate/terraform.tfstate"
+            }})
+        return res.get("Item", {}).get("Info", {}).get("S")
+
+    def _describe_ecs_service(self) -> Dict:
+        """
+        Returns the CiviForm ECS service, or an empty dictionary if it is not
+        found.
+        """
+        res = self._call(
+            "ecs",
+            "describe_services",
+            cluster=self._ecs_cluster,
+            services=[self._ecs_service])
+
+        services = res["services"]
+        if services == None or len(services) != 1:
+            return {}
+        return services[0]
 
-    def _ecs_service_state(self) -> Dict:
+    def _ecs_service_state(self, service: Dict) -> Dict:
         """
-        Returns the ID and rolloutState of the PRIMARY ECS service deployment. If
-        the CiviForm service is not found or there is no PRIMARY deployment
-        found, an empty dictionary is returned.
+        Returns the ID and rolloutState of the PRIMARY ECS service deployment,
+        and the deployment itself. If the CiviForm service is not found or
+        there is no PRIMARY deployment found, an empty dictionary is returned.
 
         An ECS service has many deployments. Each deployment has a status of
         PRIMARY, ACTIVE, or INACTIVE. There can only be one deployment with the
@@ -193,28 +318,65 @@ class AwsCli:
 
         https://docs.aws.amazon.com/AmazonECS/latest/APIReference/API_Deployment.html.
         """
-        res = self._call_cli(
-            f"ecs describe-services --cluster={self._ecs_cluster} --services={self._ecs_service}"
-        )
-
-        services = res["services"]
-        if services == None or len(services) != 1:
+        deployment = ecs_rollout.primary_deployment(service)
+        if deployment is None:
             return {}
-
-        for deployment in services[0]["deployments"]:
-            if deployment["status"] == "PRIMARY":
-                return {
-                    "id": deployment["id"],
-                    "state": deployment["rolloutState"]
-                }
-
-        return {}
+        return {
+            "id": deployment["id"],
+            "state": deployment["rolloutState"],
+            "deployment": deployment
+        }
+
+    def _ecs_target_health(self,
+                           service: Dict) -> List[ecs_rollout.TargetHealth]:
+        """
+        Returns the load balancer health of the running tasks of the service.
+        Health is only progress information, so it is left out if it can't
+        be read.
+        """
+        target_groups = [
+            lb["targetGroupArn"]
+            for lb in service.get("loadBalancers") or []
+            if lb.get("targetGroupArn")
+        ]
+        if not target_groups or not service.get("runningCount"):
+            return []
+        try:
+            task_arns = self._call(
+                "ecs",
+                "list_tasks",
+                cluster=self._ecs_cluster,
+                serviceName=self._ecs_service).get("taskArns")
+            if not task_arns:
+                return []
+            tasks = self._call(
+                "ecs",
+                "describe_tasks",
+                cluster=self._ecs_cluster,
+                tasks=task_arns)["tasks"]
+            task_ips = ecs_rollout.task_ips(tasks)
+            targets = []
+            for target_group in target_groups:
+                res = self._call(
+                    "elbv2",
+                    "describe_target_health",
+                    TargetGroupArn=target_group)
+                for description in res["TargetHealthDescriptions"]:
+                    ip = description["Target"]["Id"]
+                    health = description["TargetHealth"]
+                    targets.append(
+                        ecs_rollout.TargetHealth(
+                            task_ips.get(ip, ip), health["State"],
+                            health.get("Reason")))
+            return targets
+        except (subprocess.CalledProcessError, KeyError):
+            return []
 
     def _get_url_of_ecs_service(self) -> str:
         return f"https://{self.config.aws_region}.console.aws.amazon.com/ecs/v2/clusters/{self._ecs_cluster}/services/{self._ecs_service}/deployments"
 
     def get_load_balancer_dns(self, name: str) -> str:
-        res = self._call_cli(f"elbv2 describe-load-balancers --names={name}")
+        res = self._call("elbv2", "describe_load_balancers", Names=[name])
         load_balancer = res["LoadBalancers"][0]
         return load_balancer["DNSName"]
 
@@ -229,8 +391,7 @@ class AwsCli:
     RESOURCE_NOT_FOUND_CODE = 254
 
     def s3_bucket_encryption(self, bucket_name: str) -> bool:
-        result = self._call_cli(
-            f's3api get-bucket-encryption --bucket "{bucket_name}"')
+        result = self._call("s3", "get_bucket_encryption", Bucket=bucket_name)
         try:
             key_arn = result['ServerSideEncryptionConfiguration']['Rules'][0][
                 'ApplyServerSideEncryptionByDefault']['KMSMasterKeyID']
@@ -258,19 +419,65 @@ class AwsCli:
             )
             raise
 
+    def get_s3_object(self, bucket_name: str, key: str) -> Optional[bytes]:
+        """Returns the content of the object, or None if it does not exist."""
+        if aws_clients.enabled():
+            try:
+                res = self._call(
+                    "s3", "get_object", Bucket=bucket_name, Key=key)
+            except subprocess.CalledProcessError as e:
+                if e.returncode == self.RESOURCE_NOT_FOUND_CODE:
+                    return None
+                raise
+            return res["Body"].read()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "object")
+            try:
+                self._call_cli(
+                    f's3api get-object --bucket "{bucket_name}" --key "{key}" "{path}"'
+                )
+            except subprocess.CalledProcessError as e:
+                if e.returncode == self.RESOURCE_NOT_FOUND_CODE:
+                    return None
+                raise
+            with open(path, "rb") as f:
+                return f.read()
+
+    def put_s3_object(self, bucket_name: str, key: str, body: bytes):
+        if aws_clients.enabled():
+            self._call(
+                "s3", "put_object", Bucket=bucket_name, Key=key, Body=body)
+            return
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "object")
+            with open(path, "wb") as f:
+                f.write(body)
+            self._call_cli(
+                f's3api put-object --bucket "{bucket_name}" --key "{key}" --body "{path}"'
+            )
+
+    def delete_s3_object(self, bucket_name: str, key: str):
+        """Deletes the object. Deleting an object that does not exist
+        succeeds."""
+        self._call('s3', 'delete_object', Bucket=bucket_name, Key=key)
+
     def resource_exists(self, resource_type: str, resource_name: str) -> bool:
         if resource_type == 'bucket':
-            cmd = f's3api head-bucket --bucket "{resource_name}"'
+            service, operation, params = 's3', 'head_bucket', {
+                'Bucket': resource_name
+            }
             type_display_name = 'S3 bucket'
         elif resource_type == 'table':
-            cmd = f'dynamodb describe-table --table-name "{resource_name}"'
+            service, operation, params = 'dynamodb', 'describe_table', {
+                'TableName': resource_name
+            }
             type_display_name = 'DynamoDB table'
         else:
             raise ValueError(
                 f'{resource_type} is not a type recognized by the resource_exists function'
             )
         try:
-            self._call_cli(cmd, False)
+            self._call(service, operation, **params)
             return True
         except subprocess.CalledProcessError as e:
             if e.returncode == self.RESOURCE_NOT_FOUND_CODE:
@@ -285,22 +492,23 @@ class AwsCli:
         try:
             # Because we enable versioning, we have to delete all versions of
             # all objects, along with their delete markers.
-            file_data = self._call_cli(
-                f's3api list-object-versions --bucket {bucket_name} --output json --query "{{Objects: Versions[].{{Key:Key,VersionId:VersionId}}}}"'
-            )
-            if file_data['Objects']:
-                file_data = str(file_data).replace('\'', '\\"')
-                self._call_cli(
-                    f's3api delete-objects --bucket {bucket_name} --delete "{file_data}"'
-                )
-            delete_markers = self._call_cli(
-                f's3api list-object-versions --bucket {bucket_name} --output json --query "{{Objects: DeleteMarkers[].{{Key:Key,VersionId:VersionId}}}}"'
-            )
-            if delete_markers['Objects']:
-                delete_markers = str(delete_markers).replace('\'', '\\"')
-                self._call_cli(
-                    f's3api delete-objects --bucket {bucket_name} --delete "{delete_markers}"'
-                )
+            res = self._call(
+                's3', 'list_object_versions', paginate=True, Bucket=bucket_name)
+            versions = res.get('Versions') or []
+            markers = res.get('DeleteMarkers') or []
+            objects = [
+                {
+                    'Key': version['Key'],
+                    'VersionId': version['VersionId']
+                } for version in versions + markers
+            ]
+            # delete-objects takes up to 1000 objects per call.
+            for i in range(0, len(objects), 1000):
+                self._call(
+                    's3',
+                    'delete_objects',
+                    Bucket=bucket_name,
+                    Delete={'Objects': objects[i:i + 1000]})
             return True
         except subprocess.CalledProcessError as e:
             print(
@@ -310,11 +518,10 @@ class AwsCli:
 
     def delete_bucket_encryption_key(self, key_id: str):
         try:
-            info = self._call_cli(f'kms describe-key --key-id {key_id}')
+            info = self._call('kms', 'describe_key', KeyId=key_id)
             if info['KeyMetadata']['KeyState'] == 'PendingDeletion':
                 return True
-            self._call_cli(
-                f'kms schedule-key-deletion --key-id {key_id}', False)
+            self._call('kms', 'schedule_key_deletion', KeyId=key_id)
             return True
         except subprocess.CalledProcessError as e:
             if e.returncode == self.RESOURCE_NOT_FOUND_CODE:
@@ -328,8 +535,7 @@ class AwsCli:
 
     def delete_bucket_policy(self, bucket_name: str) -> bool:
         try:
-            self._call_cli(
-                f's3api delete-bucket-policy --bucket "{bucket_name}"', False)
+            self._call('s3', 'delete_bucket_policy', Bucket=bucket_name)
             return True
         except subprocess.CalledProcessError as e:
             print(f'Error deleting S3 bucket policy: {e.stdout.decode()}')
@@ -337,8 +543,7 @@ class AwsCli:
 
     def delete_bucket(self, bucket_name: str) -> bool:
         try:
-            self._call_cli(
-                f's3api delete-bucket --bucket "{bucket_name}"', False)
+            self._call('s3', 'delete_bucket', Bucket=bucket_name)
             return True
         except subprocess.CalledProcessError as e:
             if e.returncode == self.RESOURCE_NOT_FOUND_CODE:
@@ -350,8 +555,7 @@ class AwsCli:
 
     def delete_table(self, table_name: str) -> bool:
         try:
-            self._call_cli(
-                f'dynamodb delete-table --table-name "{table_name}"', False)
+            self._call('dynamodb', 'delete_table', TableName=table_name)
             return True
         except subprocess.CalledProcessError as e:
             if e.returncode == self.RESOURCE_NOT_FOUND_CODE:
@@ -363,10 +567,9 @@ class AwsCli:
 
     def get_postgresql_version(self, db_name: str) -> str:
         try:
-            res = self._call_cli(
-                f"rds describe-db-instances --db-instance-identifier={db_name} --query 'DBInstances[0].{{EngineVersion:EngineVersion}}'"
-            )
-            ver_str = res["EngineVersion"]
+            res = self._call(
+                "rds", "describe_db_instances", DBInstanceIdentifier=db_name)
+            ver_str = res["DBInstances"][0]["EngineVersion"]
             maj, min = re.match(r'^(\d+)\.?(\d+)?', ver_str).groups()
             maj = int(maj)
             min = int(min) if min else 0
@@ -375,28 +578,70 @@ class AwsCli:
             print(f'Error getting Postgres version: {e.stdout.decode()}')
             return -1
 
-    def get_dbaccess_ec2_host_ip(self) -> str:
-        return self._call_cli(
-            "ec2 describe-instances --filters 'Name=tag:Module,Values=dbaccess' 'Name=instance-state-name,Values=running' --query 'Reservations[0].Instances[0].PublicIpAddress'"
-        )
+    def get_dbaccess_ec2_host_ip(self) -> Optional[str]:
+        res = self._call(
+            "ec2",
+            "describe_instances",
+            Filters=[
+                {
+                    "Name": "tag:Module",
+                    "Values": ["dbaccess"]
+                }, {
+                    "Name": "instance-state-name",
+                    "Values": ["running"]
+                }
+            ])
+        reservations = res.get("Reservations") or []
+        if not reservations or not reservations[0]["Instances"]:
+            return None
+        return reservations[0]["Instances"][0].get("PublicIpAddress")
 
     def get_database_hostname(self) -> str:
-        return self._call_cli(
-            f"rds describe-db-instances --db-instance-identifier={self.config.app_prefix}-civiform-db --query 'DBInstances[0].Endpoint.Address'"
-        )
+        res = self._call(
+            "rds",
+            "describe_db_instances",
+            DBInstanceIdentifier=f"{self.config.app_prefix}-civiform-db")
+        return res["DBInstances"][0]["Endpoint"]["Address"]
 
     def get_application_secret_length(self) -> int:
         secret = self.get_secret_value(
             f"{self.config.app_prefix}-civiform_app_secret_key")
         return len(secret)
 
+    def _call(
+            self,
+            service: str,
+            operation: str,
+            paginate: bool = False,
+            **params) -> Dict:
+        """Calls the API operation, e.g. ("secretsmanager",
+        "get_secret_value"), with the in-process client if possible, or else
+        with the AWS CLI. Either way, errors raise CalledProcessError."""
+        if aws_clients.enabled():
+            return aws_clients.call(
+                service,
+                self.config.aws_region,
+                operation,
+                paginate=paginate,
+                **params)
+        # --cli-input-json takes the parameters as the API names them, and
+        # the CLI fetches all pages by default.
+        args = list(aws_clients.cli_command(service, operation))
+        if params:
+            args += ["--cli-input-json", json.dumps(params)]
+        return self._run_cli(args) or {}
+
     def _call_cli(self, command: str, output: bool = True) -> Dict:
-        base = f"aws --region={self.config.aws_region} "
+        return self._run_cli(shlex.split(command), output)
+
+    def _run_cli(self, args: List[str], output: bool = True) -> Dict:
+        base = ["aws", f"--region={self.config.aws_region}"]
         if output:
-            base += "--output=json "
-        command = base + command
-        out = subprocess.check_output(
-            shlex.split(command), stderr=subprocess.STDOUT)
+            base.append("--output=json")
+        out = subprocess.check_output(base + args, stderr=subprocess.STDOUT)
         if output:
-            return json.loads(out.decode("ascii"))
+            # Some commands, e.g. dynamodb get-item for a missing item, print
+            # nothing.
+            text = out.decode("utf-8").strip()
+            return json.loads(text) if text else None
         return
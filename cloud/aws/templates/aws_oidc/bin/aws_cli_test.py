@@ -0,0 +1,140 @@
+import subprocess
+import unittest
+from unittest.mock import patch
+
+from cloud.aws.templates.aws_oidc.bin.aws_cli import AwsCli
+from cloud.shared.bin.lib.config_loader import ConfigLoader
+"""
+Tests for aws_cli.py.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/aws/templates/aws_oidc/bin/aws_cli_test.py
+"""
+
+
+class TestGetSecretValues(unittest.TestCase):
+
+    def setUp(self):
+        config = ConfigLoader()
+        config._config_fields = {"APP_PREFIX": "test"}
+        self.aws = AwsCli(config)
+        self.secrets = {f"test-secret-{i}": f"value-{i}" for i in range(25)}
+
+    def _batch_get_secret_value(self, SecretIdList, NextToken=None):
+        # Returns the secrets two per page, and an error for secret 3.
+        start = int(NextToken or 0)
+        page = SecretIdList[start:start + 2]
+        values = [
+            {
+                "Name": name,
+                "SecretString": self.secrets[name]
+            } for name in page if name != "test-secret-3"
+        ]
+        errors = [
+            {
+                "SecretId": name,
+                "ErrorCode": "AccessDeniedException"
+            } for name in page if name == "test-secret-3"
+        ]
+        res = {"SecretValues": values, "Errors": errors}
+        if start + 2 < len(SecretIdList):
+            res["NextToken"] = str(start + 2)
+        return res
+
+    @patch.object(AwsCli, "get_secret_value")
+    @patch.object(AwsCli, "_call")
+    def test_batches_and_pages(self, mock_call, mock_get_secret_value):
+        mock_call.side_effect = lambda service, operation, **params: (
+            self._batch_get_secret_value(**params))
+        mock_get_secret_value.side_effect = self.secrets.get
+
+        values = self.aws.get_secret_values(self.secrets)
+
+        self.assertEqual(values, self.secrets)
+        batches = [call.kwargs["SecretIdList"] for call in mock_call.mock_calls]
+        self.assertEqual(len(batches[0]), AwsCli.MAX_BATCH_SECRETS)
+        self.assertEqual(len(batches[-1]), 5)
+        # Only the secret the batch call couldn't read is fetched alone.
+        mock_get_secret_value.assert_called_once_with("test-secret-3")
+
+    @patch.object(AwsCli, "get_secret_value")
+    @patch.object(AwsCli, "_call")
+    def test_falls_back_to_single_fetches(
+            self, mock_call, mock_get_secret_value):
+        mock_call.side_effect = subprocess.CalledProcessError(
+            252, "aws secretsmanager batch-get-secret-value")
+        mock_get_secret_value.side_effect = self.secrets.get
+
+        self.assertEqual(self.aws.get_secret_values(self.secrets), self.secrets)
+        self.assertEqual(mock_call.call_count, 1)
+        self.assertEqual(mock_get_secret_value.call_count, 25)
+
+    @patch.object(AwsCli, "get_secret_value")
+    @patch.object(AwsCli, "_call")
+    def test_missing_secret_raises(self, mock_call, mock_get_secret_value):
+        mock_call.return_value = {"SecretValues": []}
+        mock_get_secret_value.side_effect = subprocess.CalledProcessError(
+            254, "aws secretsmanager get-secret-value")
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.aws.get_secret_values(["test-missing"])
+
+
+class TestWaitForEcsServiceHealthy(unittest.TestCase):
+
+    def setUp(self):
+        config = ConfigLoader()
+        config._config_fields = {"APP_PREFIX": "test"}
+        self.aws = AwsCli(config)
+        for name, value in [("_get_url_of_ecs_service", "https://console"),
+                            ("_ecs_target_health", [])]:
+            patcher = patch.object(AwsCli, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _service(self, id, state, events):
+        deployment = {
+            "id": id,
+            "status": "PRIMARY",
+            "rolloutState": state,
+            "runningCount": 1,
+            "pendingCount": 0,
+            "desiredCount": 1
+        }
+        return {
+            "deployments": [deployment],
+            "events": [{
+                "id": event,
+                "message": event
+            } for event in events]
+        }
+
+    @patch("cloud.aws.templates.aws_oidc.bin.aws_cli.time.sleep")
+    @patch.object(AwsCli, "_describe_ecs_service")
+    def test_returns_when_completed(self, mock_describe, mock_sleep):
+        mock_describe.side_effect = [
+            self._service("ecs-svc/1", "IN_PROGRESS", ["old"]),
+            self._service("ecs-svc/1", "IN_PROGRESS", ["new", "old"]),
+            self._service("ecs-svc/1", "COMPLETED", ["new", "old"]),
+        ]
+
+        self.aws.wait_for_ecs_service_healthy()
+
+        self.assertEqual(mock_describe.call_count, 3)
+        intervals = [call.args[0] for call in mock_sleep.mock_calls]
+        self.assertEqual(len(intervals), 2)
+        self.assertLess(intervals[0], intervals[1])
+
+    @patch("cloud.aws.templates.aws_oidc.bin.aws_cli.time.sleep")
+    @patch.object(AwsCli, "_describe_ecs_service")
+    def test_raises_when_rolled_back(self, mock_describe, mock_sleep):
+        mock_describe.side_effect = [
+            self._service("ecs-svc/2", "IN_PROGRESS", []),
+            self._service("ecs-svc/1", "COMPLETED", []),
+        ]
+
+        with self.assertRaisesRegex(Exception, "different ID"):
+            self.aws.wait_for_ecs_service_healthy()
+
+
+if __name__ == "__main__":
+    unittest.main()
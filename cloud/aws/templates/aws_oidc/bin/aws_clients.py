@@ -0,0 +1,103 @@
+"""
+In-process AWS API clients, used by AwsCli instead of running the aws CLI.
+
+Running the CLI costs about a second of interpreter startup and credential
+loading per call. With boto3, one session is created per region and one
+client per service, lazily, and reused for the whole command, which also
+keeps the HTTPS connections alive between calls.
+
+boto3 is optional. Without it, or with CIVIFORM_AWS_BACKEND=cli, AwsCli runs
+the aws CLI as before. Both read credentials the same way, from the
+environment and ~/.aws.
+
+Errors are raised as subprocess.CalledProcessError with the exit code the
+CLI uses for service errors, 254, so callers handle both backends the same
+way.
+"""
+
+import os
+import subprocess
+import threading
+from typing import Dict, Tuple
+
+try:
+    import boto3
+    from botocore.exceptions import BotoCoreError, ClientError
+except ImportError:
+    boto3 = None
+
+BACKEND_ENV_VAR = 'CIVIFORM_AWS_BACKEND'
+
+# The exit code of the aws CLI when the service returned an error.
+SERVICE_ERROR_CODE = 254
+# The exit code of the aws CLI for other errors, e.g. missing credentials.
+CLIENT_ERROR_CODE = 255
+
+# CLI commands of the services whose name differs from the API.
+_CLI_SERVICES = {'s3': 's3api'}
+
+_lock = threading.Lock()
+_sessions: Dict[str, "boto3.session.Session"] = {}
+_clients: Dict[Tuple[str, str], object] = {}
+
+
+def enabled() -> bool:
+    """Whether calls are made in process rather than with the aws CLI."""
+    return boto3 is not None and os.getenv(BACKEND_ENV_VAR, '').lower() != 'cli'
+
+
+def client(service: str, region: str):
+    """Returns the client for the service in the region, creating it on
+    first use. Clients are thread safe, sessions aren't, hence the lock."""
+    with _lock:
+        key = (service, region)
+        if key not in _clients:
+            if region not in _sessions:
+                _sessions[region] = boto3.session.Session(region_name=region)
+            _clients[key] = _sessions[region].client(service)
+        return _clients[key]
+
+
+def call(
+        service: str,
+        region: str,
+        operation: str,
+        paginate: bool = False,
+        **params) -> Dict:
+    """Calls the operation, e.g. "get_secret_value", with the API parameters.
+
+    With paginate=True, all the pages are fetched and merged, like the CLI
+    does."""
+    try:
+        api = client(service, region)
+        if paginate:
+            return api.get_paginator(operation).paginate(
+                **params).build_full_result()
+        return getattr(api, operation)(**params)
+    except ClientError as e:
+        raise _called_process_error(
+            SERVICE_ERROR_CODE, service, operation, e) from e
+    except BotoCoreError as e:
+        raise _called_process_error(
+            CLIENT_ERROR_CODE, service, operation, e) from e
+
+
+def cli_command(service: str, operation: str) -> Tuple[str, str]:
+    """Returns the CLI service and command of the operation, e.g. ("s3api",
+    "get-object") for ("s3", "get_object")."""
+    return _CLI_SERVICES.get(service, service), operation.replace('_', '-')
+
+
+def reset():
+    """Forgets the clients, e.g. after the credentials changed."""
+    with _lock:
+        _sessions.clear()
+        _clients.clear()
+
+
+def _called_process_error(
+        returncode: int, service: str, operation: str,
+        error: Exception) -> subprocess.CalledProcessError:
+    cmd = ' '.join(('aws',) + cli_command(service, operation))
+    return subprocess.CalledProcessError(
+        returncode, cmd, output=f'{error}\n'.encode('utf-8'))
@@ -0,0 +1,194 @@
+import json
+import os
+import subprocess
+import unittest
+from unittest.mock import MagicMock, call, patch
+
+from cloud.aws.templates.aws_oidc.bin import aws_clients
+from cloud.aws.templates.aws_oidc.bin.aws_cli import AwsCli
+from cloud.shared.bin.lib.config_loader import ConfigLoader
+"""
+Tests for aws_clients.py and the AwsCli backends.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/aws/templates/aws_oidc/bin/aws_clients_test.py
+"""
+
+CLI_BASE = ["aws", "--region=us-west-2", "--output=json"]
+
+
+def _cli_call(*args):
+    return call(list(args), stderr=subprocess.STDOUT)
+
+
+def _aws_cli():
+    config = ConfigLoader()
+    config._config_fields = {"APP_PREFIX": "test", "AWS_REGION": "us-west-2"}
+    return AwsCli(config)
+
+
+class TestAwsClients(unittest.TestCase):
+
+    def setUp(self):
+        aws_clients.reset()
+        self.addCleanup(aws_clients.reset)
+
+    def test_disabled_without_boto3_or_by_env_var(self):
+        with patch.object(aws_clients, "boto3", None):
+            self.assertFalse(aws_clients.enabled())
+        with patch.object(aws_clients, "boto3", MagicMock()), patch.dict(
+                os.environ, {aws_clients.BACKEND_ENV_VAR: "cli"}):
+            self.assertFalse(aws_clients.enabled())
+
+    def test_clients_are_created_once(self):
+        boto3 = MagicMock()
+        with patch.object(aws_clients, "boto3", boto3):
+            first = aws_clients.client("s3", "us-west-2")
+            second = aws_clients.client("s3", "us-west-2")
+            aws_clients.client("ecs", "us-west-2")
+
+        self.assertIs(first, second)
+        boto3.session.Session.assert_called_once_with(region_name="us-west-2")
+        self.assertEqual(
+            boto3.session.Session.return_value.client.call_count, 2)
+
+    def test_cli_command(self):
+        self.assertEqual(
+            aws_clients.cli_command("s3", "get_bucket_encryption"),
+            ("s3api", "get-bucket-encryption"))
+        self.assertEqual(
+            aws_clients.cli_command("secretsmanager", "get_secret_value"),
+            ("secretsmanager", "get-secret-value"))
+
+
+class TestAwsCliBackends(unittest.TestCase):
+
+    def setUp(self):
+        aws_clients.reset()
+        self.addCleanup(aws_clients.reset)
+
+    @patch("cloud.aws.templates.aws_oidc.bin.aws_cli.subprocess.check_output")
+    def test_cli_fallback(self, mock_check_output):
+        mock_check_output.return_value = b'{"SecretString": "s\xc3\xa9cret"}'
+
+        with patch.object(aws_clients, "boto3", None):
+            value = _aws_cli().get_secret_value("test-secret")
+
+        self.assertEqual(value, "sécret")
+        args = mock_check_output.call_args[0][0]
+        self.assertEqual(
+            args[:5], [
+                "aws", "--region=us-west-2", "--output=json", "secretsmanager",
+                "get-secret-value"
+            ])
+        self.assertEqual(json.loads(args[6]), {"SecretId": "test-secret"})
+
+    @patch("cloud.aws.templates.aws_oidc.bin.aws_cli.subprocess.check_output")
+    def test_cli_fallback_for_missing_item(self, mock_check_output):
+        # get-item prints nothing when the item does not exist.
+        mock_check_output.return_value = b""
+
+        with patch.object(aws_clients, "boto3", None):
+            self.assertIsNone(_aws_cli().get_terraform_lock_info("dynamodb"))
+
+        lock_id = "test-civiform-backendstate/tfstate/terraform.tfstate"
+        params = {
+            "TableName": "test-civiform-locktable",
+            "ConsistentRead": True,
+            "Key": {
+                "LockID": {
+                    "S": lock_id
+                }
+            }
+        }
+        self.assertEqual(
+            mock_check_output.call_args_list, [
+                _cli_call(
+                    *CLI_BASE, "dynamodb", "get-item", "--cli-input-json",
+                    json.dumps(params))
+            ])
+
+    @patch("cloud.aws.templates.aws_oidc.bin.aws_cli.subprocess.check_output")
+    def test_cli_fallback_for_paginated_operation(self, mock_check_output):
+        # The CLI fetches all the pages and prints them merged.
+        versions = {
+            "Versions": [{
+                "Key": "tfstate",
+                "VersionId": "v2"
+            }],
+            "DeleteMarkers": [{
+                "Key": "tfstate",
+                "VersionId": "v1"
+            }]
+        }
+        mock_check_output.side_effect = [
+            json.dumps(versions).encode("utf-8"), b'{"Deleted": []}'
+        ]
+
+        with patch.object(aws_clients, "boto3", None):
+            self.assertTrue(_aws_cli().delete_bucket_files("test-bucket"))
+
+        objects = {"Objects": versions["Versions"] + versions["DeleteMarkers"]}
+        self.assertEqual(
+            mock_check_output.call_args_list, [
+                _cli_call(
+                    *CLI_BASE, "s3api", "list-object-versions",
+                    "--cli-input-json", '{"Bucket": "test-bucket"}'),
+                _cli_call(
+                    *CLI_BASE, "s3api", "delete-objects", "--cli-input-json",
+                    json.dumps({
+                        "Bucket": "test-bucket",
+                        "Delete": objects
+                    }))
+            ])
+
+    @patch("cloud.aws.templates.aws_oidc.bin.aws_cli.subprocess.check_output")
+    def test_cli_fallback_for_empty_bucket(self, mock_check_output):
+        mock_check_output.return_value = b"\n"
+
+        with patch.object(aws_clients, "boto3", None):
+            self.assertTrue(_aws_cli().delete_bucket_files("test-bucket"))
+
+        mock_check_output.assert_called_once()
+
+    @patch("cloud.aws.templates.aws_oidc.bin.aws_cli.subprocess.check_output")
+    def test_cli_fallback_errors(self, mock_check_output):
+        mock_check_output.side_effect = subprocess.CalledProcessError(
+            aws_clients.SERVICE_ERROR_CODE,
+            "aws dynamodb describe-table",
+            output=b"ResourceNotFoundException")
+
+        with patch.object(aws_clients, "boto3", None):
+            self.assertFalse(
+                _aws_cli().resource_exists("table", "test-civiform-locktable"))
+
+        self.assertEqual(
+            mock_check_output.call_args_list, [
+                _cli_call(
+                    *CLI_BASE, "dynamodb", "describe-table", "--cli-input-json",
+                    '{"TableName": "test-civiform-locktable"}')
+            ])
+
+    @patch.dict(os.environ, {aws_clients.BACKEND_ENV_VAR: ""})
+    def test_in_process(self):
+        boto3 = MagicMock()
+        api = boto3.session.Session.return_value.client.return_value
+        instance = {
+            "EngineVersion": "16.2",
+            "Endpoint": {
+                "Address": "db.example.com"
+            }
+        }
+        api.describe_db_instances.return_value = {"DBInstances": [instance]}
+
+        with patch.object(aws_clients, "boto3", boto3):
+            aws = _aws_cli()
+            self.assertEqual(aws.get_postgresql_version("test-db"), (16, 2))
+            self.assertEqual(aws.get_database_hostname(), "db.example.com")
+
+        api.describe_db_instances.assert_called_with(
+            DBInstanceIdentifier="test-civiform-db")
+        boto3.session.Session.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
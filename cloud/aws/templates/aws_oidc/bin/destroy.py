@@ -1,4 +1,5 @@
 #! /usr/bin/env python3
+from cloud.aws.bin import deploy
 from cloud.aws.templates.aws_oidc.bin import resources
 from cloud.aws.templates.aws_oidc.bin.aws_cli import AwsCli
 from cloud.aws.templates.aws_oidc.bin.aws_template import AwsSetupTemplate
@@ -11,13 +12,16 @@ class Destroy(AwsSetupTemplate):
     """
 
     def post_terraform_destroy(self):
+        aws_cli = AwsCli(self.config)
+        # Otherwise a deploy with the same inputs would skip recreating the
+        # resources.
+        deploy.clear_fingerprint(self.config, aws_cli)
         # when config is dev then the state is stored locally and no clean up
         # required
         if not self.config.use_local_backend:
             print(
                 'Not destroying S3 bucket that contains terraform state. ' +
                 'You have to destroy it manually:')
-            aws_cli = AwsCli(self.config)
             print(
                 aws_cli.get_url_of_s3_bucket(
                     f'{self.config.app_prefix}-{resources.S3_TERRAFORM_STATE_BUCKET}'
@@ -0,0 +1,120 @@
+"""
+Progress of an ECS service rollout, for AwsCli.wait_for_ecs_service_healthy.
+
+The service is polled every few seconds at first, since a rollout that only
+replaces a task definition can finish quickly, and then less often, up to
+every 30 seconds. Intervals have jitter so several deploys don't poll in
+lockstep. Each poll prints the service events that are new since the last
+one, e.g. "has started 1 tasks", and a status line with the task counts of
+the PRIMARY deployment and the load balancer health of each task, when it
+changed.
+"""
+
+import random
+from typing import Callable, Dict, List, Optional, Set
+
+INITIAL_INTERVAL_SECONDS = 5
+MAX_INTERVAL_SECONDS = 30
+BACKOFF_FACTOR = 1.5
+# Intervals vary by up to this fraction either way.
+JITTER = 0.2
+TIMEOUT_SECONDS = 30 * 60
+
+
+class Backoff:
+    """Intervals between polls that grow from initial to maximum."""
+
+    def __init__(
+            self,
+            initial: float = INITIAL_INTERVAL_SECONDS,
+            maximum: float = MAX_INTERVAL_SECONDS,
+            factor: float = BACKOFF_FACTOR,
+            jitter: float = JITTER,
+            rand: Callable[[], float] = random.random):
+        self._interval = initial
+        self._maximum = maximum
+        self._factor = factor
+        self._jitter = jitter
+        self._rand = rand
+
+    def next_interval(self) -> float:
+        interval = self._interval
+        self._interval = min(self._interval * self._factor, self._maximum)
+        return interval * (1 + self._jitter * (2 * self._rand() - 1))
+
+
+class TargetHealth:
+    """The load balancer health of a task of the service."""
+
+    def __init__(self, task: str, state: str, reason: Optional[str] = None):
+        self.task = task
+        self.state = state
+        self.reason = reason
+
+    def __str__(self):
+        reason = f' ({self.reason})' if self.reason else ''
+        return f'{self.task} {self.state}{reason}'
+
+
+class Rollout:
+    """What has been reported about a rollout across polls."""
+
+    def __init__(self):
+        self._seen_events: Optional[Set[str]] = None
+        self._last_status: Optional[str] = None
+
+    def new_events(self, service: Dict) -> List[str]:
+        """Returns the messages of the service events since the last poll,
+        oldest first. The events before the first poll are skipped, they
+        are from earlier rollouts."""
+        events = service.get('events') or []
+        if self._seen_events is None:
+            self._seen_events = {event['id'] for event in events}
+            return []
+        new = [
+            event for event in events if event['id'] not in self._seen_events
+        ]
+        self._seen_events.update(event['id'] for event in new)
+        # ECS lists the newest events first.
+        return [event['message'] for event in reversed(new)]
+
+    def status_change(self, deployment: Dict,
+                      targets: List[TargetHealth]) -> Optional[str]:
+        """Returns the status line, or None if it didn't change since the
+        last poll."""
+        status = format_status(deployment, targets)
+        if status == self._last_status:
+            return None
+        self._last_status = status
+        return status
+
+
+def primary_deployment(service: Dict) -> Optional[Dict]:
+    for deployment in service.get('deployments') or []:
+        if deployment['status'] == 'PRIMARY':
+            return deployment
+    return None
+
+
+def format_status(deployment: Dict, targets: List[TargetHealth]) -> str:
+    status = (
+        f'{deployment.get("rolloutState")}: '
+        f'{deployment.get("runningCount", 0)} running, '
+        f'{deployment.get("pendingCount", 0)} pending, '
+        f'{deployment.get("desiredCount", 0)} desired')
+    if targets:
+        status += '. Targets: ' + ', '.join(str(target) for target in targets)
+    return status
+
+
+def task_ips(tasks: List[Dict]) -> Dict[str, str]:
+    """Returns the short ID of each task, keyed by its private IP, which is
+    how the load balancer identifies the targets of Fargate tasks."""
+    ips = {}
+    for task in tasks:
+        task_id = task['taskArn'].rsplit('/', 1)[-1][:8]
+        for attachment in task.get('attachments') or []:
+            for detail in attachment.get('details') or []:
+                if detail.get('name') == 'privateIPv4Address':
+                    ips[detail['value']] = task_id
+    return ips
@@ -0,0 +1,88 @@
+import unittest
+
+from cloud.aws.templates.aws_oidc.bin import ecs_rollout
+"""
+Tests for ecs_rollout.py.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/aws/templates/aws_oidc/bin/ecs_rollout_test.py
+"""
+
+
+def _event(id, message):
+    return {"id": id, "message": message}
+
+
+class TestBackoff(unittest.TestCase):
+
+    def test_intervals_grow_to_the_maximum(self):
+        backoff = ecs_rollout.Backoff(rand=lambda: 0.5)
+
+        self.assertEqual(
+            [round(backoff.next_interval(), 2) for _ in range(7)],
+            [5, 7.5, 11.25, 16.88, 25.31, 30, 30])
+
+    def test_jitter(self):
+        low = ecs_rollout.Backoff(rand=lambda: 0)
+        high = ecs_rollout.Backoff(rand=lambda: 1)
+
+        self.assertEqual(low.next_interval(), 4)
+        self.assertEqual(high.next_interval(), 6)
+
+
+class TestRollout(unittest.TestCase):
+
+    def test_new_events_skip_earlier_rollouts(self):
+        rollout = ecs_rollout.Rollout()
+
+        self.assertEqual(
+            rollout.new_events({"events": [_event("1", "steady state")]}), [])
+        events = [
+            _event("3", "registered 1 targets"),
+            _event("2", "has started 1 tasks"),
+            _event("1", "steady state"),
+        ]
+        self.assertEqual(
+            rollout.new_events({"events": events}),
+            ["has started 1 tasks", "registered 1 targets"])
+        self.assertEqual(
+            rollout.new_events({"events": [_event("3", "registered")]}), [])
+
+    def test_status_is_only_reported_when_it_changes(self):
+        rollout = ecs_rollout.Rollout()
+        deployment = {
+            "rolloutState": "IN_PROGRESS",
+            "runningCount": 1,
+            "pendingCount": 1,
+            "desiredCount": 2
+        }
+        targets = [
+            ecs_rollout.TargetHealth("3f2a1b0c", "healthy"),
+            ecs_rollout.TargetHealth(
+                "9c8d7e6f", "initial", "Elb.RegistrationInProgress")
+        ]
+
+        self.assertEqual(
+            rollout.status_change(deployment, targets),
+            "IN_PROGRESS: 1 running, 1 pending, 2 desired. Targets: 3f2a1b0c healthy, 9c8d7e6f initial (Elb.RegistrationInProgress)"
+        )
+        self.assertIsNone(rollout.status_change(deployment, targets))
+
+    def test_task_ips(self):
+        details = [
+            {
+                "name": "subnetId",
+                "value": "subnet-1"
+            },
+            {
+                "name": "privateIPv4Address",
+                "value": "10.0.1.5"
+            },
+        ]
+        arn = "arn:aws:ecs:us-east-1:123:task/cluster/3f2a1b0c9d8e7f6a"
+        task = {"taskArn": arn, "attachments": [{"details": details}]}
+
+        self.assertEqual(ecs_rollout.task_ips([task]), {"10.0.1.5": "3f2a1b0c"})
+
+
+if __name__ == "__main__":
+    unittest.main()
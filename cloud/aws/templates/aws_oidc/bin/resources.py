@@ -22,6 +22,12 @@ POSTGRES_USERNAME = 'civiform_postgres_username'
 # Defined in cloud/aws/templates/aws_oidc/main.tf
 DATABASE = 'civiform-db'
 
+# Terraform addresses of the temporary modules in
+# cloud/aws/templates/aws_oidc/main.tf, for targeted applies. The rds security
+# group has an ingress rule for the dbaccess host.
+DBACCESS_TERRAFORM_TARGETS = ['module.dbaccess', 'aws_security_group.rds']
+PGADMIN_TERRAFORM_TARGETS = ['module.pgadmin']
+
 # Defined by fargate modules in cloud/aws/templates/aws_oidc/app.tf
 FARGATE_SERVICE = 'civiform-service'
 LOAD_BALANCER = 'civiform-lb'
@@ -30,3 +36,7 @@ CLUSTER = 'civiform'
 # Defined in cloud/aws/modules/setup/backend_storage.tf
 S3_TERRAFORM_STATE_BUCKET = 'civiform-backendstate'
 S3_TERRAFORM_LOCK_TABLE = 'civiform-locktable'
+
+# Key of the Terraform state in the state bucket, set in
+# cloud/aws/bin/lib/backend_setup.py
+S3_TERRAFORM_STATE_KEY = 'tfstate/terraform.tfstate'
@@ -2,6 +2,8 @@ import secrets
 from getpass import getpass
 from typing import Dict
 
+from cloud.aws.bin import deploy
+from cloud.aws.bin.lib import backend_setup
 from cloud.aws.templates.aws_oidc.bin.aws_cli import AwsCli
 from cloud.aws.templates.aws_oidc.bin import resources
 from cloud.aws.templates.aws_oidc.bin.aws_template import AwsSetupTemplate
@@ -85,7 +87,14 @@ class Setup(AwsSetupTemplate):
 
     def pre_terraform_setup(self):
         print(' - Running the setup script in terraform')
-        return self._tf_run_for_aws(is_destroy=False)
+        if not self._tf_run_for_aws(is_destroy=False):
+            return False
+        # The backend config was written before the lock table existed.
+        backend_setup.setup_backend_config(self.config)
+        # Records of an earlier deployment with this app prefix don't
+        # describe what the setup deploys.
+        deploy.clear_fingerprint(self.config, self._aws_cli)
+        return True
 
     def requires_post_terraform_setup(self):
         return True
@@ -95,9 +104,14 @@ class Setup(AwsSetupTemplate):
             print(" - Test. Skipping post terraform setup.")
             return
 
-        for name, doc in SECRETS.items():
-            self._maybe_set_secret_value(
-                f'{self.config.app_prefix}-{name}', doc)
+        # All the secrets are checked before the first prompt.
+        secret_names = {
+            f'{self.config.app_prefix}-{name}': doc
+            for name, doc in SECRETS.items()
+        }
+        values = self._aws_cli.get_secret_values(secret_names)
+        for secret_name, doc in secret_names.items():
+            self._maybe_set_secret_value(secret_name, doc, values[secret_name])
         if self.config.get_config_var('POSTGRES_RESTORE_SNAPSHOT_IDENTIFIER'):
             fetch = input(
                 "\nPOSTGRES_RESTORE_SNAPSHOT_IDENTIFIER was set. In order for the restored database to be useable, we need to find the username and password secrets stored with the app prefix where the database was originally snapshotted. If these secrets no longer exists in AWS and you say no here, you can enter the username and password manually. Fetch from previous app prefix? [Y/n] > "
@@ -106,10 +120,12 @@ class Setup(AwsSetupTemplate):
                 prefix = input(
                     'Enter the app prefix where the database was originally snapshotted. > '
                 ).strip()
-                username = self._aws_cli.get_secret_value(
-                    f'{prefix}-{resources.POSTGRES_USERNAME}')
-                password = self._aws_cli.get_secret_value(
-                    f'{prefix}-{resources.POSTGRES_PASSWORD}')
+                username_secret = f'{prefix}-{resources.POSTGRES_USERNAME}'
+                password_secret = f'{prefix}-{resources.POSTGRES_PASSWORD}'
+                values = self._aws_cli.get_secret_values(
+                    [username_secret, password_secret])
+                username = values[username_secret]
+                password = values[password_secret]
             else:
                 username = input(
                     "Enter the snapshotted database's username > ").strip()
@@ -123,7 +139,8 @@ class Setup(AwsSetupTemplate):
         self._aws_cli.wait_for_ecs_service_healthy()
         self._print_final_message()
 
-    def _maybe_set_secret_value(self, secret_name: str, documentation: str):
+    def _maybe_set_secret_value(
+            self, secret_name: str, documentation: str, value: str):
         """
         Some secrets like login integration credentials created empty in
         terraform. The values need to be provided by users. This method runs
@@ -133,7 +150,7 @@ class Setup(AwsSetupTemplate):
         """
         print('')
         url = self._aws_cli.get_url_of_secret(secret_name)
-        if self._aws_cli.is_secret_empty(secret_name):
+        if value.strip() == '':
             print(
                 f'Secret {secret_name} is not set. It needs to be set to a non-empty value.'
             )
@@ -1,3 +1,4 @@
+import argparse
 import subprocess
 import importlib
 import os
@@ -7,13 +8,22 @@ from cloud.shared.bin.lib.config_loader import ConfigLoader
 
 
 def run(config: ConfigLoader, params: List[str]):
+    parser = argparse.ArgumentParser(prog='deploy')
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help=
+        'Apply the whole template, even if nothing or only some of its layers changed since the last successful deploy.'
+    )
+    args = parser.parse_args(params)
+
     deploy_file_py = os.path.join(
         'cloud', config.get_cloud_provider(), 'bin', 'deploy.py')
     # TODO(#2741): remove the fork after Azure scripts are in python
     if os.path.exists(deploy_file_py):
         deploy_module = importlib.import_module(
             f'cloud.{config.get_cloud_provider()}.bin.deploy')
-        deploy_module.run(config)
+        deploy_module.run(config, force=args.force)
     else:
         subprocess.check_call(
             os.path.join('cloud', config.get_cloud_provider(), 'bin', 'deploy'))
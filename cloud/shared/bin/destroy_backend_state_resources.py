@@ -8,6 +8,10 @@ from typing import List
 from cloud.shared.bin.lib.config_loader import ConfigLoader
 from cloud.shared.bin.lib.setup_class_loader import get_config_specific_setup
 
+# The backend resources are found by name, so none of the config that
+# run.py prepares for Terraform is needed.
+REQUIREMENTS = frozenset()
+
 
 def run(config: ConfigLoader, params: List[str]):
     template = get_config_specific_setup(config)
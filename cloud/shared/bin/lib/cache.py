@@ -0,0 +1,39 @@
+"""
+Helpers for the local on-disk cache used by the deploy tool.
+
+Cached data lives under ~/.cache/civiform-deploy by default. Set
+CIVIFORM_DEPLOY_CACHE_DIR to use a different location, e.g. a directory that
+is shared between several checkouts on the same host.
+"""
+
+import os
+import tempfile
+
+
+def cache_dir(*subdirs: str) -> str:
+    """Returns the path of the given cache subdirectory. The directory is
+    created on the first write to it.
+    """
+    root = os.getenv("CIVIFORM_DEPLOY_CACHE_DIR")
+    if not root:
+        xdg_cache_home = os.getenv("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache")
+        root = os.path.join(xdg_cache_home, "civiform-deploy")
+    return os.path.join(root, *subdirs)
+
+
+def atomic_write(path: str, data: bytes):
+    """Writes data to path such that concurrent readers either see the old
+    file or the complete new file, never a partially written one.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,44 @@
+"""
+Declares what run.py needs to prepare before running a command.
+
+A command module can set a module level REQUIREMENTS to the subset of the
+constants below that it needs. Commands that do not declare REQUIREMENTS get
+everything, which is what run.py always did before.
+
+  SERVER_ENV_VAR_DOCS: download env-var-docs.json for the image tag and
+      validate the server variables in the config.
+  BACKEND: write the Terraform backend config for the template.
+  TFVARS: write the template's .tfvars file. Writing it needs the server
+      variables, so it implies SERVER_ENV_VAR_DOCS.
+
+Even without SERVER_ENV_VAR_DOCS, ConfigLoader loads the env-var-docs on
+first use, e.g. when a command writes the tfvars file itself.
+"""
+
+from types import ModuleType
+from typing import FrozenSet, Optional
+
+SERVER_ENV_VAR_DOCS = "server_env_var_docs"
+BACKEND = "backend"
+TFVARS = "tfvars"
+
+ALL: FrozenSet[str] = frozenset([SERVER_ENV_VAR_DOCS, BACKEND, TFVARS])
+
+# Running run.py without a command only validates the config.
+VALIDATE_ONLY: FrozenSet[str] = frozenset([SERVER_ENV_VAR_DOCS])
+
+
+def for_command(command_module: Optional[ModuleType]) -> FrozenSet[str]:
+    """Returns the requirements of the command module, or of validating the
+    config if there is no command."""
+    if command_module is None:
+        return VALIDATE_ONLY
+    requirements = frozenset(getattr(command_module, "REQUIREMENTS", ALL))
+    unknown = requirements - ALL
+    if unknown:
+        raise ValueError(
+            f"{command_module.__name__} declares unknown requirements {sorted(unknown)}"
+        )
+    if TFVARS in requirements:
+        requirements |= {SERVER_ENV_VAR_DOCS}
+    return requirements
@@ -0,0 +1,41 @@
+import types
+import unittest
+
+from cloud.shared.bin.lib import command_requirements
+"""
+Tests for command_requirements.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/shared/bin/lib/command_requirements_test.py
+"""
+
+
+class TestCommandRequirements(unittest.TestCase):
+
+    def test_no_command_only_validates(self):
+        self.assertEqual(
+            command_requirements.for_command(None),
+            {command_requirements.SERVER_ENV_VAR_DOCS})
+
+    def test_undeclared_requirements_default_to_all(self):
+        command = types.ModuleType("command")
+        self.assertEqual(
+            command_requirements.for_command(command), command_requirements.ALL)
+
+    def test_tfvars_implies_server_env_var_docs(self):
+        command = types.ModuleType("command")
+        command.REQUIREMENTS = {command_requirements.TFVARS}
+        self.assertEqual(
+            command_requirements.for_command(command), {
+                command_requirements.TFVARS,
+                command_requirements.SERVER_ENV_VAR_DOCS
+            })
+
+    def test_unknown_requirement(self):
+        command = types.ModuleType("command")
+        command.REQUIREMENTS = {"database"}
+        with self.assertRaises(ValueError):
+            command_requirements.for_command(command)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,8 @@
+import contextlib
 import importlib
 import inspect
 import io
 import os
-import requests
 import re
 import ssl
 import typing
@@ -13,10 +13,16 @@ from typing import Optional
 
 from cloud.shared.bin.lib.color import red, yellow
 from cloud.shared.bin.lib.config_parser import ConfigParser
+from cloud.shared.bin.lib import env_var_docs_index
+from cloud.shared.bin.lib.env_var_docs_cache import EnvVarDocsCache
+from cloud.shared.bin.lib.github_api import GitHubApi
+from cloud.shared.bin.lib import offline_bundle
 from cloud.shared.bin.lib.print import print
+from cloud.shared.bin.lib.resolved_tag import ResolvedTag, is_release_tag, is_snapshot_tag, normalize_tag
+from cloud.shared.bin.lib.tag_resolution_cache import TagResolutionCache, is_full_commit_sha
+from cloud.shared.bin.lib import terraform_variables
+from cloud.shared.bin.lib import validation_plan
 from cloud.shared.bin.lib.write_tfvars import TfVarWriter
-from cloud.shared.bin.lib.variable_definition_loader import \
-    load_variables_definitions
 
 CIVIFORM_SERVER_VARIABLES_KEY = "civiform_server_environment_variables"
 
@@ -37,10 +43,12 @@ class ConfigLoader:
         Each field may or may not be a known configuration option.
         """
 
-        self._civiform_server_env_var_docs = {}
+        self._civiform_server_env_var_docs: Optional[dict] = None
         """Environment variable configuration options that the CiviForm server
         reads from, as documented in
         https://github.com/civiform/civiform/blob/main/server/conf/env-var-docs.json.
+
+        None until loaded, see civiform_server_env_var_docs.
         """
 
         self._infra_variable_definitions = {}
@@ -56,17 +64,50 @@ class ConfigLoader:
         Remove them when other required changes are completed.
         """
 
+        self._infra_validation_plan: Optional[
+            validation_plan.ValidationPlan] = None
+        """Validation plan compiled from _infra_variable_definitions."""
+
+        self._edit_session: Optional[dict] = None
+        """While an edit_session is open, the values that the keys changed in
+        the session had before it, as (config value, env value) pairs.
+        """
+
+        self._github_api = GitHubApi()
+        self._tag_resolution_cache = TagResolutionCache()
+        self._resolved_tag: Optional[ResolvedTag] = None
+        """Result of resolving the image tag before run.py started, if any. See
+        cloud/shared/bin/resolve_tag.py.
+        """
+
     class VersionNotFoundError(Exception):
         pass
 
-    def load_config(self, config_file: str):
+    def load_config(
+            self, config_file: str, load_server_env_var_docs: bool = True):
+        """Loads and validates the config.
+
+        Downloading env-var-docs.json is the slow part of loading the config.
+        If load_server_env_var_docs is False, it is deferred until
+        civiform_server_env_var_docs is first used, and the server variables
+        are only validated if that happens before validate_config is called.
+        """
         self._config_fields = self._load_config_fields(config_file)
         self._infra_variable_definitions = self._load_infra_variables()
-        self._civiform_server_env_var_docs = self._load_civiform_server_env_vars(
-        )
+        if load_server_env_var_docs:
+            self._civiform_server_env_var_docs = self._load_civiform_server_env_vars(
+            )
 
         return self.validate_config()
 
+    @property
+    def civiform_server_env_var_docs(self) -> dict:
+        """The server variables, loaded on first use."""
+        if self._civiform_server_env_var_docs is None:
+            self._civiform_server_env_var_docs = self._load_civiform_server_env_vars(
+            )
+        return self._civiform_server_env_var_docs
+
     def _load_config_fields(self, config_file: str):
         """Returns a map containing key value pairs from all entries in the config file.
         """
@@ -98,9 +139,49 @@ class ConfigLoader:
         return config_fields
 
     def add_config_value(self, key: str, value: str):
+        """Sets a config value and writes the tfvars file, or defers the
+        write to the end of the current edit_session."""
+        if self._edit_session is not None and key not in self._edit_session:
+            self._edit_session[key] = (
+                self._config_fields.get(key), os.environ.get(key))
         self._config_fields[key] = value
         os.environ[key] = value
-        self.write_tfvars_file()
+        if self._edit_session is None:
+            self.write_tfvars_file()
+
+    @contextlib.contextmanager
+    def edit_session(self):
+        """Batches add_config_value calls made within the block so that the
+        tfvars file is written once, when the block exits.
+
+        If the block raises, the values set in it are rolled back and the
+        file is not written. Nested sessions join the outermost one.
+        """
+        if self._edit_session is not None:
+            yield
+            return
+
+        self._edit_session = {}
+        try:
+            yield
+        except BaseException:
+            for key, (config_value, env_value) in self._edit_session.items():
+                self._restore_value(self._config_fields, key, config_value)
+                self._restore_value(os.environ, key, env_value)
+            raise
+        else:
+            changed = bool(self._edit_session)
+        finally:
+            self._edit_session = None
+
+        if changed:
+            self.write_tfvars_file()
+
+    def _restore_value(self, values, key: str, value: Optional[str]):
+        if value is None:
+            values.pop(key, None)
+        else:
+            values[key] = value
 
     # TODO(https://github.com/civiform/civiform/issues/4293): remove this when
     # the local deploy system does not read values from env variables anymore.
@@ -117,19 +198,40 @@ class ConfigLoader:
         """Returns variable definitions in the shared and cloud-specific
         variable_definitions.json files.
         """
-        shared_vars = load_variables_definitions(
+        self._infra_validation_plan = validation_plan.load_plan(
             os.path.join(
-                os.getcwd(), "cloud", "shared", "variable_definitions.json"))
-        template_vars = load_variables_definitions(
+                os.getcwd(), "cloud", "shared", "variable_definitions.json"),
             os.path.join(self.get_template_dir(), "variable_definitions.json"))
-        return {**shared_vars, **template_vars}
+        return self._infra_validation_plan.definitions
 
-    def _load_civiform_server_env_vars(self) -> dict:
+    def _load_civiform_server_env_vars(
+            self, civiform_version: Optional[str] = None) -> dict:
         """Returns environment variables in
         https://github.com/civiform/civiform/tree/main/server/conf/env-var-docs.json.
-        _load_config_fields() MUST be called before calling this function.
+        _load_config_fields() MUST be called before calling this function,
+        unless civiform_version is given.
+
+        The variables are returned as an index of IndexedVariables, see
+        env_var_docs_index.py. The index is built once per commit and cached
+        next to the env-var-docs.json file. A cached index is used even when
+        the env_var_docs package is not installed.
         """
 
+        if civiform_version is None:
+            civiform_version = os.environ['TF_VAR_image_tag']
+        try:
+            commit_sha = self._get_commit_sha_for_tag(civiform_version)
+        except:
+            commit_sha = None
+
+        env_var_docs_cache = EnvVarDocsCache()
+        cache_index = commit_sha and is_full_commit_sha(commit_sha)
+        if cache_index:
+            index = env_var_docs_cache.get_index(commit_sha)
+            if index is not None:
+                print(f"Using cached env-var-docs index for {commit_sha}")
+                return index
+
         try:
             env_var_docs_parser = importlib.import_module("env_var_docs.parser")
         except ModuleNotFoundError:
@@ -140,8 +242,7 @@ class ConfigLoader:
 
         # Download the env-var-docs.json if there is a version that corresponds to the
         # civiform version of this deployment.
-        env_var_docs = self._download_env_var_docs(
-            os.environ['TF_VAR_image_tag'])
+        env_var_docs = self._download_env_var_docs(civiform_version)
         if env_var_docs is None:
             return {}
 
@@ -157,17 +258,41 @@ class ConfigLoader:
             # is valid before allowing changes to be committed.
             raise RuntimeError(
                 f"the downloaded env-var-docs file is not valid: {errors}")
-        return out
+
+        index = env_var_docs_index.build_index(out)
+        if cache_index:
+            try:
+                env_var_docs_cache.put_index(commit_sha, index)
+            except OSError as e:
+                print(f"Could not cache env-var-docs index: {e}")
+        return index
 
     def _download_env_var_docs(self, civiform_version: str):
         """ 
         Downloads the env-var-docs.json from the civiform git repository if there is a version that corresponds to the
         civiform version of this deployment. The env-var-docs.json defines all server variables. 
+
+        The file for a given commit never changes, so downloads are kept in a
+        local cache and reused by later runs that deploy the same version.
         """
         try:
             commit_sha = self._get_commit_sha_for_tag(civiform_version)
         except:
             return None
+
+        offline_bundle.ensure_imported()
+        env_var_docs_cache = EnvVarDocsCache()
+        if commit_sha:
+            cached_text = env_var_docs_cache.get(commit_sha)
+            if cached_text is not None:
+                print(f"Using cached env-var-docs.json for {commit_sha}")
+                return io.StringIO(cached_text)
+
+        if offline_bundle.is_offline():
+            exit(
+                f"env-var-docs.json for {civiform_version} ({commit_sha}) is not in the offline bundle {offline_bundle.bundle_path()}. Export a bundle that includes {civiform_version}."
+            )
+
         url = f"https://raw.githubusercontent.com/civiform/civiform/{commit_sha}/server/conf/env-var-docs.json"
 
         try:
@@ -178,6 +303,11 @@ class ConfigLoader:
         env_var_docs_text = env_var_docs_bytes.decode("utf-8")
         env_var_docs = io.StringIO(env_var_docs_text)
         print("Downloaded env-var-docs.json")
+        if commit_sha:
+            try:
+                env_var_docs_cache.put(commit_sha, env_var_docs_text)
+            except (OSError, ValueError) as e:
+                print(f"Could not cache env-var-docs.json: {e}")
         return env_var_docs
 
     # TODO(https://github.com/civiform/civiform/issues/4293): add validations
@@ -188,9 +318,10 @@ class ConfigLoader:
         errors.extend(
             self._validate_infra_variables(
                 self._infra_variable_definitions, self._config_fields))
-        errors.extend(
-            self._validate_civiform_server_env_vars(
-                self._civiform_server_env_var_docs, self._config_fields))
+        if self._civiform_server_env_var_docs is not None:
+            errors.extend(
+                self._validate_civiform_server_env_vars(
+                    self._civiform_server_env_var_docs, self._config_fields))
         return errors
 
     def _validate_infra_variables(
@@ -200,45 +331,43 @@ class ConfigLoader:
         Returns any validation errors for fields in config_fields that have
         definitions in infra_variable_definitions.
         """
-        validation_errors = []
+        plan = self._infra_validation_plan
+        if plan is None or plan.definitions is not infra_variable_definitions:
+            plan = validation_plan.ValidationPlan(infra_variable_definitions)
+        return plan.validate(config_fields)
 
-        for name, definition in infra_variable_definitions.items():
-            config_value = config_fields.get(name)
+    @property
+    def resolved_tag(self) -> Optional[ResolvedTag]:
+        return self._resolved_tag
 
-            if config_value is None:
-                is_required = definition.get("required", False)
-                if is_required:
-                    validation_errors.append(
-                        f"'{name}' is required but not set")
-                continue
+    def set_resolved_tag(self, resolved_tag: ResolvedTag):
+        self._resolved_tag = resolved_tag
 
-            if definition.get("type") == "enum":
-                enum_values = definition.get("values")
-                if config_value not in enum_values:
-                    validation_errors.append(
-                        f"'{name}': '{config_value}' is not a valid enum value. Valid values are {enum_values}"
-                    )
-                    continue
+    def resolve_tag(
+            self, tag: str, image_digest: Optional[str] = None) -> ResolvedTag:
+        """Validates the tag and resolves it to the commit it was built from.
 
-            value_regex = definition.get("value_regex", None)
-            if value_regex:
-                # TODO(#2887): If we validate variable definitions prior to
-                # trying to validate an actual configuration, we can assume that
-                # this will always be set if value_regex is provided.
-                # There is currently a presumbit check (validate_variable_definitions)
-                # but no code that does the check at runtime to catch isses
-                # during development.
-                validation_error_message = definition.get(
-                    "value_regex_error_message", None)
-                if not validation_error_message:
-                    raise ValueError(
-                        f"'{name}': no value_regex_error_message configured")
-                if not re.compile(value_regex).fullmatch(config_value):
-                    validation_errors.append(
-                        f"'{name}': '{config_value}' not valid: {validation_error_message}"
-                    )
+        Raises VersionNotFoundError if the tag is malformed or does not
+        reference a CiviForm version.
+        """
+        tag = normalize_tag(tag.strip())
+        if not is_snapshot_tag(tag) and not is_release_tag(tag):
+            raise self.VersionNotFoundError(
+                f"Invalid value for CIVIFORM_VERSION provided: \"{tag}\"")
 
-        return validation_errors
+        commit_sha = self._get_commit_sha_for_tag(tag)
+        if not commit_sha:
+            raise self.VersionNotFoundError(
+                f"No matching CiviForm version found for \"{tag}\"")
+
+        short_sha = tag.split("-")[1] if is_snapshot_tag(
+            tag) else commit_sha[:7]
+        self._resolved_tag = ResolvedTag(
+            tag=tag,
+            short_sha=short_sha,
+            commit_sha=commit_sha,
+            image_digest=image_digest or None)
+        return self._resolved_tag
 
     def _get_commit_sha_for_tag(self, tag: str) -> Optional[str]:
         """Get the commit SHA for the release specified in the tag.
@@ -248,38 +377,64 @@ class ConfigLoader:
           the middle secion is the shortened sha for the commit the docker image was built
           from), or the string "latest".
 
-          We are calling the GitHub API with unauthenticated requests, which are rate-limited.
-          The rate limit allows for up to 60 requests per hour associated with the originating 
-          IP address.
+          Resolutions are cached on disk, see TagResolutionCache. When an offline bundle
+          is used, see offline_bundle.py, only tags in the bundle resolve. Requests to the GitHub API
+          are unauthenticated unless GITHUB_TOKEN is set, in which case they count against
+          the much higher per-user rate limit instead of the limit of 60 requests per hour
+          associated with the originating IP address.
         """
         tag = tag.strip()
+        if self._resolved_tag and self._resolved_tag.tag == tag:
+            return self._resolved_tag.commit_sha
+
+        offline_bundle.ensure_imported()
+        cached_sha = self._tag_resolution_cache.get(tag)
+        if cached_sha:
+            print(f"Using cached commit sha {cached_sha} for tag {tag}.")
+            return cached_sha
+
+        if offline_bundle.is_offline():
+            print(
+                red(
+                    f"Error: tag {tag} is not in the offline bundle {offline_bundle.bundle_path()}."
+                ))
+            return None
+
         print(f"Resolving commit sha for tag {tag}.")
 
         try:
             if "SNAPSHOT" in tag or "DEV" in tag:
                 short_sha = tag.split("-")[1]
-                return self._fetch_json_val(
+                commit_sha = self._fetch_json_val(
                     f"https://api.github.com/repos/civiform/civiform/commits/{short_sha}",
                     "sha")
             else:
                 tag_url = self._fetch_json_val(
                     f"https://api.github.com/repos/civiform/civiform/git/refs/tags/{tag}",
                     "object", "url")
-                return self._fetch_json_val(tag_url, "object", "sha")
+                commit_sha = self._fetch_json_val(tag_url, "object", "sha")
         except self.VersionNotFoundError as e:
             print(e)
             return None
 
+        if commit_sha is None:
+            print(red(f"Error: could not resolve a commit sha for tag {tag}."))
+        elif is_full_commit_sha(commit_sha):
+            self._tag_resolution_cache.put(tag, commit_sha)
+        return commit_sha
+
     def _fetch_json_val(self, url, field_one, field_two=None) -> Optional[str]:
         print(f"Fetching json from url {url}.")
-        response = requests.get(url)
+        status_code, json = self._github_api.get_json(url, [field_one])
 
-        if response.status_code == 200:
-            return self._apply_json_fields(
-                response.json(), field_one, field_two)
+        if status_code == 200:
+            return self._apply_json_fields(json, field_one, field_two)
         else:
+            message = json.get("message") if isinstance(json, dict) else json
+            if status_code in (403, 429) and not os.getenv("GITHUB_TOKEN"):
+                message = f"{message}. Set GITHUB_TOKEN to use a higher rate limit."
             raise self.VersionNotFoundError(
-                f"Error: could not resolve json at {url}. {response.status_code} - {response.json()['message']}"
+                f"Error: could not resolve json at {url}. {status_code} - {message}"
             )
 
     def _apply_json_fields(self, json, field_one, field_two) -> Optional[str]:
@@ -302,9 +457,11 @@ class ConfigLoader:
         definitions in env_var_docs.
         """
         validation_errors = []
+        index = env_var_docs_index.build_index(env_var_docs)
+        allow_admin_writeable = config_fields.get("ALLOW_ADMIN_WRITEABLE")
 
-        for name, variable in env_var_docs.items():
-            is_admin_writeable = variable.mode.name == "ADMIN_WRITEABLE"
+        for name, variable in index.items():
+            is_admin_writeable = variable.mode == "ADMIN_WRITEABLE"
 
             config_value = config_fields.get(name)
             if config_value is None:
@@ -316,9 +473,7 @@ class ConfigLoader:
                 continue
 
             # Throw an error if an admin writeable var is set in the deploy config
-            disallow_admin_writeable = is_admin_writeable and not config_fields.get(
-                "ALLOW_ADMIN_WRITEABLE")
-            if config_value is not None and disallow_admin_writeable:
+            if is_admin_writeable and not allow_admin_writeable:
                 validation_errors.append(
                     red(
                         f"'{name}' is editable via the admin settings panel and should not be set in the deploy config. Please remove it from your config file and try again. Set ALLOW_ADMIN_WRITEABLE=true in your config file to ignore this warning (use with caution)."
@@ -328,16 +483,16 @@ class ConfigLoader:
             # Validation for 'index-list' is not implemented at this time because
             # 'index-list' does not yet support subtyping.
             if variable.type == "string":
-                if variable.values is not None:
-                    if config_value not in variable.values:
+                if variable.allowed_values is not None:
+                    if config_value not in variable.allowed_values:
                         validation_errors.append(
                             red(
                                 f"'{name}': '{config_value}' is not a valid value. Valid values are {variable.values}"
                             ))
                         continue
 
-                if variable.regex is not None:
-                    if re.match(variable.regex, config_value) == None:
+                if variable.pattern is not None:
+                    if variable.pattern.match(config_value) is None:
                         validation_errors.append(
                             red(
                                 f"'{name}': '{config_value}' does not match validation regular expression '{variable.regex}'"
@@ -365,7 +520,7 @@ class ConfigLoader:
     def get_terraform_variables(self):
         return self._get_terraform_variables(
             self._config_fields, self._infra_variable_definitions,
-            self._civiform_server_env_var_docs)
+            self.civiform_server_env_var_docs)
 
     def _get_terraform_variables(
             self, config_fields: dict, infra_variable_definitions: dict,
@@ -411,6 +566,13 @@ class ConfigLoader:
     def aws_region(self):
         return self._config_fields.get("AWS_REGION", "us-east-1")
 
+    @property
+    def terraform_state_locking(self):
+        """How the AWS S3 backend locks the state: "dynamodb" with the lock
+        table, or "s3" with a lock file next to the state. See
+        cloud/aws/bin/migrate_state_locking.py."""
+        return self._config_fields.get("TERRAFORM_STATE_LOCKING", "dynamodb")
+
     @property
     def civiform_mode(self):
         return self._config_fields.get("CIVIFORM_MODE")
@@ -441,8 +603,31 @@ class ConfigLoader:
             exit(f"Could not find template directory {template_dir}")
         return template_dir
 
+    @property
+    def terraform_variables(self) -> terraform_variables.VariableIndex:
+        """The variables declared in the template, see terraform_variables.py.
+        The index is cached by file contents, so this is cheap to call."""
+        return terraform_variables.load_index(self.get_template_dir())
+
+    def get_undeclared_tfvars(self) -> List[str]:
+        """Returns the infra variables with "tfvar": true that are not declared
+        as variables in the template, so terraform ignores their values."""
+        declared = self.terraform_variables
+        return sorted(
+            name
+            for name, definition in self._infra_variable_definitions.items()
+            if definition.get("tfvar", False) and name.lower() not in declared)
+
     def write_tfvars_file(self):
         terraform_tfvars_path = os.path.join(
             self.get_template_dir(), self.tfvars_filename)
         tf_var_writer = TfVarWriter(terraform_tfvars_path)
-        tf_var_writer.write_variables(self.get_terraform_variables())
+        if not tf_var_writer.write_variables(self.get_terraform_variables()):
+            print(f"{terraform_tfvars_path} is up to date")
+            return
+        undeclared = self.get_undeclared_tfvars()
+        if undeclared:
+            print(
+                yellow(
+                    f"These variables are marked as tfvar but are not declared in {self.get_template_dir()}, so they have no effect: {', '.join(undeclared)}"
+                ))
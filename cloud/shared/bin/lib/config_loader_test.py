@@ -4,6 +4,7 @@ import io
 import os
 import subprocess
 import sys
+import tempfile
 import typing
 import unittest
 import requests
@@ -14,6 +15,9 @@ from urllib.request import urlopen
 
 from cloud.shared.bin.lib.config_loader import (
     CIVIFORM_SERVER_VARIABLES_KEY, ConfigLoader)
+from cloud.shared.bin.lib.env_var_docs_cache import EnvVarDocsCache
+from cloud.shared.bin.lib.env_var_docs_index import IndexedVariable
+from cloud.shared.bin.lib.resolved_tag import ResolvedTag
 from cloud.shared.bin.lib.mock_env_var_docs_parser import (
     Variable, Mode, import_mock_env_var_docs_parser,
     install_mock_env_var_docs_package)
@@ -200,6 +204,42 @@ class TestConfigLoader(unittest.TestCase):
         commit_sha = config_loader._get_commit_sha_for_tag("invalid tag")
         self.assertEqual(commit_sha, None)
 
+    @patch(
+        'cloud.shared.bin.lib.config_loader.ConfigLoader._fetch_json_val',
+        side_effect=mocked_fetch_json_val)
+    def test_resolve_tag__version_without_v_prefix(self, mocked_fetch_json_val):
+        config_loader = ConfigLoader()
+        resolved_tag = config_loader.resolve_tag("1.23.0")
+
+        self.assertEqual(
+            resolved_tag,
+            ResolvedTag(
+                tag="v1.23.0",
+                short_sha="abc123",
+                commit_sha="abc123",
+                image_digest=None))
+
+    @patch(
+        'cloud.shared.bin.lib.config_loader.ConfigLoader._fetch_json_val',
+        side_effect=mocked_fetch_json_val)
+    def test_resolve_tag__invalid_tag(self, mocked_fetch_json_val):
+        config_loader = ConfigLoader()
+        with self.assertRaises(ConfigLoader.VersionNotFoundError):
+            config_loader.resolve_tag("not-a-version")
+
+    @patch('cloud.shared.bin.lib.config_loader.ConfigLoader._fetch_json_val')
+    def test_get_commit_hash_for_tag__uses_resolved_tag(
+            self, mocked_fetch_json_val):
+        config_loader = ConfigLoader()
+        config_loader.set_resolved_tag(
+            ResolvedTag(
+                tag="v1.23.0", short_sha="abc123", commit_sha="abc123def"))
+
+        commit_sha = config_loader._get_commit_sha_for_tag("v1.23.0")
+
+        self.assertEqual(commit_sha, "abc123def")
+        mocked_fetch_json_val.assert_not_called()
+
     @patch('importlib.import_module')
     def test_validate_correct_values_in_config__for_server_variables(
             self, mock_import_module):
@@ -428,46 +468,160 @@ class TestConfigLoader(unittest.TestCase):
         self.assertEqual(server_vars["FOO_0.1"], "item1")
         self.assertEqual(server_vars["FOO_0.2"], "item2")
 
+    def test_server_env_var_docs_loaded_on_first_use(self):
+        config_loader = ConfigLoader()
+        config_loader._config_fields = {"FOO": "bar"}
+
+        with patch.object(ConfigLoader, '_load_civiform_server_env_vars',
+                          return_value={}) as mock_load:
+            # Validating without the docs loaded skips the server variables.
+            self.assertEqual(config_loader.validate_config(), [])
+            mock_load.assert_not_called()
+
+            config_loader.get_terraform_variables()
+            config_loader.get_terraform_variables()
+            mock_load.assert_called_once()
+
+    def test_edit_session_writes_tfvars_once(self):
+        config_loader = ConfigLoader()
+        config_loader._config_fields = {"FOO": "bar"}
+
+        with patch.dict(os.environ), patch.object(
+                ConfigLoader, 'write_tfvars_file') as mock_write:
+            with config_loader.edit_session():
+                config_loader.add_config_value("FOO", "baz")
+                config_loader.add_config_value("NEW", "value")
+                mock_write.assert_not_called()
+
+            mock_write.assert_called_once()
+            self.assertEqual(config_loader.get_config_var("FOO"), "baz")
+            self.assertEqual(os.environ["NEW"], "value")
+
+    def test_edit_session_rolls_back_on_error(self):
+        config_loader = ConfigLoader()
+        config_loader._config_fields = {"FOO": "bar"}
+
+        with patch.dict(os.environ, {"FOO": "bar"}), patch.object(
+                ConfigLoader, 'write_tfvars_file') as mock_write:
+            with self.assertRaises(SystemExit):
+                with config_loader.edit_session():
+                    config_loader.add_config_value("FOO", "baz")
+                    config_loader.add_config_value("NEW", "value")
+                    exit(1)
+
+            mock_write.assert_not_called()
+            self.assertEqual(config_loader._config_fields, {"FOO": "bar"})
+            self.assertEqual(os.environ["FOO"], "bar")
+            self.assertNotIn("NEW", os.environ)
+
+    def test_get_undeclared_tfvars(self):
+        with tempfile.TemporaryDirectory() as template_dir:
+            with open(os.path.join(template_dir, "variables.tf"), "w") as f:
+                f.write('variable "foo" {\n  type = string\n}\n')
+            config_loader = ConfigLoader()
+            config_loader._config_fields = {
+                "TERRAFORM_TEMPLATE_DIR": template_dir
+            }
+            config_loader._infra_variable_definitions = {
+                "FOO": {
+                    "tfvar": True
+                },
+                "BAR": {
+                    "tfvar": True
+                },
+                "BAZ": {
+                    "tfvar": False
+                },
+            }
+
+            self.assertEqual(config_loader.get_undeclared_tfvars(), ["BAR"])
+
+    @patch.object(ConfigLoader, '_get_commit_sha_for_tag', return_value=None)
     def test_load_civiform_server_env_vars_empty_if_env_var_docs_package_not_present(
-            self):
+            self, mock_get_commit_sha_for_tag):
         # Skip mocking out the presence of the env var docs package (see other tests)
         config_loader = ConfigLoader()
-        server_vars = config_loader._load_civiform_server_env_vars()
+        server_vars = config_loader._load_civiform_server_env_vars("v1.23.0")
         # Because the package is not present, no server variables were loaded
         self.assertEqual(server_vars, {})
 
+    @patch.object(
+        ConfigLoader, '_get_commit_sha_for_tag', return_value="a" * 40)
+    def test_load_civiform_server_env_vars_uses_cached_index_without_env_var_docs_package(
+            self, mock_get_commit_sha_for_tag):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        env = patch.dict(
+            os.environ, {"CIVIFORM_DEPLOY_CACHE_DIR": cache_dir.name})
+        env.start()
+        self.addCleanup(env.stop)
+        index = {
+            'MY_VAR':
+                IndexedVariable(
+                    type='string',
+                    mode='ADMIN_READABLE',
+                    required=False,
+                    values=[],
+                    regex='')
+        }
+        cache = EnvVarDocsCache()
+        cache.put("a" * 40, '{}')
+        cache.put_index("a" * 40, index)
+
+        config_loader = ConfigLoader()
+        with patch.object(ConfigLoader,
+                          '_download_env_var_docs') as mock_download:
+            server_vars = config_loader._load_civiform_server_env_vars(
+                "v1.23.0")
+            mock_download.assert_not_called()
+        self.assertEqual(server_vars, index)
+
+    @patch.object(
+        ConfigLoader, '_get_commit_sha_for_tag', return_value="a" * 40)
     @patch('importlib.import_module')
-    def test_load_civiform_server_env_vars(self, mock_import_module):
+    def test_load_civiform_server_env_vars(
+            self, mock_import_module, mock_get_commit_sha_for_tag):
         config_loader = ConfigLoader()
         config_loader._config_fields = {"CIVIFORM_VERSION": "v1.23.0"}
         os.environ['TF_VAR_image_tag'] = "v1.23.0"
 
+        docs = '{ "MY_VAR": { "description": "A var", "type": "string", "type": "bool"} }'
+
         # Instead of downloading the env_var_docs from github, mock out the download call
         def mock_download_env_var_docs(civiform_version: str):
-            env_var_docs = io.StringIO(
-                '{ "MY_VAR": { "description": "A var", "type": "string", "type": "bool"} }'
-            )
-            return env_var_docs
-
-        with patch(
-                'cloud.shared.bin.lib.config_loader.ConfigLoader._download_env_var_docs',
-                side_effect=mock_download_env_var_docs):
+            # Like a download, caches the file, which the index is built from.
+            EnvVarDocsCache().put("a" * 40, docs)
+            return io.StringIO(docs)
+
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        env = patch.dict(
+            os.environ, {"CIVIFORM_DEPLOY_CACHE_DIR": cache_dir.name})
+        env.start()
+        self.addCleanup(env.stop)
+        with patch.object(ConfigLoader, '_download_env_var_docs',
+                          side_effect=mock_download_env_var_docs):
             install_mock_env_var_docs_package(self, mock_import_module)
             env_var_docs = config_loader._load_civiform_server_env_vars()
             # Assert that the python module that enables the variable auto generation is downloaded
             mock_import_module.assert_called_with('env_var_docs.parser')
+            expected = {
+                'test-variable-node':
+                    IndexedVariable(
+                        type='string',
+                        mode='ADMIN_READABLE',
+                        required=False,
+                        values=[],
+                        regex='')
+            }
+            self.assertEqual(expected, env_var_docs)
+
+            # The second load uses the cached index instead of parsing the
+            # env-var-docs again.
+            mock_import_module.return_value.visit.reset_mock()
             self.assertEqual(
-                {
-                    'test-variable-node':
-                        Variable(
-                            description='description',
-                            type='string',
-                            required=False,
-                            values=[],
-                            regex='',
-                            regex_tests=[],
-                            mode=Mode.ADMIN_READABLE)
-                }, env_var_docs)
+                expected, config_loader._load_civiform_server_env_vars())
+            mock_import_module.return_value.visit.assert_not_called()
 
     @patch('urllib.request.urlopen')
     def test_download_env_var_docs(self, mock_urlopen):
@@ -0,0 +1,211 @@
+"""
+Per-phase deploy timings and an estimate of how long a deploy will take.
+
+A deploy goes through the phases init, plan (which refreshes the state),
+apply, ecs_wait and, for the setup command, post_setup. Code that runs a
+phase wraps it in `with deploy_timings.phase("apply"):` or decorates it with
+@deploy_timings.phase("ecs_wait"), and record_deploy appends the durations to
+a JSONL history file in the local cache, next to the per-resource apply
+timings of terraform_events.py.
+
+Before an apply, the planned resource changes are matched against that
+history to print an estimate, so maintenance windows can be scheduled for
+slow changes like a PostgreSQL major version upgrade.
+"""
+
+import contextlib
+import datetime
+import re
+import time
+from typing import Dict, List, Optional
+
+from cloud.shared.bin.lib import terraform_events
+from cloud.shared.bin.lib.cache import cache_dir
+from cloud.shared.bin.lib.color import yellow
+from cloud.shared.bin.lib.print import print
+
+RDS_ENGINE_UPGRADE = "RDS engine upgrade"
+
+# Changes that historically took at least this long are highlighted.
+SLOW_CHANGE_SECONDS = 5 * 60
+
+# Phase durations of this process, in seconds.
+_durations: Dict[str, float] = {}
+
+
+@contextlib.contextmanager
+def phase(name: str):
+    """Adds the time spent in the block to the duration of the phase."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        _durations[name] = _durations.get(name, 0) + time.monotonic() - start
+
+
+def durations() -> Dict[str, float]:
+    return {name: round(seconds, 1) for name, seconds in _durations.items()}
+
+
+def reset():
+    _durations.clear()
+
+
+def deploys_history_path() -> str:
+    return cache_dir("history", "deploys.jsonl")
+
+
+def record_deploy(command: str, **fields):
+    """Appends the phase durations of this process to the deploy history."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    record = {
+        "finished_at": now.isoformat(timespec="seconds"),
+        "command": command,
+        "phases": durations(),
+    }
+    record.update(fields)
+    try:
+        terraform_events.append_history(record, deploys_history_path())
+    except OSError as e:
+        print(f"Could not write the deploy history: {e}")
+
+
+def load_deploys() -> List[dict]:
+    return terraform_events.load_history(deploys_history_path())
+
+
+class PlannedChange:
+
+    def __init__(self, address: str, action: str, label: Optional[str] = None):
+        self.address = address
+        self.action = action
+        self.label = label
+        """Names changes whose duration depends on more than the resource,
+        e.g. RDS_ENGINE_UPGRADE."""
+
+    @property
+    def description(self) -> str:
+        if self.label:
+            return f"{self.label} ({self.address})"
+        return f"{self.address} ({self.action})"
+
+
+def planned_changes(plan: dict) -> List[PlannedChange]:
+    """Returns the changes in the output of terraform show -json <plan>.
+
+    The actions are named like the actions of the apply events, so they can
+    be matched against the history.
+    """
+    changes = []
+    for resource_change in plan.get("resource_changes") or []:
+        change = resource_change.get("change") or {}
+        actions = change.get("actions") or []
+        if actions in (["no-op"], ["read"]) or not actions:
+            continue
+        action = "replace" if len(actions) > 1 else actions[0]
+        changes.append(
+            PlannedChange(
+                resource_change["address"], action,
+                _label(resource_change.get("type"), change)))
+    return changes
+
+
+def _label(resource_type: Optional[str], change: dict) -> Optional[str]:
+    if resource_type == "aws_db_instance":
+        before = (change.get("before") or {}).get("engine_version")
+        after = (change.get("after") or {}).get("engine_version")
+        if before and after and _major_version(before) != _major_version(after):
+            return RDS_ENGINE_UPGRADE
+    return None
+
+
+def _major_version(version: str) -> str:
+    return re.split(r'[.]', str(version))[0]
+
+
+def historical_seconds(change: PlannedChange,
+                       applies: List[dict]) -> List[float]:
+    """Returns how long the change took in the previous applies that
+    completed it. Labelled changes match any resource with the same label,
+    other changes only unlabelled changes of the same resource."""
+    seconds = []
+    for record in applies:
+        for resource in record.get("resources") or []:
+            if resource.get("status") != "complete" or resource.get(
+                    "seconds") is None:
+                continue
+            if change.label:
+                matches = resource.get("label") == change.label
+            else:
+                matches = not resource.get("label") and resource.get(
+                    "address") == change.address and resource.get(
+                        "action") == change.action
+            if matches:
+                seconds.append(resource["seconds"])
+    return seconds
+
+
+def format_estimate(
+        changes: List[PlannedChange],
+        applies: List[dict],
+        deploys: List[dict],
+        limit: int = 5) -> Optional[str]:
+    """Returns a description of how long applying the changes and waiting
+    for the ECS service is expected to take, or None without history."""
+    known = []
+    unknown = []
+    for change in changes:
+        seconds = historical_seconds(change, applies)
+        if seconds:
+            known.append((change, min(seconds), max(seconds)))
+        else:
+            unknown.append(change)
+    ecs_waits = [
+        record["phases"]["ecs_wait"]
+        for record in deploys
+        if "ecs_wait" in (record.get("phases") or {})
+    ]
+    labelled_unknown = [change for change in unknown if change.label]
+    if not known and not ecs_waits and not labelled_unknown:
+        return None
+
+    lines = [
+        f"Estimated duration, based on {len(applies)} previous applies on this machine:"
+    ]
+    known.sort(key=lambda item: item[2], reverse=True)
+    for change, low, high in known[:limit]:
+        line = f"  {change.description}: historically {format_range(low, high)}"
+        if high >= SLOW_CHANGE_SECONDS or change.label:
+            line = yellow(line)
+        lines.append(line)
+    for change in labelled_unknown:
+        lines.append(yellow(f"  {change.description}: no history yet"))
+    if known:
+        # Terraform applies independent changes in parallel, so the apply
+        # takes at least as long as the slowest change and at most as long
+        # as all of them in sequence.
+        low = max(item[1] for item in known)
+        high = sum(item[2] for item in known)
+        summary = f"  Apply: {format_range(low, high)}"
+        if unknown:
+            summary += f", plus {len(unknown)} changes without history"
+        lines.append(summary)
+    if ecs_waits:
+        lines.append(
+            f"  Waiting for the ECS service: {format_range(min(ecs_waits), max(ecs_waits))}"
+        )
+    return "\n".join(lines)
+
+
+def format_range(low: float, high: float) -> str:
+    if _format_duration(low) == _format_duration(high):
+        return f"about {_format_duration(high)}"
+    if low >= 90 and high >= 90:
+        return f"{round(low / 60)}–{round(high / 60)} min"
+    return f"{_format_duration(low)}–{_format_duration(high)}"
+
+
+def _format_duration(seconds: float) -> str:
+    if seconds < 90:
+        return f"{round(seconds)}s"
+    return f"{round(seconds / 60)} min"
@@ -0,0 +1,152 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cloud.shared.bin.lib import deploy_timings
+"""
+Tests for deploy_timings.py.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/shared/bin/lib/deploy_timings_test.py
+"""
+
+DB = "module.database.aws_db_instance.civiform"
+SERVICE = "module.ecs.aws_ecs_service.civiform"
+UPGRADE = deploy_timings.RDS_ENGINE_UPGRADE
+
+
+def _resource(address, action, seconds, label=None):
+    """Returns a resource of an apply history record."""
+    resource = {
+        "address": address,
+        "action": action,
+        "seconds": seconds,
+        "status": "complete"
+    }
+    if label:
+        resource["label"] = label
+    return resource
+
+
+def _apply(*resources):
+    return {"resources": list(resources)}
+
+
+def _resource_change(address, resource_type, actions, engine_versions=None):
+    """Returns a resource change of a terraform show -json plan."""
+    change = {"actions": actions}
+    if engine_versions:
+        change["before"] = {"engine_version": engine_versions[0]}
+        change["after"] = {"engine_version": engine_versions[1]}
+    return {"address": address, "type": resource_type, "change": change}
+
+
+class TestPhases(unittest.TestCase):
+
+    def setUp(self):
+        deploy_timings.reset()
+        self.addCleanup(deploy_timings.reset)
+
+    @patch('cloud.shared.bin.lib.deploy_timings.time.monotonic')
+    def test_phase_durations_accumulate(self, mock_monotonic):
+        mock_monotonic.side_effect = [0, 10, 20, 25, 30, 90]
+
+        with deploy_timings.phase("plan"):
+            pass
+        with deploy_timings.phase("plan"):
+            pass
+
+        @deploy_timings.phase("ecs_wait")
+        def wait():
+            pass
+
+        wait()
+
+        self.assertEqual(
+            deploy_timings.durations(), {
+                "plan": 15,
+                "ecs_wait": 60
+            })
+
+    def test_record_deploy(self):
+        with tempfile.TemporaryDirectory() as tmpdir, patch.dict(
+                os.environ, {"CIVIFORM_DEPLOY_CACHE_DIR": tmpdir}):
+            with deploy_timings.phase("apply"):
+                pass
+            deploy_timings.record_deploy("deploy", image_tag="v1.0.0")
+
+            records = deploy_timings.load_deploys()
+
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["command"], "deploy")
+        self.assertEqual(records[0]["image_tag"], "v1.0.0")
+        self.assertIn("apply", records[0]["phases"])
+
+
+class TestEstimate(unittest.TestCase):
+
+    def test_planned_changes(self):
+        resource_changes = [
+            _resource_change(
+                DB, "aws_db_instance", ["update"], ("12.17", "16.1")),
+            _resource_change(SERVICE, "aws_ecs_service", ["delete", "create"]),
+            _resource_change("aws_s3_bucket.files", "aws_s3_bucket", ["no-op"]),
+        ]
+
+        changes = deploy_timings.planned_changes(
+            {"resource_changes": resource_changes})
+
+        summary = [
+            (change.address, change.action, change.label) for change in changes
+        ]
+        self.assertEqual(
+            summary, [(DB, "update", UPGRADE), (SERVICE, "replace", None)])
+
+    def test_labelled_changes_match_any_address(self):
+        applies = [
+            _apply(
+                _resource("aws_db_instance.old", "update", 840, UPGRADE),
+                _resource(DB, "update", 30)),
+            _apply(_resource(DB, "update", 1320, UPGRADE)),
+        ]
+        upgrade = deploy_timings.PlannedChange(DB, "update", UPGRADE)
+
+        self.assertEqual(
+            deploy_timings.historical_seconds(upgrade, applies), [840, 1320])
+        self.assertEqual(
+            deploy_timings.historical_seconds(
+                deploy_timings.PlannedChange(DB, "update"), applies), [30])
+
+    def test_format_estimate(self):
+        applies = [
+            _apply(
+                _resource(DB, "update", 840, UPGRADE),
+                _resource(SERVICE, "update", 20)),
+            _apply(
+                _resource(DB, "update", 1320, UPGRADE),
+                _resource(SERVICE, "update", 40)),
+        ]
+        deploys = [{"phases": {"ecs_wait": 180}}, {"phases": {"plan": 30}}]
+        changes = [
+            deploy_timings.PlannedChange(DB, "update", UPGRADE),
+            deploy_timings.PlannedChange(SERVICE, "update"),
+            deploy_timings.PlannedChange("aws_s3_bucket.files", "create"),
+        ]
+
+        estimate = deploy_timings.format_estimate(changes, applies, deploys)
+
+        self.assertIn(
+            f"RDS engine upgrade ({DB}): historically 14–22 min", estimate)
+        self.assertIn(f"{SERVICE} (update): historically 20s–40s", estimate)
+        self.assertIn(
+            "Apply: 14–23 min, plus 1 changes without history", estimate)
+        self.assertIn("Waiting for the ECS service: about 3 min", estimate)
+
+    def test_no_estimate_without_history(self):
+        self.assertIsNone(
+            deploy_timings.format_estimate(
+                [deploy_timings.PlannedChange(SERVICE, "update")], [], []))
+
+
+if __name__ == "__main__":
+    unittest.main()
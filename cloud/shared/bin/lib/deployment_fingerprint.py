@@ -0,0 +1,198 @@
+"""
+Fingerprints the inputs of a deployment, so that a deploy can be skipped when
+nothing changed since the last successful one.
+
+The fingerprint covers:
+  - tfvars: the rendered tfvars file.
+  - template: the files in the template directory and in the local modules it
+    references, excluding Terraform's working files and local state.
+  - lock_file: the template's .terraform.lock.hcl.
+  - image: the image digest the tag was resolved to, or the tag itself.
+  - environment: TF_VAR_* environment variables, which Terraform also reads.
+
+Each component is hashed separately so that a report can say what changed.
+The value of each Terraform variable, from the tfvars file and TF_VAR_*, is
+hashed separately too, so a deploy can apply only the template layers that
+use the changed variables, see template_layers.py.
+The last fingerprint is stored in the local cache, see cache.py, and the
+cloud specific deploy code can store it next to the Terraform state too. Both
+records are deleted when the deployment is set up or destroyed.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+from typing import Dict, Optional
+
+from cloud.shared.bin.lib.cache import atomic_write, cache_dir
+from cloud.shared.bin.lib.config_loader import ConfigLoader
+from cloud.shared.bin.lib import template_files
+from cloud.shared.bin.lib import terraform_variables
+
+LOCK_FILENAME = ".terraform.lock.hcl"
+
+# Components that only change through variable values.
+VARIABLE_COMPONENTS = frozenset(["tfvars", "image", "environment"])
+
+
+class DeploymentFingerprint:
+
+    def __init__(
+            self,
+            components: Dict[str, str],
+            variables: Optional[Dict[str, str]] = None):
+        self.components = components
+        """Hash of each input, keyed by component name."""
+        self.variables = variables
+        """Hash of the value of each variable, keyed by variable name."""
+
+    @property
+    def digest(self) -> str:
+        return _sha256(
+            json.dumps(self.components, sort_keys=True).encode("utf-8"))
+
+    def changed_components(
+            self, other: Optional["DeploymentFingerprint"]) -> list:
+        """Returns the names of the components that differ from other."""
+        if other is None:
+            return sorted(self.components)
+        names = set(self.components) | set(other.components)
+        return sorted(
+            name for name in names
+            if self.components.get(name) != other.components.get(name))
+
+    def changed_variables(
+            self, other: Optional["DeploymentFingerprint"]) -> Optional[list]:
+        """Returns the names of the variables that differ from other, or None
+        if anything else changed or other has no variable hashes."""
+        if other is None or self.variables is None or other.variables is None:
+            return None
+        if not set(self.changed_components(other)) <= VARIABLE_COMPONENTS:
+            return None
+        names = set(self.variables) | set(other.variables)
+        return sorted(
+            name for name in names
+            if self.variables.get(name) != other.variables.get(name))
+
+    def to_record(self, image_tag: Optional[str]) -> dict:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return {
+            "digest": self.digest,
+            "components": self.components,
+            "variables": self.variables,
+            "image_tag": image_tag,
+            "deployed_at": now.isoformat(timespec="seconds"),
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> Optional["DeploymentFingerprint"]:
+        if not isinstance(record, dict):
+            return None
+        components = record.get("components")
+        if not isinstance(components, dict):
+            return None
+        variables = record.get("variables")
+        return cls(
+            components, variables if isinstance(variables, dict) else None)
+
+
+def compute(
+        config: ConfigLoader,
+        terraform_template_dir: Optional[str] = None) -> DeploymentFingerprint:
+    if not terraform_template_dir:
+        terraform_template_dir = config.get_template_dir()
+    tfvars_path = os.path.join(terraform_template_dir, config.tfvars_filename)
+
+    template_hash = hashlib.sha256()
+    for path in sorted(template_files.walk(
+            terraform_template_dir, {config.tfvars_filename, LOCK_FILENAME})):
+        template_hash.update(os.path.relpath(path).encode("utf-8") + b"\0")
+        template_hash.update(_file_digest(path).encode("utf-8"))
+
+    resolved_tag = config.resolved_tag
+    if resolved_tag and resolved_tag.image_digest:
+        image = resolved_tag.image_digest
+    else:
+        image = os.getenv("TF_VAR_image_tag", "")
+
+    environment = {
+        key: value
+        for key, value in os.environ.items()
+        if key.startswith("TF_VAR_")
+    }
+
+    values = {}
+    try:
+        with open(tfvars_path) as f:
+            values = terraform_variables.parse_attributes(f.read())
+    except FileNotFoundError:
+        pass
+    except terraform_variables.ParseError:
+        # Without variable hashes, the whole template is applied.
+        values = None
+    if values is not None:
+        for key, value in environment.items():
+            name = key[len("TF_VAR_"):]
+            values[name] = values.get(name, "") + "\0" + value
+        # The same tag can resolve to a new image.
+        values["image_tag"] = values.get("image_tag", "") + "\0" + image
+        values = {
+            name: _sha256(value.encode("utf-8"))
+            for name, value in values.items()
+        }
+
+    return DeploymentFingerprint(
+        {
+            "tfvars":
+                _file_digest(tfvars_path),
+            "template":
+                template_hash.hexdigest(),
+            "lock_file":
+                _file_digest(
+                    os.path.join(terraform_template_dir, LOCK_FILENAME)),
+            "image":
+                _sha256(image.encode("utf-8")),
+            "environment":
+                _sha256(
+                    json.dumps(environment, sort_keys=True).encode("utf-8")),
+        }, values)
+
+
+def local_record_path(config: ConfigLoader) -> str:
+    return cache_dir(
+        "fingerprints",
+        f"{config.get_cloud_provider()}-{config.app_prefix}.json")
+
+
+def load_local_record(config: ConfigLoader) -> Optional[dict]:
+    try:
+        with open(local_record_path(config)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_local_record(config: ConfigLoader, record: dict):
+    atomic_write(
+        local_record_path(config),
+        json.dumps(record, indent=2).encode("utf-8"))
+
+
+def delete_local_record(config: ConfigLoader):
+    try:
+        os.remove(local_record_path(config))
+    except FileNotFoundError:
+        pass
+
+
+def _file_digest(path: str) -> str:
+    try:
+        with open(path, "rb") as f:
+            return _sha256(f.read())
+    except FileNotFoundError:
+        return ""
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
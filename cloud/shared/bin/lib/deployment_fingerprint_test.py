@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cloud.shared.bin.lib import deployment_fingerprint
+from cloud.shared.bin.lib.config_loader import ConfigLoader
+from cloud.shared.bin.lib.resolved_tag import ResolvedTag
+"""
+Tests for deployment_fingerprint.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/shared/bin/lib/deployment_fingerprint_test.py
+"""
+
+
+class TestDeploymentFingerprint(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.template_dir = os.path.join(tmpdir.name, "templates", "app")
+        self.module_dir = os.path.join(tmpdir.name, "modules", "db")
+        os.makedirs(self.template_dir)
+        os.makedirs(self.module_dir)
+        self._write(
+            self.template_dir, "main.tf",
+            'module "db" {\n  source = "../../modules/db"\n}\n')
+        self._write(self.module_dir, "main.tf", 'resource "a" "b" {}\n')
+        self._write(self.template_dir, "setup.auto.tfvars", 'foo="bar"\n')
+
+        self.config = ConfigLoader()
+        self.config._config_fields = {
+            "TERRAFORM_TEMPLATE_DIR": self.template_dir,
+            "CIVIFORM_CLOUD_PROVIDER": "aws",
+            "APP_PREFIX": "test",
+        }
+
+        env = patch.dict(
+            os.environ, {
+                "TF_VAR_image_tag": "v1.0.0",
+                "CIVIFORM_DEPLOY_CACHE_DIR": os.path.join(tmpdir.name, "cache")
+            })
+        env.start()
+        self.addCleanup(env.stop)
+
+    def _write(self, directory, name, content):
+        with open(os.path.join(directory, name), "w") as f:
+            f.write(content)
+
+    def test_unchanged_inputs(self):
+        first = deployment_fingerprint.compute(self.config)
+        # Terraform working files do not count as changes.
+        os.makedirs(os.path.join(self.template_dir, ".terraform"))
+        self._write(os.path.join(self.template_dir, ".terraform"), "state", "x")
+
+        second = deployment_fingerprint.compute(self.config)
+
+        self.assertEqual(first.digest, second.digest)
+        self.assertEqual(second.changed_components(first), [])
+
+    def test_changed_components(self):
+        first = deployment_fingerprint.compute(self.config)
+
+        self._write(self.module_dir, "main.tf", 'resource "a" "c" {}\n')
+        self._write(self.template_dir, "setup.auto.tfvars", 'foo="baz"\n')
+        self.config.set_resolved_tag(
+            ResolvedTag(
+                "v1.0.0", "abc1234", "a" * 40, "civiform/civiform@sha256:1"))
+
+        self.assertEqual(
+            deployment_fingerprint.compute(
+                self.config).changed_components(first),
+            ["image", "template", "tfvars"])
+
+    def test_changed_variables(self):
+        self._write(
+            self.template_dir, "setup.auto.tfvars",
+            'foo="bar"\nciviform_server_environment_variables = {\n  "A"="1"\n}\n'
+        )
+        first = deployment_fingerprint.compute(self.config)
+
+        self._write(
+            self.template_dir, "setup.auto.tfvars",
+            'foo="bar"\nciviform_server_environment_variables = {\n  "A"="2"\n}\n'
+        )
+        with patch.dict(os.environ, {"TF_VAR_image_tag": "v1.0.1"}):
+            second = deployment_fingerprint.compute(self.config)
+
+        self.assertEqual(
+            second.changed_variables(first),
+            ["civiform_server_environment_variables", "image_tag"])
+
+        self._write(self.template_dir, "main.tf", "")
+        self.assertIsNone(
+            deployment_fingerprint.compute(
+                self.config).changed_variables(first))
+
+    def test_local_record_round_trip(self):
+        self.assertIsNone(deployment_fingerprint.load_local_record(self.config))
+        fingerprint = deployment_fingerprint.compute(self.config)
+
+        deployment_fingerprint.save_local_record(
+            self.config, fingerprint.to_record("v1.0.0"))
+
+        record = deployment_fingerprint.load_local_record(self.config)
+        self.assertEqual(record["image_tag"], "v1.0.0")
+        self.assertEqual(
+            deployment_fingerprint.DeploymentFingerprint.from_record(
+                record).digest, fingerprint.digest)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+"""
+Content-addressed on-disk cache for env-var-docs.json files.
+
+The env-var-docs.json file for a given civiform commit SHA never changes, so
+once it has been downloaded it can be reused by every later run that deploys
+the same version. Each entry is stored as <sha>.json along with a
+<sha>.json.sha256 file holding the digest of its content. Entries that fail
+the integrity check are discarded and downloaded again.
+
+The compiled index of each file (see env_var_docs_index.py) is stored next to
+it as <sha>.index. It is only used while the file it was built from is in
+the cache and passes the integrity check, and is evicted together with it.
+
+The cache is bounded in size, counting the files of an entry and its index.
+When it grows beyond max_bytes, the least recently used entries are removed.
+Reading an entry or its index marks it as used by updating its modification
+time.
+"""
+
+import hashlib
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+from cloud.shared.bin.lib import env_var_docs_index
+from cloud.shared.bin.lib.cache import atomic_write, cache_dir
+from cloud.shared.bin.lib.env_var_docs_index import IndexedVariable
+from cloud.shared.bin.lib.print import print
+
+_COMMIT_SHA_REGEX = re.compile(r'^[0-9a-f]{7,40}$')
+
+
+class EnvVarDocsCache:
+
+    DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+    def __init__(
+            self,
+            directory: Optional[str] = None,
+            max_bytes: int = DEFAULT_MAX_BYTES):
+        self._directory = directory
+        self.max_bytes = max_bytes
+
+    @property
+    def directory(self) -> str:
+        if self._directory is None:
+            self._directory = cache_dir("env-var-docs")
+        return self._directory
+
+    def path_for(self, commit_sha: str) -> str:
+        if not _COMMIT_SHA_REGEX.match(commit_sha):
+            raise ValueError(f"'{commit_sha}' is not a valid commit sha")
+        return os.path.join(self.directory, f"{commit_sha}.json")
+
+    def index_path_for(self, commit_sha: str) -> str:
+        return os.path.join(self.directory, f"{commit_sha}.index")
+
+    def get(self, commit_sha: str) -> Optional[str]:
+        """Returns the cached env-var-docs.json content for the commit, or
+        None if there is no valid entry for it.
+        """
+        path = self.path_for(commit_sha)
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            with open(f"{path}.sha256", "r") as f:
+                expected_digest = f.read().strip()
+        except FileNotFoundError:
+            return None
+
+        if hashlib.sha256(content).hexdigest() != expected_digest:
+            print(
+                f"Cached env-var-docs.json for {commit_sha} failed the integrity check, discarding it."
+            )
+            self._remove(path)
+            return None
+
+        # Bump the modification time so eviction treats it as recently used.
+        os.utime(path)
+        return content.decode("utf-8")
+
+    def put(self, commit_sha: str, text: str):
+        """Stores the env-var-docs.json content for the commit and evicts old
+        entries if the cache is over its size limit.
+        """
+        # Never cache a truncated or otherwise corrupt download.
+        json.loads(text)
+
+        path = self.path_for(commit_sha)
+        content = text.encode("utf-8")
+        atomic_write(path, content)
+        atomic_write(f"{path}.sha256", _digest(text).encode("ascii"))
+        self._evict(keep=path)
+
+    def get_index(self,
+                  commit_sha: str) -> Optional[Dict[str, IndexedVariable]]:
+        """Returns the index of the cached env-var-docs.json for the commit,
+        or None if either is missing or invalid.
+        """
+        content = self.get(commit_sha)
+        if content is None:
+            return None
+        return env_var_docs_index.load_index(
+            self.index_path_for(commit_sha), _digest(content))
+
+    def put_index(self, commit_sha: str, index: Dict[str, IndexedVariable]):
+        """Stores the index of the cached env-var-docs.json for the commit.
+        Does nothing if that file is not in the cache.
+        """
+        content = self.get(commit_sha)
+        if content is None:
+            return
+        env_var_docs_index.save_index(
+            self.index_path_for(commit_sha), index, _digest(content))
+        self._evict(keep=self.path_for(commit_sha))
+
+    def _entries(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [
+            os.path.join(self.directory, name)
+            for name in names
+            if name.endswith(".json")
+        ]
+
+    def _evict(self, keep: str):
+        entries = []
+        for path in self._entries():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            size = sum(
+                _file_size(p)
+                for p in (path, f"{path}.sha256", self._index_path(path)))
+            entries.append((stat.st_mtime, size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path: str):
+        for p in (path, f"{path}.sha256", self._index_path(path)):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _index_path(path: str) -> str:
+        return f"{path[:-len('.json')]}.index"
+
+
+def _digest(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
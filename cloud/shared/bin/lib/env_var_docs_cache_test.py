@@ -0,0 +1,101 @@
+import os
+import tempfile
+import unittest
+
+from cloud.shared.bin.lib.env_var_docs_cache import EnvVarDocsCache
+from cloud.shared.bin.lib.env_var_docs_index import IndexedVariable
+"""
+Tests for the EnvVarDocsCache.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/shared/bin/lib/env_var_docs_cache_test.py
+"""
+
+SHA_ONE = "1" * 40
+SHA_TWO = "2" * 40
+SHA_THREE = "3" * 40
+DOCS = '{ "MY_VAR": { "description": "A var", "type": "string"} }'
+INDEX = {"MY_VAR": IndexedVariable("string", "ADMIN_READABLE", False)}
+# The size of the .sha256 file of an entry.
+DIGEST_BYTES = 64
+
+
+class TestEnvVarDocsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = EnvVarDocsCache(directory=self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_get_missing_entry(self):
+        self.assertIsNone(self.cache.get(SHA_ONE))
+
+    def test_put_then_get(self):
+        self.cache.put(SHA_ONE, DOCS)
+        self.assertEqual(self.cache.get(SHA_ONE), DOCS)
+
+    def test_corrupt_entry_is_discarded(self):
+        self.cache.put(SHA_ONE, DOCS)
+        with open(self.cache.path_for(SHA_ONE), "w") as f:
+            f.write('{ "MY_VAR": {} }')
+
+        self.assertIsNone(self.cache.get(SHA_ONE))
+        self.assertFalse(os.path.exists(self.cache.path_for(SHA_ONE)))
+
+    def test_invalid_json_is_not_cached(self):
+        with self.assertRaises(ValueError):
+            self.cache.put(SHA_ONE, '{ "MY_VAR": ')
+        self.assertIsNone(self.cache.get(SHA_ONE))
+
+    def test_invalid_sha_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.cache.put("../../etc/passwd", DOCS)
+
+    def test_put_index_then_get_index(self):
+        self.cache.put_index(SHA_ONE, INDEX)
+        self.assertIsNone(self.cache.get_index(SHA_ONE))
+
+        self.cache.put(SHA_ONE, DOCS)
+        self.cache.put_index(SHA_ONE, INDEX)
+
+        self.assertEqual(self.cache.get_index(SHA_ONE), INDEX)
+
+    def test_index_of_another_file_is_not_used(self):
+        self.cache.put(SHA_ONE, DOCS)
+        self.cache.put_index(SHA_ONE, INDEX)
+        # E.g. a cache entry written by an older version with a bug.
+        self.cache.put(SHA_ONE, '{ "OTHER_VAR": {} }')
+
+        self.assertIsNone(self.cache.get_index(SHA_ONE))
+
+    def test_index_counts_towards_the_size_limit(self):
+        self.cache.max_bytes = 2 * (len(DOCS) + DIGEST_BYTES)
+        self.cache.put(SHA_ONE, DOCS)
+        self.cache.put_index(SHA_ONE, INDEX)
+        os.utime(self.cache.path_for(SHA_ONE), (1, 1))
+
+        self.cache.put(SHA_TWO, DOCS)
+
+        self.assertIsNone(self.cache.get(SHA_ONE))
+        self.assertFalse(os.path.exists(self.cache.index_path_for(SHA_ONE)))
+        self.assertEqual(self.cache.get(SHA_TWO), DOCS)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.max_bytes = 2 * (len(DOCS) + DIGEST_BYTES)
+        self.cache.put(SHA_ONE, DOCS)
+        self.cache.put(SHA_TWO, DOCS)
+        os.utime(self.cache.path_for(SHA_ONE), (1, 1))
+        os.utime(self.cache.path_for(SHA_TWO), (2, 2))
+        # Reading SHA_ONE makes SHA_TWO the least recently used entry.
+        self.cache.get(SHA_ONE)
+
+        self.cache.put(SHA_THREE, DOCS)
+
+        self.assertEqual(self.cache.get(SHA_ONE), DOCS)
+        self.assertIsNone(self.cache.get(SHA_TWO))
+        self.assertEqual(self.cache.get(SHA_THREE), DOCS)
+
+
+if __name__ == "__main__":
+    unittest.main()
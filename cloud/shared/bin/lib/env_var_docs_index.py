@@ -0,0 +1,114 @@
+"""
+Compiled index of the server variables documented in env-var-docs.json.
+
+Walking the env-var-docs tree with env_var_docs.parser.visit is the slowest
+part of loading the config. The index keeps only what validation and tfvars
+generation need, with allowed values as a set and the validation regex
+compiled, and is persisted next to the cached env-var-docs.json so later runs
+for the same commit load it instead of reparsing the docs.
+
+A persisted index records the digest of the env-var-docs.json it was built
+from, and the digest of its own variables, and is only loaded if both match.
+"""
+
+import dataclasses
+import hashlib
+import json
+import re
+from typing import Dict, List, Optional, Pattern, Union
+
+from cloud.shared.bin.lib.cache import atomic_write
+
+# Bump when the serialized format changes so stale indexes are rebuilt.
+INDEX_VERSION = 2
+
+
+@dataclasses.dataclass
+class IndexedVariable:
+    type: str
+    mode: str
+    """Name of the env_var_docs.parser.Mode, e.g. "ADMIN_WRITEABLE"."""
+    required: bool
+    values: Optional[List[str]] = None
+    regex: Optional[str] = None
+    allowed_values: Union[frozenset, str, None] = dataclasses.field(
+        init=False, repr=False, compare=False)
+    pattern: Optional[Pattern] = dataclasses.field(
+        init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # Values are a list in env-var-docs.json. Anything else is kept as is
+        # so membership checks behave the same as on the parser's Variable.
+        self.allowed_values = frozenset(self.values) if isinstance(
+            self.values, (list, tuple)) else self.values
+        self.pattern = re.compile(self.regex) if self.regex else None
+
+    @classmethod
+    def from_variable(cls, variable) -> "IndexedVariable":
+        """Builds an IndexedVariable from an env_var_docs.parser.Variable."""
+        if isinstance(variable, cls):
+            return variable
+        values = variable.values
+        if isinstance(values, (list, tuple)):
+            values = list(values)
+        return cls(
+            type=variable.type,
+            mode=variable.mode.name,
+            required=variable.required,
+            values=values,
+            regex=variable.regex)
+
+
+def build_index(env_var_docs: dict) -> Dict[str, IndexedVariable]:
+    """Returns an index of the given name to env_var_docs.parser.Variable
+    map. An index is returned as is."""
+    if all(isinstance(v, IndexedVariable) for v in env_var_docs.values()):
+        return env_var_docs
+    return {
+        name: IndexedVariable.from_variable(variable)
+        for name, variable in env_var_docs.items()
+    }
+
+
+def save_index(
+        path: str, index: Dict[str, IndexedVariable], source_digest: str):
+    """Writes the index, built from the env-var-docs.json whose sha256 digest
+    is source_digest, to path."""
+    variables = {
+        name: [v.type, v.mode, v.required, v.values, v.regex]
+        for name, v in index.items()
+    }
+    serialized = {
+        "version": INDEX_VERSION,
+        "source_sha256": source_digest,
+        "sha256": _digest(variables),
+        "variables": variables,
+    }
+    atomic_write(path, json.dumps(serialized).encode("utf-8"))
+
+
+def load_index(path: str,
+               source_digest: str) -> Optional[Dict[str, IndexedVariable]]:
+    """Returns the index stored at path, or None if it is missing, corrupt,
+    was written in an older format or was built from another
+    env-var-docs.json than the one whose digest is source_digest."""
+    try:
+        with open(path) as f:
+            serialized = json.load(f)
+        if serialized.get("version") != INDEX_VERSION:
+            return None
+        if serialized.get("source_sha256") != source_digest:
+            return None
+        variables = serialized["variables"]
+        if serialized.get("sha256") != _digest(variables):
+            return None
+        return {
+            name: IndexedVariable(*fields) for name, fields in variables.items()
+        }
+    except (OSError, ValueError, TypeError, KeyError, AttributeError, re.error):
+        return None
+
+
+def _digest(variables: dict) -> str:
+    text = json.dumps(variables, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
@@ -0,0 +1,95 @@
+#! /usr/bin/env python3
+"""
+Micro-benchmark comparing loading and validating the server variables by
+parsing env-var-docs.json against loading the compiled index.
+
+Requires the env-var-docs parser package, which cloud/shared/bin/run installs
+into the .venv. From the root of the repository:
+
+  .venv/bin/python3 cloud/shared/bin/lib/env_var_docs_index_benchmark.py \\
+      path/to/env-var-docs.json
+"""
+
+import argparse
+import importlib
+import io
+import os
+import sys
+import tempfile
+import timeit
+
+# Need to add current directory to PYTHONPATH if this script is run directly.
+sys.path.append(os.getcwd())
+
+from cloud.shared.bin.lib import env_var_docs_index
+from cloud.shared.bin.lib.config_loader import ConfigLoader
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('env_var_docs', help='Path to env-var-docs.json.')
+    parser.add_argument(
+        '--iterations',
+        type=int,
+        default=20,
+        help='Number of times to run each variant.')
+    args = parser.parse_args()
+
+    env_var_docs_parser = importlib.import_module("env_var_docs.parser")
+    with open(args.env_var_docs) as f:
+        env_var_docs_text = f.read()
+
+    def parse():
+        out = {}
+
+        def record_var(node):
+            if isinstance(node.details, env_var_docs_parser.Variable):
+                out[node.name] = node.details
+
+        env_var_docs_parser.visit(io.StringIO(env_var_docs_text), record_var)
+        return out
+
+    variables = parse()
+    config_fields = _sample_config(variables)
+    config_loader = ConfigLoader()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        index_path = os.path.join(tmpdir, "bench.index")
+        env_var_docs_index.save_index(
+            index_path, env_var_docs_index.build_index(variables), "bench")
+
+        def parse_and_validate():
+            config_loader._validate_civiform_server_env_vars(
+                parse(), config_fields)
+
+        def load_index_and_validate():
+            config_loader._validate_civiform_server_env_vars(
+                env_var_docs_index.load_index(index_path, "bench"),
+                config_fields)
+
+        print(
+            f"{len(variables)} variables, {args.iterations} iterations, time per iteration:"
+        )
+        for name, fn in [("parse + validate", parse_and_validate),
+                         ("load index + validate", load_index_and_validate)]:
+            seconds = timeit.timeit(fn, number=args.iterations)
+            print(f"  {name:<24}{seconds / args.iterations * 1000:8.2f} ms")
+
+
+def _sample_config(variables: dict) -> dict:
+    """Returns a config that sets every variable to a plausible value."""
+    config = {"ALLOW_ADMIN_WRITEABLE": "true"}
+    for name, variable in variables.items():
+        if variable.values:
+            config[name] = variable.values[0]
+        elif variable.type == "bool":
+            config[name] = "true"
+        elif variable.type == "int":
+            config[name] = "1"
+        else:
+            config[name] = "value"
+    return config
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+from cloud.shared.bin.lib.env_var_docs_index import (
+    IndexedVariable, build_index, load_index, save_index)
+from cloud.shared.bin.lib.mock_env_var_docs_parser import Mode, Variable
+"""
+Tests for the env-var-docs index.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/shared/bin/lib/env_var_docs_index_test.py
+"""
+
+
+class TestEnvVarDocsIndex(unittest.TestCase):
+
+    def test_build_index(self):
+        index = build_index(
+            {
+                "FOO":
+                    Variable(
+                        description="description",
+                        type="string",
+                        required=True,
+                        values=["a", "b"],
+                        regex="gr(a|e)y",
+                        regex_tests=None,
+                        mode=Mode.ADMIN_WRITEABLE)
+            })
+
+        foo = index["FOO"]
+        self.assertEqual(
+            foo,
+            IndexedVariable(
+                type="string",
+                mode="ADMIN_WRITEABLE",
+                required=True,
+                values=["a", "b"],
+                regex="gr(a|e)y"))
+        self.assertEqual(foo.allowed_values, frozenset(["a", "b"]))
+        self.assertIsNotNone(foo.pattern.match("grey"))
+        # Building the index of an index, e.g. a cached one, is a no-op.
+        self.assertIs(build_index(index), index)
+
+    def test_save_then_load(self):
+        foo = IndexedVariable("string", "ADMIN_READABLE", False, None, "[a-z]+")
+        index = {"FOO": foo, "BAR": IndexedVariable("int", "HIDDEN", True)}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "abc.index")
+            save_index(path, index, "digest")
+
+            loaded = load_index(path, "digest")
+            from_other_source = load_index(path, "other-digest")
+
+        self.assertEqual(loaded, index)
+        self.assertIsNotNone(loaded["FOO"].pattern.match("abc"))
+        self.assertIsNone(from_other_source)
+
+    def test_load_corrupt_index(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "abc.index")
+            save_index(
+                path, {"FOO": IndexedVariable("string", "HIDDEN", False)},
+                "digest")
+            with open(path) as f:
+                tampered = f.read().replace('"HIDDEN"', '"ADMIN_WRITEABLE"')
+            with open(path, "w") as f:
+                f.write(tampered)
+
+            self.assertIsNone(load_index(path, "digest"))
+            self.assertIsNone(
+                load_index(os.path.join(tmpdir, "missing"), "digest"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Minimal client for the GitHub REST API, used to resolve CiviForm versions to
+commits.
+
+Unauthenticated requests are limited to 60 per hour per IP address, which is
+easy to exhaust when several operators deploy from behind the same NAT. To
+stay under the limit:
+
+- All requests share one pooled requests.Session.
+- If the GITHUB_TOKEN environment variable is set, requests are
+  authenticated and get the much higher per-user limit.
+- The fields callers read from a response are cached on disk along with its
+  ETag. Later requests for the same URL send If-None-Match, and GitHub does
+  not count the resulting 304 Not Modified responses against the rate limit.
+  Only those fields are cached, since bodies such as commits include the
+  whole diff, and only for the MAX_ETAG_ENTRIES most recently cached URLs.
+"""
+
+import json
+import os
+from typing import Iterable, Optional, Tuple
+
+import requests
+
+from cloud.shared.bin.lib.cache import atomic_write, cache_dir
+
+
+class GitHubApi:
+
+    MAX_ETAG_ENTRIES = 256
+
+    def __init__(
+            self,
+            session: Optional[requests.Session] = None,
+            etag_cache_path: Optional[str] = None):
+        self._session = session
+        self._etag_cache_path = etag_cache_path
+        self._etag_cache = None
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            self._session = requests.Session()
+            self._session.headers["Accept"] = "application/vnd.github+json"
+            token = os.getenv("GITHUB_TOKEN")
+            if token:
+                self._session.headers["Authorization"] = f"Bearer {token}"
+        return self._session
+
+    def get_json(self, url: str, fields: Iterable[str]) -> Tuple[int, dict]:
+        """Returns the status code and decoded JSON body of a GET request.
+
+        fields are the top-level fields of the body the caller reads. A 304
+        Not Modified response is reported as a 200 with those fields, as
+        they were cached when the ETag was issued.
+        """
+        fields = list(fields)
+        cached = self._load_etag_cache().get(url)
+        if cached and not all(field in cached["body"] for field in fields):
+            cached = None
+        headers = {}
+        if cached:
+            headers["If-None-Match"] = cached["etag"]
+
+        response = self.session.get(url, headers=headers, timeout=30)
+        if response.status_code == 304 and cached:
+            return 200, cached["body"]
+
+        body = response.json()
+        if (response.status_code == 200 and response.headers.get("ETag") and
+                isinstance(body, dict)):
+            self._store_etag(
+                url, response.headers["ETag"],
+                {field: body[field] for field in fields if field in body})
+        return response.status_code, body
+
+    def _etag_cache_file(self) -> str:
+        if self._etag_cache_path is None:
+            self._etag_cache_path = os.path.join(
+                cache_dir("github"), "etags.json")
+        return self._etag_cache_path
+
+    def _load_etag_cache(self) -> dict:
+        if self._etag_cache is None:
+            try:
+                with open(self._etag_cache_file()) as f:
+                    self._etag_cache = json.load(f)
+            except (OSError, ValueError):
+                self._etag_cache = {}
+        return self._etag_cache
+
+    def _store_etag(self, url: str, etag: str, body: dict):
+        cache = self._load_etag_cache()
+        # Entries are kept in the order they were stored, so the first ones
+        # are the least recently cached.
+        cache.pop(url, None)
+        cache[url] = {"etag": etag, "body": body}
+        for stale_url in list(cache)[:-self.MAX_ETAG_ENTRIES]:
+            del cache[stale_url]
+        try:
+            atomic_write(
+                self._etag_cache_file(),
+                json.dumps(cache).encode("utf-8"))
+        except OSError:
+            # The cache is an optimization, failing to write it is not fatal.
+            pass
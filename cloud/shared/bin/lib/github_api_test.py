@@ -0,0 +1,96 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from cloud.shared.bin.lib.github_api import GitHubApi
+"""
+Tests for the GitHubApi client.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/shared/bin/lib/github_api_test.py
+"""
+
+URL = "https://api.github.com/repos/civiform/civiform/commits/920bc49"
+
+
+def response(status_code, body=None, etag=None):
+    r = MagicMock()
+    r.status_code = status_code
+    r.json.return_value = body
+    r.headers = {"ETag": etag} if etag else {}
+    return r
+
+
+class TestGitHubApi(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.etag_cache_path = os.path.join(self.tmpdir.name, "etags.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_revalidates_with_etag(self):
+        session = MagicMock()
+        session.get.return_value = response(200, {"sha": "abc"}, etag='"e1"')
+        GitHubApi(session, self.etag_cache_path).get_json(URL, ["sha"])
+
+        session = MagicMock()
+        session.get.return_value = response(304)
+        api = GitHubApi(session, self.etag_cache_path)
+        status_code, body = api.get_json(URL, ["sha"])
+
+        self.assertEqual((status_code, body), (200, {"sha": "abc"}))
+        self.assertEqual(
+            session.get.call_args.kwargs["headers"], {"If-None-Match": '"e1"'})
+
+    def test_only_read_fields_are_cached(self):
+        session = MagicMock()
+        commit = {"sha": "abc", "files": [{"patch": "x" * 10000}]}
+        session.get.return_value = response(200, commit, etag='"e1"')
+        GitHubApi(session, self.etag_cache_path).get_json(URL, ["sha"])
+
+        with open(self.etag_cache_path) as f:
+            entry = json.load(f)[URL]
+        self.assertEqual(entry, {"etag": '"e1"', "body": {"sha": "abc"}})
+
+        # A caller that reads other fields does not get the cached body.
+        session.get.return_value = response(200, {"files": []})
+        GitHubApi(session, self.etag_cache_path).get_json(URL, ["files"])
+        self.assertEqual(session.get.call_args.kwargs["headers"], {})
+
+    def test_least_recently_fetched_urls_are_evicted(self):
+        session = MagicMock()
+        session.get.return_value = response(200, {"sha": "abc"}, etag='"e1"')
+        api = GitHubApi(session, self.etag_cache_path)
+        api.MAX_ETAG_ENTRIES = 2
+
+        for url in ["a", "b", "a", "c"]:
+            api.get_json(url, ["sha"])
+
+        with open(self.etag_cache_path) as f:
+            self.assertEqual(list(json.load(f)), ["a", "c"])
+
+    def test_error_responses_are_not_cached(self):
+        session = MagicMock()
+        session.get.return_value = response(
+            404, {"message": "Not Found"}, etag='"e1"')
+        api = GitHubApi(session, self.etag_cache_path)
+
+        status_code, body = api.get_json(URL, ["sha"])
+
+        self.assertEqual(status_code, 404)
+        self.assertEqual(body, {"message": "Not Found"})
+        self.assertFalse(os.path.exists(self.etag_cache_path))
+
+    @patch.dict(os.environ, {"GITHUB_TOKEN": "secret-token"})
+    def test_uses_github_token(self):
+        api = GitHubApi(etag_cache_path=self.etag_cache_path)
+
+        self.assertEqual(
+            api.session.headers["Authorization"], "Bearer secret-token")
+
+
+if __name__ == "__main__":
+    unittest.main()
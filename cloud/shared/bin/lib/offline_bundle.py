@@ -0,0 +1,171 @@
+"""
+Offline bundles let a deployment run without access to GitHub or PyPI.
+
+A bundle is a gzipped tarball with the layout:
+
+  manifest.json                       {"version": 1, "tags": {tag: commit sha}}
+  env-var-docs/<commit sha>.json      env-var-docs.json at each commit
+  wheels/common/*.whl                 python dependencies of the deploy tool
+  wheels/<commit sha>/*.whl           env-var-docs parser built at each commit
+
+It is created on a machine with network access by
+cloud/shared/bin/offline_bundle.py export. Setting CIVIFORM_DEPLOY_BUNDLE to
+the path of a bundle makes the deploy tool offline: the bundle is imported
+into the local caches, see env_var_docs_cache.py and tag_resolution_cache.py,
+and tags or env-var-docs that are not in it are reported as errors instead of
+being fetched.
+"""
+
+import io
+import json
+import os
+import re
+import tarfile
+from typing import Dict, Optional
+
+from cloud.shared.bin.lib.env_var_docs_cache import EnvVarDocsCache
+from cloud.shared.bin.lib.print import print
+from cloud.shared.bin.lib.tag_resolution_cache import TagResolutionCache, is_full_commit_sha
+
+BUNDLE_ENV_VAR = "CIVIFORM_DEPLOY_BUNDLE"
+BUNDLE_VERSION = 1
+
+_MANIFEST_NAME = "manifest.json"
+_ENV_VAR_DOCS_MEMBER_REGEX = re.compile(r'^env-var-docs/([0-9a-f]{40})\.json$')
+_WHEEL_MEMBER_REGEX = re.compile(
+    r'^wheels/(common|[0-9a-f]{40})/([A-Za-z0-9_.+-]+\.whl)$')
+
+# Bundles imported by this process, keyed by path, mtime and size.
+_imported = set()
+
+
+class BundleError(Exception):
+    pass
+
+
+def bundle_path() -> Optional[str]:
+    return os.getenv(BUNDLE_ENV_VAR) or None
+
+
+def is_offline() -> bool:
+    return bundle_path() is not None
+
+
+def ensure_imported():
+    """Imports the bundle named by CIVIFORM_DEPLOY_BUNDLE into the local
+    caches, once per process."""
+    path = bundle_path()
+    if path is None:
+        return
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        exit(f"Could not read the offline bundle {path}: {e}")
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if key in _imported:
+        return
+    try:
+        import_bundle(path)
+    except (BundleError, OSError, tarfile.TarError) as e:
+        exit(f"Could not import the offline bundle {path}: {e}")
+    _imported.add(key)
+
+
+def export_bundle(
+        output_path: str, tags: Dict[str, str], env_var_docs: Dict[str, str],
+        wheel_dir: Optional[str]):
+    """Writes a bundle.
+
+    tags maps image tags to commit shas, env_var_docs maps commit shas to the
+    env-var-docs.json text. wheel_dir is a directory laid out like the wheels
+    directory of the bundle.
+    """
+    manifest = {"version": BUNDLE_VERSION, "tags": tags}
+    with tarfile.open(output_path, "w:gz") as tar:
+        _add_bytes(
+            tar, _MANIFEST_NAME,
+            json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+        for commit_sha, text in sorted(env_var_docs.items()):
+            _add_bytes(
+                tar, f"env-var-docs/{commit_sha}.json", text.encode("utf-8"))
+        if wheel_dir:
+            for subdir in sorted(os.listdir(wheel_dir)):
+                for name in sorted(os.listdir(os.path.join(wheel_dir, subdir))):
+                    arcname = f"wheels/{subdir}/{name}"
+                    if not _WHEEL_MEMBER_REGEX.match(arcname):
+                        raise BundleError(f"Unexpected wheel file {arcname}")
+                    tar.add(os.path.join(wheel_dir, subdir, name), arcname)
+
+
+def import_bundle(
+        path: str,
+        wheel_dir: Optional[str] = None,
+        env_var_docs_cache: Optional[EnvVarDocsCache] = None,
+        tag_resolution_cache: Optional[TagResolutionCache] = None) -> dict:
+    """Seeds the local caches from the bundle and returns its manifest. The
+    wheels are only extracted if wheel_dir is given.
+    """
+    env_var_docs_cache = env_var_docs_cache or EnvVarDocsCache()
+    tag_resolution_cache = tag_resolution_cache or TagResolutionCache()
+
+    with tarfile.open(path, "r:gz") as tar:
+        manifest = _read_manifest(tar)
+        for member in tar.getmembers():
+            if member.name == _MANIFEST_NAME or member.isdir():
+                continue
+            env_var_docs_match = _ENV_VAR_DOCS_MEMBER_REGEX.match(member.name)
+            wheel_match = _WHEEL_MEMBER_REGEX.match(member.name)
+            if not member.isfile() or not (env_var_docs_match or wheel_match):
+                raise BundleError(f"Unexpected member {member.name}")
+
+            if env_var_docs_match:
+                commit_sha = env_var_docs_match.group(1)
+                if env_var_docs_cache.get(commit_sha) is None:
+                    text = tar.extractfile(member).read().decode("utf-8")
+                    try:
+                        env_var_docs_cache.put(commit_sha, text)
+                    except ValueError as e:
+                        raise BundleError(
+                            f"env-var-docs.json for {commit_sha} is not valid json: {e}"
+                        )
+            elif wheel_dir:
+                destination = os.path.join(
+                    wheel_dir, wheel_match.group(1), wheel_match.group(2))
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                with tar.extractfile(member) as src, open(destination,
+                                                          "wb") as dst:
+                    dst.write(src.read())
+
+    for tag, commit_sha in manifest["tags"].items():
+        if tag_resolution_cache.get(tag) != commit_sha:
+            tag_resolution_cache.put(tag, commit_sha)
+
+    print(
+        f"Imported offline bundle {path} with tags {', '.join(sorted(manifest['tags'])) or 'none'}"
+    )
+    return manifest
+
+
+def _read_manifest(tar: tarfile.TarFile) -> dict:
+    try:
+        manifest = json.load(tar.extractfile(_MANIFEST_NAME))
+    except (KeyError, ValueError) as e:
+        raise BundleError(f"Missing or invalid {_MANIFEST_NAME}: {e}")
+    if not isinstance(manifest, dict):
+        raise BundleError(f"Unsupported bundle manifest {manifest}")
+    if manifest.get("version") != BUNDLE_VERSION:
+        raise BundleError(
+            f"Unsupported bundle version {manifest.get('version')}")
+    tags = manifest.get("tags")
+    if not isinstance(tags, dict) or not all(
+            isinstance(tag, str) and is_full_commit_sha(commit_sha)
+            for tag, commit_sha in tags.items()):
+        raise BundleError(f"Invalid tags in {_MANIFEST_NAME}: {tags}")
+    return manifest
+
+
+def _add_bytes(tar: tarfile.TarFile, name: str, data: bytes):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = 0o644
+    tar.addfile(info, io.BytesIO(data))
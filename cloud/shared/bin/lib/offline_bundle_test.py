@@ -0,0 +1,83 @@
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cloud.shared.bin.lib import offline_bundle
+from cloud.shared.bin.lib.config_loader import ConfigLoader
+from cloud.shared.bin.lib.env_var_docs_cache import EnvVarDocsCache
+from cloud.shared.bin.lib.tag_resolution_cache import TagResolutionCache
+"""
+Tests for offline bundles.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/shared/bin/lib/offline_bundle_test.py
+"""
+
+SHA = "0123456789abcdef0123456789abcdef01234567"
+
+
+class TestOfflineBundle(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+        self.bundle_path = os.path.join(self.tmpdir, "bundle.tgz")
+        env = patch.dict(
+            os.environ,
+            {"CIVIFORM_DEPLOY_CACHE_DIR": os.path.join(self.tmpdir, "cache")})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def test_export_then_import(self):
+        wheels = os.path.join(self.tmpdir, "wheels")
+        os.makedirs(os.path.join(wheels, SHA))
+        wheel = os.path.join(wheels, SHA, "env_var_docs-1.0-py3-none-any.whl")
+        with open(wheel, "w") as f:
+            f.write("wheel")
+        offline_bundle.export_bundle(
+            self.bundle_path, {"v1.0.0": SHA}, {SHA: '{"FOO": {}}'}, wheels)
+
+        extracted = os.path.join(self.tmpdir, "extracted")
+        manifest = offline_bundle.import_bundle(
+            self.bundle_path, wheel_dir=extracted)
+
+        self.assertEqual(manifest["tags"], {"v1.0.0": SHA})
+        self.assertEqual(TagResolutionCache().get("v1.0.0"), SHA)
+        self.assertEqual(EnvVarDocsCache().get(SHA), '{"FOO": {}}')
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(
+                    extracted, SHA, "env_var_docs-1.0-py3-none-any.whl")))
+
+    def test_import_rejects_unexpected_members(self):
+        with tarfile.open(self.bundle_path, "w:gz") as tar:
+            for name, data in [("manifest.json", b'{"version": 1, "tags": {}}'),
+                               ("../evil", b"")]:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+
+        with self.assertRaises(offline_bundle.BundleError):
+            offline_bundle.import_bundle(self.bundle_path)
+
+    @patch('cloud.shared.bin.lib.config_loader.ConfigLoader._fetch_json_val')
+    def test_offline_config_loader_only_resolves_bundled_tags(
+            self, mock_fetch_json_val):
+        offline_bundle.export_bundle(
+            self.bundle_path, {"v1.0.0": SHA}, {SHA: "{}"}, None)
+
+        with patch.dict(os.environ,
+                        {offline_bundle.BUNDLE_ENV_VAR: self.bundle_path}):
+            config_loader = ConfigLoader()
+            self.assertEqual(
+                config_loader._get_commit_sha_for_tag("v1.0.0"), SHA)
+            self.assertIsNone(config_loader._get_commit_sha_for_tag("v2.0.0"))
+
+        mock_fetch_json_val.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,233 @@
+"""
+Shared Terraform provider plugin cache.
+
+Without a plugin cache, every terraform init downloads the providers into the
+template's own .terraform directory, so the AWS provider is downloaded once
+for aws_oidc/setup, once for aws_oidc, and again in every new checkout. The
+deploy tool points TF_PLUGIN_CACHE_DIR at a directory in the local cache,
+see cache.py, so each provider version is only downloaded once per host.
+
+Terraform does not support concurrent writes to the plugin cache, so inits
+hold an exclusive lock on it. Inits that run in the background, see
+terraform.InitPrefetch, don't use the cache so that they don't block other
+inits. They only take the lock to add the providers they downloaded to the
+cache afterwards.
+
+The cache is bounded in size: when it grows beyond max_bytes, the least
+recently used provider versions are removed, except for the newest version of
+each provider. A provider version is used when it is in the lock file of a
+template that was initialized.
+
+If TF_PLUGIN_CACHE_DIR is already set, that directory is used as is and is
+never evicted from. Set CIVIFORM_TERRAFORM_PLUGIN_CACHE=false to not use a
+plugin cache at all, and CIVIFORM_TERRAFORM_PLUGIN_CACHE_MAX_MB to change its
+size limit.
+"""
+
+import contextlib
+import fcntl
+import os
+import re
+import shutil
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+from cloud.shared.bin.lib.cache import cache_dir
+from cloud.shared.bin.lib.print import print
+
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# The environment variables that make terraform use the cache.
+ENVIRONMENT_VARIABLES = [
+    "TF_PLUGIN_CACHE_DIR", "TF_PLUGIN_CACHE_MAY_BREAK_DEPENDENCY_LOCK_FILE"
+]
+
+_LOCK_FILE_PROVIDER_REGEX = re.compile(
+    r'provider\s+"([^"]+)"\s*{[^}]*?version\s*=\s*"([^"]+)"', re.DOTALL)
+
+
+class PluginCache:
+
+    def __init__(
+            self,
+            directory: Optional[str] = None,
+            max_bytes: int = DEFAULT_MAX_BYTES,
+            managed: bool = True):
+        self.directory = directory or cache_dir("terraform-plugins")
+        self.max_bytes = max_bytes
+        self.managed = managed
+        """Whether the deploy tool owns the directory and may evict from it."""
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Holds the exclusive cache lock in the block."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def use(self):
+        """Makes terraform commands run in the block use the cache, and holds
+        the cache lock while they run."""
+        with self.lock():
+            # The environment is only changed while holding the lock, so
+            # inits running on other threads don't restore it underneath
+            # each other.
+            previous = {
+                name: os.environ.get(name) for name in ENVIRONMENT_VARIABLES
+            }
+            os.environ.update(
+                {
+                    "TF_PLUGIN_CACHE_DIR": self.directory,
+                    # The lock files are not checked in, so Terraform would
+                    # otherwise ignore the cache for every template that has
+                    # not been initialized yet.
+                    "TF_PLUGIN_CACHE_MAY_BREAK_DEPENDENCY_LOCK_FILE": "true",
+                })
+            try:
+                yield
+            finally:
+                for name, value in previous.items():
+                    if value is None:
+                        os.environ.pop(name, None)
+                    else:
+                        os.environ[name] = value
+
+    def add_installed(self, terraform_template_dir: str) -> List[str]:
+        """Copies the provider versions that terraform init installed in the
+        template's .terraform directory into the cache, unless they are
+        cached already, and returns the added directories. Hold the lock
+        while calling it."""
+        providers_dir = os.path.join(
+            terraform_template_dir, ".terraform", "providers")
+        added = []
+        # Laid out like the cache, see _versions.
+        for version_dir in _walk_dirs(providers_dir, 4):
+            target = os.path.join(
+                self.directory, os.path.relpath(version_dir, providers_dir))
+            if os.path.exists(target):
+                continue
+            # Copied next to the cache and then renamed, so the cache never
+            # has a partial provider.
+            tmpdir = tempfile.mkdtemp(prefix=".add-", dir=self.directory)
+            try:
+                copy = os.path.join(tmpdir, "version")
+                shutil.copytree(version_dir, copy)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.rename(copy, target)
+            finally:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+            added.append(target)
+        return added
+
+    def record_use(self, lock_file_path: str):
+        """Marks the provider versions in the lock file as used."""
+        try:
+            with open(lock_file_path) as f:
+                content = f.read()
+        except OSError:
+            return
+        versions = self._versions()
+        for provider, version in _LOCK_FILE_PROVIDER_REGEX.findall(content):
+            path = versions.get((provider, version))
+            if path:
+                os.utime(path)
+
+    def size(self) -> int:
+        return sum(_tree_size(path) for path in self._versions().values())
+
+    def evict(self) -> List[str]:
+        """Removes provider versions until the cache fits in max_bytes, and
+        returns the removed directories."""
+        if not self.managed:
+            return []
+        versions = self._versions()
+        sizes = {key: _tree_size(path) for key, path in versions.items()}
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return []
+
+        newest = {}
+        for provider, version in versions:
+            if provider not in newest or _version_key(version) > _version_key(
+                    newest[provider]):
+                newest[provider] = version
+        candidates = sorted(
+            [key for key in versions if newest[key[0]] != key[1]],
+            key=lambda key: os.stat(versions[key]).st_mtime)
+
+        removed = []
+        for key in candidates:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(versions[key], ignore_errors=True)
+            total -= sizes[key]
+            removed.append(versions[key])
+        if removed:
+            print(
+                f" - Removed {len(removed)} old provider versions from the plugin cache {self.directory}"
+            )
+        return removed
+
+    def _versions(self) -> Dict[Tuple[str, str], str]:
+        """Returns the version directories in the cache, keyed by provider
+        address and version. The cache is laid out as
+        <hostname>/<namespace>/<type>/<version>/<os>_<arch>."""
+        versions = {}
+        for provider_dir in _walk_dirs(self.directory, 3):
+            for version in os.listdir(provider_dir):
+                path = os.path.join(provider_dir, version)
+                if os.path.isdir(path):
+                    provider = os.path.relpath(provider_dir, self.directory)
+                    versions[(provider, version)] = path
+        return versions
+
+
+def from_environment() -> Optional[PluginCache]:
+    """Returns the plugin cache to use, or None if it is disabled."""
+    if os.getenv("CIVIFORM_TERRAFORM_PLUGIN_CACHE", "").lower() == "false":
+        return None
+    user_directory = os.getenv("TF_PLUGIN_CACHE_DIR")
+    # The managed directory is in the environment while another thread uses
+    # the cache.
+    if user_directory and user_directory != cache_dir("terraform-plugins"):
+        return PluginCache(user_directory, managed=False)
+    max_mb = os.getenv("CIVIFORM_TERRAFORM_PLUGIN_CACHE_MAX_MB")
+    if max_mb:
+        return PluginCache(max_bytes=int(max_mb) * 1024 * 1024)
+    return PluginCache()
+
+
+def _walk_dirs(directory: str, depth: int):
+    """Yields the directories exactly depth levels below directory."""
+    if depth == 0:
+        yield directory
+        return
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(directory, name)
+        if not name.startswith(".") and os.path.isdir(path):
+            yield from _walk_dirs(path, depth - 1)
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            if not os.path.islink(file_path):
+                total += os.path.getsize(file_path)
+    return total
+
+
+def _version_key(version: str) -> Tuple:
+    return tuple(
+        int(part) if part.isdigit() else 0
+        for part in re.split(r'[.-]', version))
@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cloud.shared.bin.lib.plugin_cache import PluginCache
+"""
+Tests for the Terraform provider plugin cache.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/shared/bin/lib/plugin_cache_test.py
+"""
+
+AWS = os.path.join("registry.terraform.io", "hashicorp", "aws")
+
+
+class TestPluginCache(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.directory = tmpdir.name
+
+    def _add_version(self, version, size, mtime):
+        version_dir = os.path.join(self.directory, AWS, version)
+        os.makedirs(os.path.join(version_dir, "linux_amd64"))
+        with open(os.path.join(version_dir, "linux_amd64", "provider"),
+                  "wb") as f:
+            f.write(b"x" * size)
+        os.utime(version_dir, (mtime, mtime))
+        return version_dir
+
+    def test_evicts_least_recently_used_but_keeps_newest(self):
+        oldest = self._add_version("5.9.0", 100, 1)
+        used = self._add_version("5.10.0", 100, 2)
+        newest = self._add_version("5.31.0", 100, 3)
+        # The newest version is kept even though it is the least recently used.
+        os.utime(newest, (0, 0))
+        cache = PluginCache(self.directory, max_bytes=200)
+
+        self.assertEqual(cache.size(), 300)
+        self.assertEqual(cache.evict(), [oldest])
+        self.assertTrue(os.path.exists(used))
+        self.assertTrue(os.path.exists(newest))
+
+    def test_record_use_from_lock_file(self):
+        old = self._add_version("5.9.0", 100, 1)
+        self._add_version("5.10.0", 100, 2)
+        self._add_version("5.31.0", 100, 3)
+        lock_file = os.path.join(self.directory, "lock.hcl")
+        with open(lock_file, "w") as f:
+            f.write(
+                'provider "registry.terraform.io/hashicorp/aws" {\n  version     = "5.9.0"\n  constraints = ">= 5.0"\n}\n'
+            )
+        cache = PluginCache(self.directory, max_bytes=200)
+
+        cache.record_use(lock_file)
+
+        self.assertEqual(
+            cache.evict(), [os.path.join(self.directory, AWS, "5.10.0")])
+        self.assertTrue(os.path.exists(old))
+
+    def test_unmanaged_cache_is_not_evicted(self):
+        self._add_version("5.9.0", 100, 1)
+        self._add_version("5.31.0", 100, 3)
+        cache = PluginCache(self.directory, max_bytes=0, managed=False)
+
+        self.assertEqual(cache.evict(), [])
+
+    def test_add_installed_providers(self):
+        cached = self._add_version("5.9.0", 100, 1)
+        template_dir = os.path.join(self.directory, "template")
+        providers_dir = os.path.join(template_dir, ".terraform", "providers")
+        for version in ["5.9.0", "5.31.0"]:
+            platform_dir = os.path.join(
+                providers_dir, AWS, version, "linux_amd64")
+            os.makedirs(platform_dir)
+            with open(os.path.join(platform_dir, "provider"), "w") as f:
+                f.write(version)
+        cache = PluginCache(self.directory)
+
+        added = cache.add_installed(template_dir)
+
+        self.assertEqual(added, [os.path.join(self.directory, AWS, "5.31.0")])
+        with open(os.path.join(added[0], "linux_amd64", "provider")) as f:
+            self.assertEqual(f.read(), "5.31.0")
+        # Cached versions are not copied again.
+        with open(os.path.join(cached, "linux_amd64", "provider")) as f:
+            self.assertEqual(f.read(), "x" * 100)
+        # The temporary copies are removed.
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            ["registry.terraform.io", "template"])
+
+    def test_use_sets_environment(self):
+        cache = PluginCache(self.directory)
+        with patch.dict(os.environ, {}, clear=False):
+            os.environ.pop("TF_PLUGIN_CACHE_DIR", None)
+            with cache.use():
+                self.assertEqual(
+                    os.environ["TF_PLUGIN_CACHE_DIR"], self.directory)
+            self.assertNotIn("TF_PLUGIN_CACHE_DIR", os.environ)
+
+
+if __name__ == "__main__":
+    unittest.main()
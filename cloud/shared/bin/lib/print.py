@@ -1,8 +1,14 @@
 import builtins
 import sys
+import threading
+
+_lock = threading.Lock()
 
 
 def print(*args, **kwargs):
     kwargs["file"] = sys.stderr
     kwargs["flush"] = True
-    builtins.print(*args, **kwargs)
+    # Terraform output can be printed from several threads, don't let their
+    # lines run into each other.
+    with _lock:
+        builtins.print(*args, **kwargs)
@@ -0,0 +1,48 @@
+"""
+The result of resolving a CiviForm image tag to the commit it was built from.
+
+cloud/shared/bin/run resolves the tag once, through resolve_tag.py, and
+passes the result to run.py in a file so the tag is not resolved a second
+time by the ConfigLoader.
+"""
+
+import dataclasses
+import json
+import re
+from typing import Optional
+
+RELEASE_TAG_REGEX = re.compile(r'^v?[0-9]+\.[0-9]+\.[0-9]+$')
+
+
+def is_snapshot_tag(tag: str) -> bool:
+    """Snapshot and dev tags, e.g. "SNAPSHOT-920bc49-1685642238", embed the
+    short sha of the commit the image was built from."""
+    return tag.startswith("SNAPSHOT") or tag.startswith("DEV")
+
+
+def is_release_tag(tag: str) -> bool:
+    return bool(RELEASE_TAG_REGEX.match(tag))
+
+
+def normalize_tag(tag: str) -> str:
+    """Adds the "v" prefix to release tags that are missing it."""
+    if is_release_tag(tag) and not tag[0] == 'v':
+        return f'v{tag}'
+    return tag
+
+
+@dataclasses.dataclass
+class ResolvedTag:
+    tag: str
+    short_sha: str
+    commit_sha: str
+    image_digest: Optional[str] = None
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(dataclasses.asdict(self), f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "ResolvedTag":
+        with open(path) as f:
+            return cls(**json.load(f))
@@ -0,0 +1,199 @@
+"""
+Waiting for, and releasing stale, Terraform state locks.
+
+By default, a command that can't acquire the state lock asks whether to
+force-unlock it, or exits with instructions when not run interactively. Set
+TERRAFORM_LOCK_WAIT_MINUTES to wait for the lock instead, e.g. when several
+deploys are queued. The plan is retried with -lock-timeout, doubling the
+timeout on each attempt, until the lock is acquired or the wait is over.
+
+Before each attempt, the lock is inspected and released if it is provably
+stale: it was taken by the current user on this host, and no terraform
+process is running on it. That is only checked outside of containers, since
+processes in other containers are not visible from inside one, even when the
+containers share a hostname.
+
+A lock older than TERRAFORM_STALE_LOCK_MINUTES, if that is set, was likely
+abandoned. The command stops waiting for it and reports it, but doesn't
+release it, since an apply can take longer than expected, e.g. a PostgreSQL
+upgrade.
+"""
+
+import datetime
+import json
+import os
+import pwd
+import re
+import socket
+import subprocess
+import time
+from typing import Optional
+
+WAIT_ENV_VAR = 'TERRAFORM_LOCK_WAIT_MINUTES'
+STALE_ENV_VAR = 'TERRAFORM_STALE_LOCK_MINUTES'
+
+INITIAL_TIMEOUT_SECONDS = 30
+MAX_TIMEOUT_SECONDS = 5 * 60
+
+_LOCK_ID_REGEX = re.compile(
+    r'ID:\s+([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})')
+_LOCK_INFO_FIELD_REGEX = re.compile(
+    r'^\s*(ID|Path|Operation|Who|Version|Created):\s*(.*)$', re.MULTILINE)
+
+# The inode of the initial PID namespace, see PROC_PID_INIT_INO in the Linux
+# kernel.
+_INITIAL_PID_NAMESPACE = 'pid:[4026531836]'
+
+
+class LockInfo:
+    """The lock info terraform stores with a state lock."""
+
+    def __init__(
+            self,
+            id: str,
+            who: str = '',
+            operation: str = '',
+            created: Optional[datetime.datetime] = None):
+        self.id = id
+        self.who = who
+        self.operation = operation
+        self.created = created
+
+    @staticmethod
+    def from_json(text: str) -> Optional['LockInfo']:
+        """Parses the Info attribute of the lock item in the lock table."""
+        try:
+            info = json.loads(text)
+        except ValueError:
+            return None
+        if not isinstance(info, dict) or not info.get('ID'):
+            return None
+        return LockInfo(
+            info['ID'], info.get('Who', ''), info.get('Operation', ''),
+            _parse_created(info.get('Created', '')))
+
+    @staticmethod
+    def from_error_output(output: str) -> Optional['LockInfo']:
+        """Parses the Lock Info that terraform prints when it can't acquire
+        the lock."""
+        fields = dict(_LOCK_INFO_FIELD_REGEX.findall(output))
+        match = _LOCK_ID_REGEX.search(output)
+        if not match:
+            return None
+        return LockInfo(
+            match.group(1),
+            fields.get('Who', '').strip(),
+            fields.get('Operation', '').strip(),
+            _parse_created(fields.get('Created', '').strip()))
+
+    def age(self, now=None) -> Optional[datetime.timedelta]:
+        """Returns how long before now, by default the current time, the lock
+        was taken, or None if that is unknown."""
+        if self.created is None:
+            return None
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        return now - self.created
+
+    def describe(self) -> str:
+        age = self.age()
+        since = f', {int(age.total_seconds() // 60)} minutes ago' if age else ''
+        return f'{self.id} held by {self.who or "unknown"} for {self.operation or "an unknown operation"}{since}'
+
+
+def stale_reason(lock: LockInfo, who: Optional[str] = None) -> Optional[str]:
+    """Returns why the lock is provably stale, or None if it may still be
+    held by a running terraform process. who defaults to how terraform
+    identifies the current user and host in locks."""
+    who = who or current_who()
+    if (lock.who and lock.who == who and _in_initial_pid_namespace() and
+            not _terraform_running()):
+        return f'it was taken by {who} and no terraform process is running on this host'
+    return None
+
+
+def is_overdue(
+        lock: LockInfo,
+        stale_after: Optional[datetime.timedelta],
+        now: Optional[datetime.datetime] = None) -> bool:
+    """Returns whether the lock is older than stale_after, and likely
+    abandoned."""
+    age = lock.age(now)
+    return stale_after is not None and age is not None and age > stale_after
+
+
+def current_who() -> str:
+    """Returns the Who of the locks terraform takes as the current user."""
+    return f'{pwd.getpwuid(os.getuid()).pw_name}@{socket.gethostname()}'
+
+
+def stale_after_from_environment() -> Optional[datetime.timedelta]:
+    minutes = os.getenv(STALE_ENV_VAR)
+    return datetime.timedelta(minutes=float(minutes)) if minutes else None
+
+
+class LockWait:
+    """Tracks how long to wait for the lock on the next attempt."""
+
+    def __init__(self, minutes: float, clock=time.monotonic):
+        self._clock = clock
+        self._deadline = clock() + minutes * 60
+        self._timeout = INITIAL_TIMEOUT_SECONDS
+
+    @staticmethod
+    def from_environment() -> Optional['LockWait']:
+        minutes = os.getenv(WAIT_ENV_VAR)
+        return LockWait(float(minutes)) if minutes else None
+
+    def next_timeout(self) -> Optional[int]:
+        """Returns the -lock-timeout in seconds for the next attempt, or None
+        when the wait is over."""
+        remaining = self._deadline - self._clock()
+        if remaining <= 0:
+            return None
+        timeout = int(min(self._timeout, remaining)) or 1
+        self._timeout = min(self._timeout * 2, MAX_TIMEOUT_SECONDS)
+        return timeout
+
+
+def _parse_created(text: str) -> Optional[datetime.datetime]:
+    """Parses the creation time of a lock. Terraform writes it as RFC 3339
+    in the lock table, and like 2024-01-02 03:04:05.678 +0000 UTC in its
+    output."""
+    text = text.strip()
+    match = re.match(
+        r'^(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})(?:\.\d+)?\s*(Z|[+-]\d{2}:?\d{2})?',
+        text)
+    if not match:
+        return None
+    offset = (match.group(3) or 'Z').replace('Z', '+00:00')
+    if ':' not in offset:
+        offset = offset[:3] + ':' + offset[3:]
+    try:
+        return datetime.datetime.fromisoformat(
+            f'{match.group(1)}T{match.group(2)}{offset}')
+    except ValueError:
+        return None
+
+
+def _in_initial_pid_namespace() -> bool:
+    """Returns whether this process is in the initial PID namespace rather
+    than in a container, so that it sees all processes on the host."""
+    try:
+        return os.readlink('/proc/self/ns/pid') == _INITIAL_PID_NAMESPACE
+    except FileNotFoundError:
+        # No PID namespaces, e.g. on macOS.
+        return not os.path.exists('/proc/self')
+    except OSError:
+        return False
+
+
+def _terraform_running() -> bool:
+    """Returns whether a terraform process is running on this host. Assumes
+    one is if that can't be determined."""
+    try:
+        return subprocess.run(
+            ['pgrep', '-x', 'terraform'],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL).returncode != 1
+    except OSError:
+        return True
@@ -0,0 +1,126 @@
+import datetime
+import json
+import unittest
+from unittest.mock import patch
+
+from cloud.shared.bin.lib import state_lock
+"""
+Tests for state_lock.py.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/shared/bin/lib/state_lock_test.py
+"""
+
+LOCK_ID = "0b8d6b6e-8b8e-4d5a-9a3c-2f1e6f4f1a2b"
+NOW = datetime.datetime(2024, 5, 1, 12, 0, tzinfo=datetime.timezone.utc)
+
+ERROR_OUTPUT = f"""
+Error: Error acquiring the state lock
+
+Error message: ConditionalCheckFailedException: The conditional request failed
+Lock Info:
+  ID:        {LOCK_ID}
+  Path:      prefix-civiform-backendstate/tfstate/terraform.tfstate
+  Operation: OperationTypeApply
+  Who:       runner@ci-host
+  Version:   1.5.7
+  Created:   2024-05-01 10:30:00.123456 +0000 UTC
+  Info:
+"""
+
+
+class TestLockInfo(unittest.TestCase):
+
+    def test_from_json(self):
+        lock = state_lock.LockInfo.from_json(
+            json.dumps(
+                {
+                    "ID": LOCK_ID,
+                    "Operation": "OperationTypePlan",
+                    "Who": "deployer@laptop",
+                    "Created": "2024-05-01T11:45:00.5Z"
+                }))
+
+        self.assertEqual(lock.id, LOCK_ID)
+        self.assertEqual(lock.who, "deployer@laptop")
+        self.assertEqual(lock.age(NOW), datetime.timedelta(minutes=15))
+
+    def test_from_json_invalid(self):
+        self.assertIsNone(state_lock.LockInfo.from_json("not json"))
+        self.assertIsNone(state_lock.LockInfo.from_json("{}"))
+
+    def test_from_error_output(self):
+        lock = state_lock.LockInfo.from_error_output(ERROR_OUTPUT)
+
+        self.assertEqual(lock.id, LOCK_ID)
+        self.assertEqual(lock.who, "runner@ci-host")
+        self.assertEqual(lock.operation, "OperationTypeApply")
+        self.assertEqual(lock.age(NOW), datetime.timedelta(minutes=90))
+
+
+@patch(
+    'cloud.shared.bin.lib.state_lock._in_initial_pid_namespace',
+    return_value=True)
+@patch('cloud.shared.bin.lib.state_lock._terraform_running', return_value=False)
+class TestStaleReason(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = state_lock.LockInfo.from_error_output(ERROR_OUTPUT)
+
+    def test_own_lock_without_terraform_is_stale(
+            self, mock_running, mock_namespace):
+        self.assertIsNotNone(
+            state_lock.stale_reason(self.lock, who="runner@ci-host"))
+
+    def test_own_lock_with_terraform_is_not_stale(
+            self, mock_running, mock_namespace):
+        mock_running.return_value = True
+
+        self.assertIsNone(
+            state_lock.stale_reason(self.lock, who="runner@ci-host"))
+
+    def test_other_users_lock_is_not_stale(self, mock_running, mock_namespace):
+        # Processes of other users, e.g. in a container sharing the
+        # hostname, may not be visible.
+        self.assertIsNone(
+            state_lock.stale_reason(self.lock, who="deployer@ci-host"))
+        self.assertIsNone(
+            state_lock.stale_reason(self.lock, who="runner@laptop"))
+
+    def test_own_lock_in_container_is_not_stale(
+            self, mock_running, mock_namespace):
+        mock_namespace.return_value = False
+
+        self.assertIsNone(
+            state_lock.stale_reason(self.lock, who="runner@ci-host"))
+
+    def test_old_lock_is_not_stale(self, mock_running, mock_namespace):
+        self.assertIsNone(
+            state_lock.stale_reason(self.lock, who="deployer@laptop"))
+        self.assertTrue(
+            state_lock.is_overdue(
+                self.lock, datetime.timedelta(hours=1), now=NOW))
+        self.assertFalse(
+            state_lock.is_overdue(
+                self.lock, datetime.timedelta(hours=2), now=NOW))
+        self.assertFalse(state_lock.is_overdue(self.lock, None, now=NOW))
+
+
+class TestLockWait(unittest.TestCase):
+
+    def test_timeouts_double_until_the_wait_is_over(self):
+        now = [0]
+        lock_wait = state_lock.LockWait(5, clock=lambda: now[0])
+
+        timeouts = []
+        while True:
+            timeout = lock_wait.next_timeout()
+            if timeout is None:
+                break
+            timeouts.append(timeout)
+            now[0] += timeout
+
+        self.assertEqual(timeouts, [30, 60, 120, 90])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Persistent cache of CiviForm image tag to commit SHA resolutions.
+
+Most tags can never point to a different commit: snapshot tags such as
+"SNAPSHOT-920bc49-1685642238" embed the commit they were built from, and
+release tags such as "v1.24.0" are never moved. Those resolutions are cached
+permanently. Any other ref is treated as mutable and its resolution expires
+after MUTABLE_REF_TTL_SECONDS.
+"""
+
+import json
+import os
+import re
+import time
+from typing import Optional
+
+from cloud.shared.bin.lib.cache import atomic_write, cache_dir
+from cloud.shared.bin.lib.color import yellow
+from cloud.shared.bin.lib.print import print
+from cloud.shared.bin.lib.resolved_tag import is_release_tag
+
+_FULL_COMMIT_SHA_REGEX = re.compile(r'^[0-9a-f]{40}$')
+
+MUTABLE_REF_TTL_SECONDS = 60 * 60
+
+
+def is_immutable_tag(tag: str) -> bool:
+    return tag.startswith("SNAPSHOT-") or tag.startswith(
+        "DEV-") or is_release_tag(tag)
+
+
+def is_full_commit_sha(commit_sha: Optional[str]) -> bool:
+    return isinstance(commit_sha, str) and bool(
+        _FULL_COMMIT_SHA_REGEX.match(commit_sha))
+
+
+class TagResolutionCache:
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path
+        self._entries = None
+
+    @property
+    def path(self) -> str:
+        if self._path is None:
+            self._path = os.path.join(cache_dir("tags"), "tags.json")
+        return self._path
+
+    def get(self, tag: str) -> Optional[str]:
+        """Returns the cached commit SHA for the tag, or None if the tag has
+        not been resolved before or its resolution has expired.
+        """
+        entry = self._load().get(tag)
+        if entry is None:
+            return None
+
+        if not isinstance(entry, dict) or not is_full_commit_sha(
+                entry.get("sha")) or not isinstance(entry.get("resolved_at"),
+                                                    (int, float)):
+            print(
+                yellow(
+                    f"Ignoring invalid cached commit sha for tag {tag}: {entry}. It will be resolved again."
+                ))
+            self._remove(tag)
+            return None
+
+        if not is_immutable_tag(tag) and time.time(
+        ) - entry["resolved_at"] > MUTABLE_REF_TTL_SECONDS:
+            return None
+
+        return entry["sha"]
+
+    def put(self, tag: str, commit_sha: str):
+        if not is_full_commit_sha(commit_sha):
+            raise ValueError(
+                f"Refusing to cache '{commit_sha}' for tag {tag}, it is not a full commit sha"
+            )
+        entries = self._load()
+        entries[tag] = {"sha": commit_sha, "resolved_at": time.time()}
+        self._save(entries)
+
+    def _remove(self, tag: str):
+        entries = self._load()
+        entries.pop(tag, None)
+        self._save(entries)
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except ValueError:
+                print(
+                    yellow(
+                        f"Tag resolution cache {self.path} is corrupt, ignoring it."
+                    ))
+                self._entries = {}
+            if not isinstance(self._entries, dict):
+                self._entries = {}
+        return self._entries
+
+    def _save(self, entries: dict):
+        try:
+            atomic_write(
+                self.path,
+                json.dumps(entries, indent=2, sort_keys=True).encode("utf-8"))
+        except OSError as e:
+            print(f"Could not write tag resolution cache {self.path}: {e}")
@@ -0,0 +1,77 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cloud.shared.bin.lib.tag_resolution_cache import (
+    MUTABLE_REF_TTL_SECONDS, TagResolutionCache, is_immutable_tag)
+"""
+Tests for the TagResolutionCache.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/shared/bin/lib/tag_resolution_cache_test.py
+"""
+
+COMMIT_SHA = "920bc49" + "0" * 33
+
+
+class TestTagResolutionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "tags.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_is_immutable_tag(self):
+        self.assertTrue(is_immutable_tag("v1.24.0"))
+        self.assertTrue(is_immutable_tag("1.24.0"))
+        self.assertTrue(is_immutable_tag("SNAPSHOT-920bc49-1685642238"))
+        self.assertTrue(is_immutable_tag("DEV-920bc49-some-branch-name"))
+        self.assertFalse(is_immutable_tag("main"))
+
+    def test_put_then_get_from_new_instance(self):
+        TagResolutionCache(self.path).put("v1.24.0", COMMIT_SHA)
+
+        self.assertEqual(
+            TagResolutionCache(self.path).get("v1.24.0"), COMMIT_SHA)
+
+    def test_immutable_tag_never_expires(self):
+        cache = TagResolutionCache(self.path)
+        cache.put("SNAPSHOT-920bc49-1685642238", COMMIT_SHA)
+
+        with patch("time.time", return_value=2**40):
+            self.assertEqual(
+                cache.get("SNAPSHOT-920bc49-1685642238"), COMMIT_SHA)
+
+    def test_mutable_ref_expires(self):
+        cache = TagResolutionCache(self.path)
+        with patch("time.time", return_value=1000):
+            cache.put("main", COMMIT_SHA)
+
+        with patch("time.time",
+                   return_value=1000 + MUTABLE_REF_TTL_SECONDS - 1):
+            self.assertEqual(cache.get("main"), COMMIT_SHA)
+        with patch("time.time",
+                   return_value=1000 + MUTABLE_REF_TTL_SECONDS + 1):
+            self.assertIsNone(cache.get("main"))
+
+    def test_refuses_to_cache_invalid_sha(self):
+        with self.assertRaises(ValueError):
+            TagResolutionCache(self.path).put("v1.24.0", "abc123")
+
+    @patch("cloud.shared.bin.lib.tag_resolution_cache.print")
+    def test_invalid_entry_is_reported_and_removed(self, mock_print):
+        with open(self.path, "w") as f:
+            json.dump({"v1.24.0": {"sha": "not-a-sha", "resolved_at": 1000}}, f)
+
+        cache = TagResolutionCache(self.path)
+        self.assertIsNone(cache.get("v1.24.0"))
+        self.assertIn("invalid cached commit sha", mock_print.call_args[0][0])
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
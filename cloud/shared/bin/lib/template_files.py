@@ -0,0 +1,47 @@
+"""
+Lists the files that make up a Terraform template: the files in the template
+directory and in the local modules it references, recursively.
+"""
+
+import os
+import re
+from typing import Iterable, Iterator
+
+# Files and directories in a template directory that Terraform or the deploy
+# tool write to, and that do not change what is deployed.
+IGNORED_NAMES = frozenset(
+    [
+        ".terraform", "__pycache__", "terraform_plan", "terraform.tfstate",
+        "terraform.tfstate.backup", ".terraform.tfstate.lock.info"
+    ])
+
+_LOCAL_MODULE_SOURCE_REGEX = re.compile(
+    r'^\s*source\s*=\s*"(\.\.?/[^"]+)"', re.MULTILINE)
+
+
+def walk(directory: str, excluded: Iterable[str] = ()) -> Iterator[str]:
+    """Yields the paths of the files in the template. Names in excluded are
+    skipped in the top level of the template directory only."""
+    excluded = set(excluded)
+    seen_dirs = set()
+    pending_dirs = [directory]
+    while pending_dirs:
+        current = os.path.normpath(pending_dirs.pop())
+        if current in seen_dirs:
+            continue
+        seen_dirs.add(current)
+
+        for root, dirs, files in os.walk(current):
+            dirs[:] = sorted(d for d in dirs if d not in IGNORED_NAMES)
+            for name in sorted(files):
+                if name in IGNORED_NAMES or (root == current and
+                                             name in excluded):
+                    continue
+                path = os.path.join(root, name)
+                yield path
+                if name.endswith(".tf"):
+                    with open(path) as f:
+                        for source in _LOCAL_MODULE_SOURCE_REGEX.findall(
+                                f.read()):
+                            pending_dirs.append(os.path.join(root, source))
+        excluded = set()
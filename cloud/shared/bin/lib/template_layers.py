@@ -0,0 +1,175 @@
+"""
+Layers of a Terraform template, so a deploy can apply only the layers whose
+inputs changed.
+
+A template opts in with a layers.json file that lists its layers in
+dependency order, and the .tf files of each layer:
+
+  {"layers": [{"name": "network", "files": ["vpc.tf"]}, ...]}
+
+Every .tf file with resources, data sources or modules must be in a layer.
+The inputs of a layer are the variables its blocks reference, directly or
+through locals. A layer depends on the layers of the resources, data sources
+and modules its blocks reference, and must come after them; a manifest that
+lists a layer before one it depends on is rejected. When some variables
+changed, the layers that use one of them and all the layers that depend on
+those, directly or not, are applied with -target. A change to a variable
+that no layer uses, or that a provider reads, needs a full apply.
+
+All layers share one state, so targeting a layer still refreshes the
+resources it depends on in earlier layers, but not the unrelated resources.
+"""
+
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Set
+
+from cloud.shared.bin.lib import terraform_variables
+
+LAYERS_FILENAME = 'layers.json'
+
+_LocalValues = Dict[str, Set[str]]
+
+
+class LayerError(Exception):
+    pass
+
+
+class Layer:
+
+    def __init__(self, name: str, files: List[str]):
+        self.name = name
+        self.files = files
+        self.addresses: List[str] = []
+        """Addresses of the resources, data sources and modules to target."""
+        self.variables: Set[str] = set()
+        """Names of the variables the layer uses."""
+        self.dependencies: Set[str] = set()
+        """Names of the other layers whose blocks the layer references."""
+
+
+class TemplateLayers:
+
+    def __init__(self, layers: List[Layer], global_variables: Set[str]):
+        self.layers = layers
+        """The layers in dependency order."""
+        self.global_variables = global_variables
+        """Variables that blocks outside of layers use, like providers."""
+
+    def affected(self,
+                 changed_variables: Iterable[str]) -> Optional[List[Layer]]:
+        """Returns the layers to apply for the changed variables, or None if
+        the whole template must be applied."""
+        changed_variables = set(changed_variables)
+        used = set().union(*(layer.variables for layer in self.layers))
+        if not changed_variables or changed_variables - used:
+            return None
+        if changed_variables & self.global_variables:
+            return None
+        affected = set()
+        # Dependencies come first, so one pass finds indirect dependents too.
+        for layer in self.layers:
+            if (layer.variables & changed_variables or
+                    layer.dependencies & affected):
+                affected.add(layer.name)
+        return [layer for layer in self.layers if layer.name in affected]
+
+
+def load(template_dir: str) -> Optional[TemplateLayers]:
+    """Returns the layers of the template, or None if the template has no
+    layers.json."""
+    try:
+        with open(os.path.join(template_dir, LAYERS_FILENAME)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        raise LayerError(f'{LAYERS_FILENAME} is not valid JSON: {e}')
+
+    layers = [
+        Layer(layer['name'], layer['files'])
+        for layer in manifest.get('layers', [])
+    ]
+    layer_by_file = {file: layer for layer in layers for file in layer.files}
+
+    try:
+        blocks = terraform_variables.load_blocks(template_dir)
+    except terraform_variables.ParseError as e:
+        raise LayerError(f'could not parse the template: {e}')
+    local_values = _local_references(blocks)
+    global_variables = set()
+    layer_by_address = {}
+    for block in blocks:
+        if block.type in ('provider', 'terraform'):
+            global_variables |= _variables(
+                _resolve(block.references, local_values))
+        if block.address is None:
+            continue
+        layer = layer_by_file.get(block.file)
+        if layer is None:
+            raise LayerError(
+                f'{block.file} has {block.address} but is not in any layer of {LAYERS_FILENAME}'
+            )
+        layer.addresses.append(block.address)
+        layer_by_address[block.address] = layer
+
+    position = {layer.name: i for i, layer in enumerate(layers)}
+    for block in blocks:
+        layer = layer_by_address.get(block.address)
+        if layer is None:
+            continue
+        references = _resolve(block.references, local_values)
+        layer.variables |= _variables(references)
+        for reference in sorted(references):
+            dependency = layer_by_address.get(reference)
+            if dependency is None or dependency is layer:
+                continue
+            if position[dependency.name] > position[layer.name]:
+                raise LayerError(
+                    f'{block.address} in the {layer.name} layer references {reference} in the later {dependency.name} layer. List the layers of {LAYERS_FILENAME} in dependency order, and put blocks that reference each other in the same layer'
+                )
+            layer.dependencies.add(dependency.name)
+    return TemplateLayers(layers, global_variables)
+
+
+def targets(layers: List[Layer]) -> List[str]:
+    return [address for layer in layers for address in layer.addresses]
+
+
+def _local_references(blocks: List[terraform_variables.Block]) -> _LocalValues:
+    """Returns the references of each local value, keyed by "local.name"."""
+    local_values = {}
+    for block in blocks:
+        if block.type == 'locals':
+            for name, expression in terraform_variables.parse_attributes(
+                    block.body).items():
+                local_values[f'local.{name}'] = terraform_variables.references(
+                    expression)
+    return local_values
+
+
+def _resolve(references: Set[str], local_values: _LocalValues) -> Set[str]:
+    """Returns the references with locals replaced by what they reference,
+    recursively."""
+    resolved = set()
+    seen = set()
+    pending = list(references)
+    while pending:
+        reference = pending.pop()
+        if reference in seen:
+            continue
+        seen.add(reference)
+        if reference.startswith('local.'):
+            pending.extend(local_values.get(reference, ()))
+        else:
+            resolved.add(reference)
+    return resolved
+
+
+def _variables(references: Set[str]) -> Set[str]:
+    """Returns the names of the variables in resolved references."""
+    return {
+        reference[len('var.'):]
+        for reference in references
+        if reference.startswith('var.')
+    }
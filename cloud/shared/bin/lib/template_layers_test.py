@@ -0,0 +1,186 @@
+import json
+import os
+import tempfile
+import unittest
+
+from cloud.shared.bin.lib import template_layers
+"""
+Tests for template_layers.py.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/shared/bin/lib/template_layers_test.py
+"""
+
+FILES = {
+    "providers.tf":
+        '''
+provider "aws" {
+  region = var.aws_region
+}
+''',
+    "vpc.tf":
+        '''
+locals {
+  managed_vpc = var.vpc_id == ""
+  vpc_id      = local.managed_vpc ? module.vpc[0].vpc_id : var.vpc_id
+}
+
+module "vpc" {
+  source = "terraform-aws-modules/vpc/aws"
+  count  = local.managed_vpc ? 1 : 0
+  cidr   = var.vpc_cidr
+}
+''',
+    "main.tf":
+        '''
+resource "aws_db_instance" "civiform" {
+  instance_class = var.postgres_instance_class
+  # The description mentions var.app_prefix.
+}
+''',
+    "app.tf":
+        '''
+data "aws_caller_identity" "current" {}
+
+resource "aws_ecs_service" "civiform" {
+  vpc = local.vpc_id
+  image = "${var.civiform_image_repo}:${var.image_tag}"
+}
+''',
+    "variables.tf":
+        '''
+variable "unused" {}
+
+output "vpc_cidr" {
+  value = var.vpc_cidr
+}
+''',
+}
+
+LAYERS = [
+    {
+        "name": "network",
+        "files": ["vpc.tf"]
+    },
+    {
+        "name": "data",
+        "files": ["main.tf"]
+    },
+    {
+        "name": "app",
+        "files": ["app.tf"]
+    },
+]
+
+
+class TestTemplateLayers(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.template_dir = tmpdir.name
+        for name, content in FILES.items():
+            self._write(name, content)
+        self._write_manifest(LAYERS)
+
+    def _write(self, name, content):
+        with open(os.path.join(self.template_dir, name), "w") as f:
+            f.write(content)
+
+    def _write_manifest(self, layers):
+        self._write(
+            template_layers.LAYERS_FILENAME, json.dumps({"layers": layers}))
+
+    def _affected(self, *variables):
+        layers = template_layers.load(self.template_dir).affected(variables)
+        return layers and [layer.name for layer in layers]
+
+    def test_layer_addresses_and_variables(self):
+        layers = template_layers.load(self.template_dir).layers
+
+        self.assertEqual(
+            [layer.addresses for layer in layers], [
+                ["module.vpc"], ["aws_db_instance.civiform"],
+                [
+                    "data.aws_caller_identity.current",
+                    "aws_ecs_service.civiform"
+                ]
+            ])
+        network, data, app = layers
+        self.assertEqual(network.variables, {"vpc_id", "vpc_cidr"})
+        self.assertEqual(
+            data.variables, {"postgres_instance_class", "app_prefix"})
+        self.assertEqual(
+            app.variables, {"vpc_id", "civiform_image_repo", "image_tag"})
+
+    def test_layer_dependencies(self):
+        network, data, app = template_layers.load(self.template_dir).layers
+
+        self.assertEqual(network.dependencies, set())
+        self.assertEqual(data.dependencies, set())
+        # Through local.vpc_id, which references module.vpc.
+        self.assertEqual(app.dependencies, {"network"})
+
+    def test_affected_layers(self):
+        self.assertEqual(self._affected("image_tag"), ["app"])
+        self.assertEqual(
+            self._affected("image_tag", "postgres_instance_class"),
+            ["data", "app"])
+        self.assertEqual(self._affected("vpc_id"), ["network", "app"])
+
+    def test_dependents_of_affected_layers(self):
+        # The app layer doesn't use var.vpc_cidr, but references module.vpc.
+        self.assertEqual(self._affected("vpc_cidr"), ["network", "app"])
+
+    def test_full_apply_for_unused_and_provider_variables(self):
+        self.assertIsNone(self._affected("unused"))
+        self.assertIsNone(self._affected("aws_region"))
+        self.assertIsNone(self._affected())
+
+    def test_layers_must_be_in_dependency_order(self):
+        self._write_manifest(list(reversed(LAYERS)))
+
+        with self.assertRaisesRegex(template_layers.LayerError,
+                                    "references module.vpc"):
+            template_layers.load(self.template_dir)
+
+    def test_references_to_later_layers_are_rejected(self):
+        self._write(
+            "main.tf", '''
+resource "aws_db_instance" "civiform" {
+  security_group = aws_ecs_service.civiform.security_group
+}
+''')
+
+        with self.assertRaisesRegex(template_layers.LayerError,
+                                    "in the later app layer"):
+            template_layers.load(self.template_dir)
+
+    def test_files_must_be_in_a_layer(self):
+        self._write("alarms.tf", 'resource "aws_sns_topic" "alerts" {}\n')
+
+        with self.assertRaises(template_layers.LayerError):
+            template_layers.load(self.template_dir)
+
+    def test_without_manifest(self):
+        os.remove(
+            os.path.join(self.template_dir, template_layers.LAYERS_FILENAME))
+
+        self.assertIsNone(template_layers.load(self.template_dir))
+
+    def test_repo_template_layers(self):
+        layers = template_layers.load("cloud/aws/templates/aws_oidc")
+
+        # main.tf references app.tf, e.g. module.pgadmin references
+        # module.ecs_fargate_service, so they must share a layer.
+        app = layers.layers[-1]
+        self.assertIn("module.pgadmin", app.addresses)
+        self.assertIn("module.ecs_fargate_service", app.addresses)
+        self.assertEqual(
+            [layer.name for layer in layers.affected(["image_tag"])], ["app"])
+        self.assertEqual(
+            [layer.name for layer in layers.affected(["vpc_cidr"])],
+            ["network", "app"])
+
+
+if __name__ == "__main__":
+    unittest.main()
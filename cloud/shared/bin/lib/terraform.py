@@ -1,3 +1,6 @@
+import collections
+import hashlib
+import json
 import subprocess
 import os
 import sys
@@ -5,24 +8,40 @@ import re
 import shutil
 import shlex
 import inspect
-from typing import Optional
+import threading
+from typing import Callable, List, Optional
 
 from cloud.shared.bin.lib.config_loader import ConfigLoader
 from cloud.shared.bin.lib.print import print
+from cloud.shared.bin.lib import deploy_timings
+from cloud.shared.bin.lib import plugin_cache
+from cloud.shared.bin.lib import state_lock
+from cloud.shared.bin.lib import template_files
+from cloud.shared.bin.lib import terraform_events
+from cloud.shared.bin.lib import terraform_variables
 from cloud.aws.templates.aws_oidc.bin.aws_cli import AwsCli
 
+# Set to "true" to let terraform init upgrade providers and modules to the
+# newest versions allowed by the template.
+UPGRADE_ENV_VAR = 'TERRAFORM_UPGRADE'
+
+# Written to the .terraform directory after a successful init, see
+# _init_stamp.
+INIT_STAMP_FILENAME = 'civiform-init-stamp'
+
+# Lines of .tf files that terraform init acts on: module and provider sources
+# and versions, and the backend type.
+_INIT_INPUT_LINE_REGEX = re.compile(
+    r'^\s*(backend\s+"[^"]*"|source\s*=|version\s*=).*$', re.MULTILINE)
+
 
 def find_variable_default(config: ConfigLoader,
                           variable_name: str) -> Optional[str]:
     '''Finds the default value of a variable in the Terraform template. Does not read settings from the config file, only the Terraform template default.'''
-    with open(os.path.join(config.get_template_dir(), 'variables.tf'),
-              'r') as file:
-        content = file.read()
-    pattern = rf'variable "{variable_name}"\s*{{[^}}]*default\s*=\s*(?P<default_value>[^\n]+)'  # Barf
-    match = re.search(pattern, content, re.MULTILINE)
-    if match:
-        return match.group('default_value').strip().strip('"').strip("'")
-    return None
+    variable = config.terraform_variables.get(variable_name)
+    if variable is None:
+        return None
+    return terraform_variables.format_default(variable.default)
 
 
 def force_unlock(
@@ -45,25 +64,60 @@ def force_unlock(
 def perform_init(
         config_loader: ConfigLoader,
         terraform_template_dir: Optional[str] = None,
-        upgrade: bool = True):
+        upgrade: Optional[bool] = None,
+        reconfigure: bool = False):
+    '''Runs terraform init, unless the template was already initialized with
+    the same lock file, backend config and module sources.
+
+    Upgrading providers and modules is opt-in, by passing upgrade=True or
+    setting TERRAFORM_UPGRADE=true. Without it, init only upgrades when the
+    locked provider versions no longer match the template's constraints.
+
+    Pass reconfigure=True to switch to a changed backend config without
+    migrating the state, e.g. when only the locking changed.'''
     if not terraform_template_dir:
         terraform_template_dir = config_loader.get_template_dir()
+    if upgrade is None:
+        upgrade = os.getenv(UPGRADE_ENV_VAR, '').lower() == 'true'
+
+    stamp_path = _init_stamp_path(terraform_template_dir)
+    if not upgrade and _is_initialized(config_loader, terraform_template_dir):
+        print(
+            f" - {terraform_template_dir} is already initialized, skipping terraform init"
+        )
+        return
 
     init_cmd = f'terraform -chdir={terraform_template_dir} init'
     if upgrade:
         init_cmd += ' -upgrade'
 
-    if config_loader.use_local_backend:
+    if config_loader.use_local_backend or reconfigure:
         init_cmd += ' -reconfigure'
-    else:
+    if not config_loader.use_local_backend:
         init_cmd += ' -input=false'
         # backend vars file can be absent when pre-terraform setup is running
         if os.path.exists(os.path.join(terraform_template_dir,
                                        config_loader.backend_vars_filename)):
             init_cmd += f' -backend-config={config_loader.backend_vars_filename}'
     print(f" - Run {init_cmd}")
-    output, exit_code = capture_stderr(init_cmd)
+    cache = plugin_cache.from_environment()
+    if cache:
+        with cache.use():
+            output, exit_code = capture_stderr(init_cmd)
+            if exit_code == 0:
+                cache.record_use(
+                    os.path.join(terraform_template_dir, '.terraform.lock.hcl'))
+                cache.evict()
+    else:
+        output, exit_code = capture_stderr(init_cmd)
     if exit_code > 0:
+        if not upgrade and 'does not match configured version constraint' in output:
+            print(
+                " - The template requires different provider versions than the lock file, rerunning init with -upgrade"
+            )
+            perform_init(
+                config_loader, terraform_template_dir, True, reconfigure)
+            return
         # Determine if we're running interactively
         is_tty = sys.stdin.isatty()
         # This is AWS-specific, and should be modified when we have actual
@@ -80,7 +134,8 @@ def perform_init(
                         aws = AwsCli(config_loader)
                         aws.set_lock_table_digest_value(digest)
                         perform_init(
-                            config_loader, terraform_template_dir, upgrade)
+                            config_loader, terraform_template_dir, upgrade,
+                            reconfigure)
                         return
                 print(
                     f"To fix the above error, rerun the command with LOCK_TABLE_DIGEST_VALUE=\"{digest}\" before it."
@@ -88,30 +143,253 @@ def perform_init(
             # Since we've handled the error and printed a message, exit immediately
             # rather than returning False and having it print a stack trace.
             exit(exit_code)
+        if 'Backend configuration changed' in output:
+            print(
+                "If TERRAFORM_STATE_LOCKING changed or the lock table was deleted, run the migrate_state_locking command to switch this machine to the new locking."
+            )
+            exit(exit_code)
         raise RuntimeError(
             "Unhandled error during terraform init. See error message above for details."
         )
 
+    os.makedirs(os.path.dirname(stamp_path), exist_ok=True)
+    with open(stamp_path, 'w') as f:
+        f.write(_init_stamp(config_loader, terraform_template_dir))
+
+
+class InitPrefetch:
+    '''Downloads the providers and modules of a template on a separate
+    thread, with terraform init -backend=false, while something else runs.
+
+    During setup, the backend of the main template is only created by the
+    setup template's apply, so the main template can't be fully initialized
+    before then. Its downloads don't depend on the backend though, and
+    perform_init finds them already installed afterwards. Output lines are
+    prefixed with the template directory, since they are interleaved with the
+    output of the other command.
+
+    The init does not use the plugin cache, which it would have to lock for
+    as long as it runs, blocking the inits of the other command. The
+    providers it downloaded are added to the cache afterwards instead.'''
+
+    def __init__(
+            self,
+            config_loader: ConfigLoader,
+            terraform_template_dir: Optional[str] = None):
+        self._config_loader = config_loader
+        self._terraform_template_dir = terraform_template_dir or config_loader.get_template_dir(
+        )
+        self._prefix = f'[{self._terraform_template_dir} init] '
+        self._thread: Optional[threading.Thread] = None
+        self._exit_code: Optional[int] = None
+        self._cache: Optional[plugin_cache.PluginCache] = None
+        self._env: Optional[dict] = None
+
+    def start(self):
+        if _is_initialized(self._config_loader, self._terraform_template_dir):
+            return
+        self._cache = plugin_cache.from_environment()
+        if self._cache:
+            # Copied here rather than on the thread, where another init can
+            # change the environment while it is being copied.
+            self._env = {
+                name: value
+                for name, value in os.environ.items()
+                if name not in plugin_cache.ENVIRONMENT_VARIABLES
+            }
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def wait(self) -> bool:
+        '''Waits for the downloads and returns whether they succeeded. A
+        failure is not fatal, perform_init will run init again.'''
+        if self._thread:
+            self._thread.join()
+        return not self._exit_code
+
+    def _run(self):
+        init_cmd = f'terraform -chdir={self._terraform_template_dir} init -backend=false -input=false'
+        print(f'{self._prefix}Run {init_cmd}')
+        try:
+            self._exit_code = _run_with_prefix(
+                init_cmd, self._prefix, self._env)
+            if self._cache and not self._exit_code:
+                with self._cache.lock():
+                    self._cache.add_installed(self._terraform_template_dir)
+                    self._cache.record_use(
+                        os.path.join(
+                            self._terraform_template_dir,
+                            '.terraform.lock.hcl'))
+                    self._cache.evict()
+        except OSError as e:
+            print(f'{self._prefix}{e}')
+            self._exit_code = 1
+        if self._exit_code:
+            print(
+                f'{self._prefix}Downloading providers and modules failed, terraform init will run again after the setup'
+            )
+
+
+def _run_with_prefix(cmd: str, prefix: str, env: Optional[dict] = None) -> int:
+    '''Runs cmd, printing its stdout and stderr with each line prefixed.'''
+    popen = subprocess.Popen(
+        shlex.split(cmd),
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        bufsize=1,
+        universal_newlines=True)
+    with popen.stdout:
+        for line in popen.stdout:
+            print(prefix + line, end='')
+    return popen.wait()
+
+
+def _init_stamp_path(terraform_template_dir: str) -> str:
+    return os.path.join(
+        terraform_template_dir, '.terraform', INIT_STAMP_FILENAME)
+
+
+def _is_initialized(
+        config_loader: ConfigLoader, terraform_template_dir: str) -> bool:
+    return _providers_installed(terraform_template_dir) and _read_init_stamp(
+        _init_stamp_path(terraform_template_dir)) == _init_stamp(
+            config_loader, terraform_template_dir)
+
+
+def _init_stamp(
+        config_loader: ConfigLoader, terraform_template_dir: str) -> str:
+    '''Returns a hash of everything terraform init depends on.'''
+    stamp = hashlib.sha256()
+    stamp.update(f'local_backend={config_loader.use_local_backend}\n'.encode())
+    for name in ['.terraform.lock.hcl', config_loader.backend_vars_filename,
+                 'backend_override.tf']:
+        stamp.update(f'{name}\n'.encode())
+        path = os.path.join(terraform_template_dir, name)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                stamp.update(hashlib.sha256(f.read()).digest())
+    for path in sorted(template_files.walk(terraform_template_dir)):
+        if not path.endswith('.tf'):
+            continue
+        with open(path) as f:
+            lines = _INIT_INPUT_LINE_REGEX.findall(f.read())
+        if lines:
+            stamp.update(f'{os.path.relpath(path)}\n'.encode())
+            stamp.update('\n'.join(lines).encode())
+    return stamp.hexdigest()
+
+
+def _providers_installed(terraform_template_dir: str) -> bool:
+    '''Returns False if a provider that init linked from the plugin cache has
+    since been evicted from it.'''
+    providers_dir = os.path.join(
+        terraform_template_dir, '.terraform', 'providers')
+    for root, dirs, files in os.walk(providers_dir):
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            if os.path.islink(path) and not os.path.exists(path):
+                return False
+    return True
+
+
+def _read_init_stamp(stamp_path: str) -> Optional[str]:
+    try:
+        with open(stamp_path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+# Number of trailing stderr lines that capture_stderr returns for matching
+# error messages such as the state lock ID.
+STDERR_TAIL_LINES = 1000
+
 
 # We specifically don't want to capture stdout here. When running in interactive mode,
 # we'd miss the prompt to enter "yes" to continue on a terraform apply, even if we're
 # printing each line as it comes in, since the line the prompt is on does not contain
 # a new line character.
 def capture_stderr(cmd):
+    '''Runs cmd, printing its stderr as it is written. Returns the last
+    STDERR_TAIL_LINES lines of stderr and the exit code.
+
+    stderr is read on a separate thread while waiting for the process, so the
+    process never blocks on a full pipe and memory use does not grow with the
+    amount of output.'''
     popen = subprocess.Popen(
         shlex.split(cmd),
         stderr=subprocess.PIPE,
         bufsize=1,
         universal_newlines=True)
+    tail = collections.deque(maxlen=STDERR_TAIL_LINES)
+    return _wait_with_stderr_tee(popen, tail, popen.wait)
+
+
+def capture_json_events(cmd, on_event: Callable[[dict], None]):
+    '''Runs a terraform command with -json. Prints the human readable
+    message of each event, or the whole text of diagnostics, and passes the
+    event to on_event.
+
+    Returns the last STDERR_TAIL_LINES lines of stderr and error diagnostics,
+    which is what terraform prints as errors without -json, and the exit
+    code.'''
+    popen = subprocess.Popen(
+        shlex.split(cmd),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        bufsize=1,
+        universal_newlines=True)
+    tail = collections.deque(maxlen=STDERR_TAIL_LINES)
+
+    def read_events():
+        for line in popen.stdout:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                print(line, end='')
+                continue
+            text = terraform_events.diagnostic_text(event)
+            if text:
+                # The message is only the summary, the detail has the error
+                # of the provider.
+                print(text)
+                tail.extend(text.splitlines(keepends=True))
+            elif event.get('type') != 'version':
+                print(event.get('@message', ''))
+            on_event(event)
+        return popen.wait()
+
+    return _wait_with_stderr_tee(popen, tail, read_events)
+
+
+def _wait_with_stderr_tee(popen, tail: collections.deque, wait):
+    '''Calls wait while printing popen's stderr and appending it to tail on
+    a separate thread. Returns the content of tail and the exit code.'''
+
+    def tee_stderr():
+        for line in popen.stderr:
+            print(line, end='')
+            tail.append(line)
+
+    reader = threading.Thread(target=tee_stderr, daemon=True)
+    reader.start()
     try:
-        exit_code = popen.wait()
-        _, stderr = popen.communicate()
-        if stderr:
-            print(stderr)
-        return stderr, exit_code
+        exit_code = wait()
     except KeyboardInterrupt:
         # Allow terraform to gracefully exit if a user Ctrl+C's out of the command
         popen.terminate()
+        popen.wait()
+        raise
+    finally:
+        reader.join()
+        popen.stderr.close()
+    return ''.join(tail), exit_code
+
+
+# Exit codes of terraform plan -detailed-exitcode.
+PLAN_NO_CHANGES = 0
+PLAN_HAS_CHANGES = 2
 
 
 # TODO(#2741): When using this for Azure make sure to setup backend bucket prior to calling these functions.
@@ -120,14 +398,32 @@ def perform_apply(
         is_destroy=False,
         terraform_template_dir: Optional[str] = None,
         replace_resource: Optional[str] = None,
-        initialize=True):
-    '''Generates terraform variable files and runs terraform init and apply.'''
+        initialize=True,
+        targets: Optional[List[str]] = None,
+        refresh=True,
+        lock_timeout: int = 0,
+        lock_wait: Optional[state_lock.LockWait] = None):
+    '''Runs terraform init, plan and apply.
+
+    The plan is saved to TERRAFORM_PLAN_OUT_FILE and applied as is after it is
+    confirmed, so the resources are only refreshed once. If the plan has no
+    changes, nothing is applied.
+
+    targets limits the plan to the given resource addresses and their
+    dependencies, for commands that only toggle a module like pgadmin, and
+    deploys that only change some layers, see template_layers.py. Only
+    pass refresh=False when the state of the targets is known to be current,
+    e.g. when removing resources that the same command just created.
+
+    lock_timeout and lock_wait are set when retrying after the state lock
+    could not be acquired, see state_lock.py.'''
     if not terraform_template_dir:
         terraform_template_dir = config_loader.get_template_dir()
     tf_vars_filename = config_loader.tfvars_filename
 
     if initialize:
-        perform_init(config_loader, terraform_template_dir)
+        with deploy_timings.phase('init'):
+            perform_init(config_loader, terraform_template_dir)
 
     if os.path.exists(os.path.join(terraform_template_dir, tf_vars_filename)):
         print(
@@ -141,62 +437,231 @@ def perform_apply(
         print(" - Test. Not applying terraform.")
         return True
 
-    # Enable compact-warnings as we have a bunch of
-    # "value of undeclared variables" warnings as some variables used in one
-    # deployment (e.g. aws) but not the other.
-    terraform_apply_cmd = f'terraform -chdir={terraform_template_dir} apply -input=false -var-file={tf_vars_filename} -compact-warnings'
-    if replace_resource:
-        terraform_apply_cmd += f' -replace={replace_resource}'
-    if config_loader.skip_confirmations:
-        terraform_apply_cmd += ' -auto-approve'
-    if is_destroy:
-        terraform_apply_cmd += ' -destroy'
+    def retry(lock_timeout=0, lock_wait=None):
+        return perform_apply(
+            config_loader,
+            is_destroy,
+            terraform_template_dir,
+            replace_resource,
+            initialize=False,
+            targets=targets,
+            refresh=refresh,
+            lock_timeout=lock_timeout,
+            lock_wait=lock_wait)
 
-    print(f" - Run {terraform_apply_cmd}")
+    # The plan file is relative to the template directory because of -chdir.
+    # It contains the values of sensitive variables, so it is always removed.
+    plan_file = os.getenv('TERRAFORM_PLAN_OUT_FILE', 'terraform_plan')
+    try:
+        # Enable compact-warnings as we have a bunch of
+        # "value of undeclared variables" warnings as some variables used in one
+        # deployment (e.g. aws) but not the other.
+        terraform_plan_cmd = f'terraform -chdir={terraform_template_dir} plan -input=false -var-file={tf_vars_filename} -compact-warnings -detailed-exitcode -out={plan_file}'
+        if replace_resource:
+            terraform_plan_cmd += f' -replace={replace_resource}'
+        if is_destroy:
+            terraform_plan_cmd += ' -destroy'
+        for target in targets or []:
+            terraform_plan_cmd += f' -target={target}'
+        if not refresh:
+            terraform_plan_cmd += ' -refresh=false'
+        if lock_timeout:
+            terraform_plan_cmd += f' -lock-timeout={lock_timeout}s'
 
-    output, exit_code = capture_stderr(terraform_apply_cmd)
-    if exit_code > 0:
-        # Determine if we're running interactively
-        is_tty = sys.stdin.isatty()
-        if "Error acquiring the state lock" in output:
-            # Lock ID is a standard UUID v4 in the form 00000000-0000-0000-0000-000000000000
-            match = re.search(
-                r'ID:\s+([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})',
-                output)
-            error_text = inspect.cleandoc(
-                """
-                The Terraform state lock can not be acquired.
-                This can happen if you are running a command in another process, or if another Terraform process exited prematurely. 
-                """)
-            if match:
-                lock_id = match.group(match.lastindex)
-                if is_tty:
-                    answer = input(
-                        "Would you like to fix this by force-unlocking the Terraform state? Ensure that no other deployment processes are in progress. [Y/n] >"
-                    )
-                    if answer.lower() in ['y', 'yes', '']:
-                        force_unlock(
-                            config_loader, lock_id, terraform_template_dir,
-                            False)  # initialize = False
-                        return perform_apply(
-                            config_loader, is_destroy, terraform_template_dir,
-                            False)  # initialize = False
-                print(
-                    error_text +
-                    f"\nIf you are sure there are no other Terraform processes running, this can be fixed by rerunning the command with FORCE_UNLOCK_ID=\"{lock_id}\" before it."
-                )
-            else:
-                print(
-                    error_text +
-                    "\nWe were unable to extract the lock ID from the error text. Inspect the error message above."
-                    "\nIf you are sure there are no other Terraform processes running, this error can be fixed by rerunning the command with FORCE_UNLOCK_ID=<Lock ID> before it."
+        print(f" - Run {terraform_plan_cmd}")
+        with deploy_timings.phase('plan'):
+            output, exit_code = capture_stderr(terraform_plan_cmd)
+        if exit_code == PLAN_NO_CHANGES:
+            print(" - No changes to apply.")
+            return True
+        if exit_code != PLAN_HAS_CHANGES:
+            return _handle_apply_error(
+                config_loader, terraform_template_dir, output, exit_code, retry,
+                lock_wait)
+
+        changes = _planned_changes(terraform_template_dir, plan_file)
+        estimate = deploy_timings.format_estimate(
+            changes, terraform_events.load_history(),
+            deploy_timings.load_deploys())
+        if estimate:
+            print(f"\n{estimate}")
+
+        if not config_loader.skip_confirmations and not _confirm_plan(
+                is_destroy):
+            print("Apply cancelled.")
+            return False
+
+        terraform_apply_cmd = f'terraform -chdir={terraform_template_dir} apply -input=false -compact-warnings -json {plan_file}'
+        print(f" - Run {terraform_apply_cmd}")
+        labels = {
+            change.address: change.label for change in changes if change.label
+        }
+        timings = terraform_events.ApplyTimings(labels)
+        with deploy_timings.phase('apply'):
+            output, exit_code = capture_json_events(
+                terraform_apply_cmd, timings.handle_event)
+        _report_apply_timings(
+            config_loader, terraform_template_dir, timings, exit_code)
+        if exit_code > 0:
+            return _handle_apply_error(
+                config_loader, terraform_template_dir, output, exit_code, retry,
+                lock_wait)
+        return True
+    finally:
+        plan_path = os.path.join(terraform_template_dir, plan_file)
+        if os.path.exists(plan_path):
+            os.remove(plan_path)
+
+
+def _planned_changes(terraform_template_dir: str,
+                     plan_file: str) -> List[deploy_timings.PlannedChange]:
+    """Returns the changes in the saved plan, or none if it can't be read.
+    They are only used for the estimate, so errors are not fatal."""
+    try:
+        plan_json = subprocess.check_output(
+            [
+                'terraform', f'-chdir={terraform_template_dir}', 'show',
+                '-json', plan_file
+            ],
+            stderr=subprocess.DEVNULL)
+        return deploy_timings.planned_changes(json.loads(plan_json))
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return []
+
+
+def _report_apply_timings(
+        config_loader: ConfigLoader, terraform_template_dir: str,
+        timings: terraform_events.ApplyTimings, exit_code: int):
+    print("\nTime spent per resource:")
+    print(timings.format_table())
+    try:
+        terraform_events.append_history(
+            timings.to_record(
+                app_prefix=config_loader.app_prefix,
+                template_dir=terraform_template_dir,
+                image_tag=os.getenv('TF_VAR_image_tag'),
+                exit_code=exit_code))
+    except OSError as e:
+        print(f"Could not write the apply history: {e}")
+
+
+def _confirm_plan(is_destroy: bool) -> bool:
+    action = 'destroy all the resources above' if is_destroy else 'perform the actions above'
+    answer = input(
+        f"\nDo you want to {action}? Only 'yes' will be accepted to approve.\n  Enter a value: "
+    )
+    return answer.strip() == 'yes'
+
+
+def _handle_apply_error(
+        config_loader: ConfigLoader,
+        terraform_template_dir: str,
+        output: str,
+        exit_code: int,
+        retry: Callable[..., bool],
+        lock_wait: Optional[state_lock.LockWait] = None) -> bool:
+    '''Handles a failed terraform plan or apply. Returns the result of retry
+    if the error could be fixed, or False otherwise.'''
+    # Determine if we're running interactively
+    is_tty = sys.stdin.isatty()
+    if "Error acquiring the state lock" in output:
+        lock_wait = lock_wait or state_lock.LockWait.from_environment()
+        if lock_wait:
+            result = _wait_for_lock(
+                config_loader, terraform_template_dir, output, lock_wait, retry)
+            if result is not None:
+                return result
+        # Lock ID is a standard UUID v4 in the form 00000000-0000-0000-0000-000000000000
+        match = re.search(
+            r'ID:\s+([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})',
+            output)
+        error_text = inspect.cleandoc(
+            """
+            The Terraform state lock can not be acquired.
+            This can happen if you are running a command in another process, or if another Terraform process exited prematurely. 
+            """)
+        if match:
+            lock_id = match.group(match.lastindex)
+            if is_tty:
+                answer = input(
+                    "Would you like to fix this by force-unlocking the Terraform state? Ensure that no other deployment processes are in progress. [Y/n] >"
                 )
-            # Since we've handled the error and printed a message, exit immediately
-            # rather than returning False and having it print a stack trace.
-            exit(exit_code)
-        return False
+                if answer.lower() in ['y', 'yes', '']:
+                    force_unlock(
+                        config_loader, lock_id, terraform_template_dir,
+                        False)  # initialize = False
+                    return retry()
+            print(
+                error_text +
+                f"\nIf you are sure there are no other Terraform processes running, this can be fixed by rerunning the command with FORCE_UNLOCK_ID=\"{lock_id}\" before it."
+            )
+        else:
+            print(
+                error_text +
+                "\nWe were unable to extract the lock ID from the error text. Inspect the error message above."
+                "\nIf you are sure there are no other Terraform processes running, this error can be fixed by rerunning the command with FORCE_UNLOCK_ID=<Lock ID> before it."
+            )
+        # Since we've handled the error and printed a message, exit immediately
+        # rather than returning False and having it print a stack trace.
+        exit(exit_code)
+    return False
 
-    return True
+
+def _wait_for_lock(
+        config_loader: ConfigLoader, terraform_template_dir: str, output: str,
+        lock_wait: state_lock.LockWait,
+        retry: Callable[..., bool]) -> Optional[bool]:
+    '''Releases the state lock if it is stale, or retries with a longer
+    -lock-timeout. Returns None when the wait is over, or when the lock is
+    older than TERRAFORM_STALE_LOCK_MINUTES.'''
+    lock = _current_lock(config_loader, output)
+    if lock is None:
+        print(" - The Terraform state lock was released, retrying")
+        return retry(lock_wait=lock_wait)
+
+    reason = state_lock.stale_reason(lock)
+    if reason:
+        print(f" - Releasing the stale state lock {lock.describe()}: {reason}")
+        try:
+            force_unlock(
+                config_loader, lock.id, terraform_template_dir,
+                False)  # initialize = False
+        except subprocess.CalledProcessError:
+            # Someone else released or took the lock in the meantime.
+            print(" - Could not release the lock, retrying")
+        return retry(lock_wait=lock_wait)
+
+    stale_after = state_lock.stale_after_from_environment()
+    if state_lock.is_overdue(lock, stale_after):
+        print(
+            f"The Terraform state lock {lock.describe()} is older than {state_lock.STALE_ENV_VAR}={os.getenv(state_lock.STALE_ENV_VAR)}, it was likely abandoned. Not waiting for it."
+        )
+        return None
+
+    timeout = lock_wait.next_timeout()
+    if timeout is None:
+        print(
+            f"Gave up waiting for the Terraform state lock after {os.getenv(state_lock.WAIT_ENV_VAR)} minutes."
+        )
+        return None
+    print(
+        f" - The Terraform state is locked: {lock.describe()}. Waiting up to {timeout}s for it."
+    )
+    return retry(lock_timeout=timeout, lock_wait=lock_wait)
+
+
+def _current_lock(config_loader: ConfigLoader,
+                  output: str) -> Optional[state_lock.LockInfo]:
+    '''Returns the current state lock, read from the backend if possible
+    since the lock in the error output may have been released since.'''
+    if config_loader.get_cloud_provider(
+    ) == 'aws' and not config_loader.use_local_backend:
+        try:
+            info = AwsCli(config_loader).get_terraform_lock_info()
+            return state_lock.LockInfo.from_json(info) if info else None
+        except subprocess.CalledProcessError as e:
+            print(f" - Could not read the state lock: {e.output.decode()}")
+    return state_lock.LockInfo.from_error_output(output)
 
 
 def copy_backend_override(config_loader: ConfigLoader):
@@ -0,0 +1,147 @@
+"""
+Parses the machine-readable output of terraform apply -json.
+
+Each line of output is a JSON object with a "type" and a human readable
+"@message". ApplyTimings collects the apply_start, apply_complete and
+apply_errored events into the time spent on each resource, which is printed
+as a table after the apply and appended to a JSONL history file in the local
+cache, see cache.py, to compare deploy times across releases. History files
+keep the newest MAX_HISTORY_RECORDS records.
+
+See https://developer.hashicorp.com/terraform/internals/machine-readable-ui
+"""
+
+import datetime
+import json
+from typing import Dict, List, Optional
+
+from cloud.shared.bin.lib.cache import atomic_write, cache_dir
+
+MAX_HISTORY_RECORDS = 200
+
+
+class ResourceTiming:
+
+    def __init__(self, address: str, action: str, label: Optional[str] = None):
+        self.address = address
+        self.action = action
+        self.label = label
+        self.seconds: Optional[float] = None
+        self.status = "started"
+
+    def to_dict(self) -> dict:
+        result = {
+            "address": self.address,
+            "action": self.action,
+            "seconds": self.seconds,
+            "status": self.status,
+        }
+        if self.label:
+            result["label"] = self.label
+        return result
+
+
+class ApplyTimings:
+
+    def __init__(self, labels: Optional[Dict[str, str]] = None):
+        self._resources: Dict[str, ResourceTiming] = {}
+        self._labels = labels or {}
+        """Labels of the planned changes, see deploy_timings.py, keyed by
+        resource address."""
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+
+    def handle_event(self, event: dict):
+        event_type = event.get("type")
+        if event_type not in ("apply_start", "apply_progress", "apply_complete",
+                              "apply_errored"):
+            return
+        hook = event.get("hook") or {}
+        address = (hook.get("resource") or {}).get("addr")
+        if not address:
+            return
+
+        timing = self._resources.get(address)
+        if timing is None:
+            timing = ResourceTiming(
+                address, hook.get("action", ""), self._labels.get(address))
+            self._resources[address] = timing
+        if "elapsed_seconds" in hook:
+            timing.seconds = hook["elapsed_seconds"]
+        if event_type == "apply_complete":
+            timing.status = "complete"
+        elif event_type == "apply_errored":
+            timing.status = "errored"
+
+    @property
+    def resources(self) -> List[ResourceTiming]:
+        """The resources that were applied, slowest first."""
+        return sorted(
+            self._resources.values(),
+            key=lambda timing: timing.seconds or 0,
+            reverse=True)
+
+    def format_table(self, limit: int = 15) -> str:
+        resources = self.resources
+        if not resources:
+            return "No resources were changed."
+        width = max(len(timing.address) for timing in resources[:limit])
+        lines = [f"{'Resource':<{width}}  {'Action':<8}  {'Time':>8}  Status"]
+        for timing in resources[:limit]:
+            seconds = "?" if timing.seconds is None else f"{timing.seconds}s"
+            lines.append(
+                f"{timing.address:<{width}}  {timing.action:<8}  {seconds:>8}  {timing.status}"
+            )
+        if len(resources) > limit:
+            lines.append(f"... and {len(resources) - limit} more")
+        return "\n".join(lines)
+
+    def to_record(self, **fields) -> dict:
+        record = {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "resources": [timing.to_dict() for timing in self.resources],
+        }
+        record.update(fields)
+        return record
+
+
+def history_path() -> str:
+    return cache_dir("history", "applies.jsonl")
+
+
+def append_history(
+        record: dict,
+        path: Optional[str] = None,
+        max_records: int = MAX_HISTORY_RECORDS):
+    """Appends the record, dropping the oldest records beyond max_records."""
+    path = path or history_path()
+    try:
+        with open(path) as f:
+            lines = [line for line in f if line.strip()]
+    except FileNotFoundError:
+        lines = []
+    lines.append(json.dumps(record, sort_keys=True) + "\n")
+    atomic_write(path, "".join(lines[-max_records:]).encode("utf-8"))
+
+
+def load_history(path: Optional[str] = None) -> List[dict]:
+    """Returns the records in the history file, skipping malformed lines."""
+    records = []
+    try:
+        with open(path or history_path()) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def diagnostic_text(event: dict) -> Optional[str]:
+    """Returns the text of a diagnostic event, as terraform would print it
+    without -json, or None for other events."""
+    if event.get("type") != "diagnostic":
+        return None
+    diagnostic = event.get("diagnostic") or {}
+    return f"{diagnostic.get('severity', '').capitalize()}: {diagnostic.get('summary', '')}\n\n{diagnostic.get('detail', '')}\n"
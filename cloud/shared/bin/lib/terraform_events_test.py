@@ -0,0 +1,116 @@
+import os
+import tempfile
+import unittest
+
+from cloud.shared.bin.lib import terraform_events
+"""
+Tests for terraform_events.py.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/shared/bin/lib/terraform_events_test.py
+"""
+
+
+def _event(event_type, address, action="create", **hook):
+    hook.update({"resource": {"addr": address}, "action": action})
+    return {"type": event_type, "hook": hook}
+
+
+class TestApplyTimings(unittest.TestCase):
+
+    def test_resources_are_sorted_slowest_first(self):
+        timings = terraform_events.ApplyTimings()
+        for event in [
+                _event("apply_start", "aws_db_instance.db", "update"),
+                _event("apply_start", "aws_s3_bucket.files"),
+                _event("apply_complete", "aws_s3_bucket.files",
+                       elapsed_seconds=2),
+                _event("apply_progress", "aws_db_instance.db", "update",
+                       elapsed_seconds=30),
+                _event("apply_errored", "aws_db_instance.db", "update",
+                       elapsed_seconds=45),
+            {"type": "version", "terraform": "1.5.0"},
+        ]:
+            timings.handle_event(event)
+
+        self.assertEqual(
+            [timing.to_dict() for timing in timings.resources], [
+                {
+                    "address": "aws_db_instance.db",
+                    "action": "update",
+                    "seconds": 45,
+                    "status": "errored"
+                },
+                {
+                    "address": "aws_s3_bucket.files",
+                    "action": "create",
+                    "seconds": 2,
+                    "status": "complete"
+                },
+            ])
+
+    def test_format_table_limits_rows(self):
+        timings = terraform_events.ApplyTimings()
+        for i in range(3):
+            timings.handle_event(
+                _event(
+                    "apply_complete", f"aws_s3_bucket.b{i}", elapsed_seconds=i))
+
+        table = timings.format_table(limit=2)
+
+        self.assertIn("aws_s3_bucket.b2", table)
+        self.assertNotIn("aws_s3_bucket.b0", table)
+        self.assertIn("... and 1 more", table)
+
+    def test_format_table_without_changes(self):
+        self.assertEqual(
+            terraform_events.ApplyTimings().format_table(),
+            "No resources were changed.")
+
+
+class TestHistory(unittest.TestCase):
+
+    def test_append_and_load(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "history", "applies.jsonl")
+            terraform_events.append_history({"exit_code": 0}, path)
+            with open(path, "a") as f:
+                f.write("not json\n")
+            terraform_events.append_history({"exit_code": 1}, path)
+
+            history = terraform_events.load_history(path)
+            self.assertEqual(history, [{"exit_code": 0}, {"exit_code": 1}])
+
+    def test_append_drops_oldest_records(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "applies.jsonl")
+            for i in range(5):
+                terraform_events.append_history({"run": i}, path, max_records=3)
+
+            history = terraform_events.load_history(path)
+            self.assertEqual([record["run"] for record in history], [2, 3, 4])
+
+    def test_load_missing_history(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.assertEqual(
+                terraform_events.load_history(
+                    os.path.join(tmpdir, "applies.jsonl")), [])
+
+    def test_diagnostic_text(self):
+        diagnostic = {
+            "severity": "error",
+            "summary": "Error acquiring the state lock",
+            "detail": "Lock Info:\n  ID: 123"
+        }
+        self.assertEqual(
+            terraform_events.diagnostic_text(
+                {
+                    "type": "diagnostic",
+                    "diagnostic": diagnostic
+                }),
+            "Error: Error acquiring the state lock\n\nLock Info:\n  ID: 123\n")
+        self.assertIsNone(
+            terraform_events.diagnostic_text({"type": "apply_start"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,398 @@
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from cloud.shared.bin.lib import deploy_timings
+from cloud.shared.bin.lib import state_lock
+from cloud.shared.bin.lib import terraform
+from cloud.shared.bin.lib import terraform_events
+from cloud.shared.bin.lib.config_loader import ConfigLoader
+"""
+Tests for the terraform helpers. Terraform itself is not run, the calls to it
+are mocked.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/shared/bin/lib/terraform_test.py
+"""
+
+
+class TestPerformInit(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.template_dir = tmpdir.name
+        with open(os.path.join(self.template_dir, "main.tf"), "w") as f:
+            f.write(
+                'module "vpc" {\n  source  = "terraform-aws-modules/vpc/aws"\n  version = "5.0.0"\n}\n'
+            )
+        self.config = ConfigLoader()
+        self.config._config_fields = {
+            "TERRAFORM_TEMPLATE_DIR": self.template_dir
+        }
+
+        env = patch.dict(
+            os.environ, {
+                "CIVIFORM_DEPLOY_CACHE_DIR":
+                    os.path.join(self.template_dir, ".cache")
+            })
+        env.start()
+        self.addCleanup(env.stop)
+        os.environ.pop(terraform.UPGRADE_ENV_VAR, None)
+        os.environ.pop("TF_PLUGIN_CACHE_DIR", None)
+
+    @patch('cloud.shared.bin.lib.terraform.capture_stderr')
+    def test_init_skipped_until_inputs_change(self, mock_capture_stderr):
+        mock_capture_stderr.return_value = ("", 0)
+
+        terraform.perform_init(self.config)
+        terraform.perform_init(self.config)
+        self.assertEqual(mock_capture_stderr.call_count, 1)
+        self.assertNotIn("-upgrade", mock_capture_stderr.call_args.args[0])
+
+        with open(os.path.join(self.template_dir, "main.tf"), "a") as f:
+            f.write('module "other" {\n  source = "./other"\n}\n')
+        os.mkdir(os.path.join(self.template_dir, "other"))
+        terraform.perform_init(self.config)
+        self.assertEqual(mock_capture_stderr.call_count, 2)
+
+        # Upgrading is opt-in and always runs init.
+        os.environ[terraform.UPGRADE_ENV_VAR] = "true"
+        terraform.perform_init(self.config)
+        self.assertEqual(mock_capture_stderr.call_count, 3)
+        self.assertIn("-upgrade", mock_capture_stderr.call_args.args[0])
+
+    @patch('cloud.shared.bin.lib.terraform.capture_stderr')
+    def test_init_upgrades_when_lock_file_does_not_match_constraints(
+            self, mock_capture_stderr):
+        mock_capture_stderr.side_effect = [
+            (
+                "locked provider registry.terraform.io/hashicorp/aws 4.0.0 does not match configured version constraint >= 5.0",
+                1),
+            ("", 0),
+        ]
+
+        terraform.perform_init(self.config)
+
+        self.assertIn("-upgrade", mock_capture_stderr.call_args.args[0])
+
+    @patch('cloud.shared.bin.lib.terraform.print')
+    @patch('cloud.shared.bin.lib.terraform._run_with_prefix')
+    def test_init_prefetch_downloads_without_backend(
+            self, mock_run_with_prefix, mock_print):
+        mock_run_with_prefix.return_value = 1
+
+        prefetch = terraform.InitPrefetch(self.config)
+        prefetch.start()
+
+        self.assertFalse(prefetch.wait())
+        cmd, prefix, env = mock_run_with_prefix.call_args.args
+        self.assertTrue(cmd.endswith(" init -backend=false -input=false"))
+        self.assertEqual(prefix, f"[{self.template_dir} init] ")
+        self.assertNotIn("TF_PLUGIN_CACHE_DIR", env)
+
+    @patch('cloud.shared.bin.lib.terraform.print')
+    @patch('cloud.shared.bin.lib.terraform.capture_stderr')
+    @patch('cloud.shared.bin.lib.terraform._run_with_prefix')
+    def test_init_prefetch_runs_alongside_init(
+            self, mock_run_with_prefix, mock_capture_stderr, mock_print):
+        setup_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(setup_dir.cleanup)
+        prefetch_started = threading.Event()
+        init_ran = threading.Event()
+        overlapped = []
+        provider = os.path.join(
+            "registry.terraform.io", "hashicorp", "aws", "5.31.0",
+            "linux_amd64")
+
+        def prefetch(cmd, prefix, env):
+            prefetch_started.set()
+            # Times out if the prefetch blocks the other init.
+            overlapped.append(init_ran.wait(5))
+            provider_dir = os.path.join(
+                self.template_dir, ".terraform", "providers", provider)
+            os.makedirs(provider_dir)
+            with open(os.path.join(provider_dir, "provider"), "w") as f:
+                f.write("provider")
+            return 0
+
+        def init(cmd):
+            init_ran.set()
+            return "", 0
+
+        mock_run_with_prefix.side_effect = prefetch
+        mock_capture_stderr.side_effect = init
+
+        init_prefetch = terraform.InitPrefetch(self.config)
+        init_prefetch.start()
+        self.assertTrue(prefetch_started.wait(5))
+        terraform.perform_init(self.config, setup_dir.name)
+
+        self.assertTrue(init_prefetch.wait())
+        self.assertEqual(overlapped, [True])
+        # The provider the prefetch downloaded was added to the cache.
+        cache_dir = os.path.join(
+            self.template_dir, ".cache", "terraform-plugins")
+        self.assertTrue(
+            os.path.exists(os.path.join(cache_dir, provider, "provider")))
+
+    @patch('cloud.shared.bin.lib.terraform._run_with_prefix')
+    @patch('cloud.shared.bin.lib.terraform.capture_stderr')
+    def test_init_prefetch_skipped_when_initialized(
+            self, mock_capture_stderr, mock_run_with_prefix):
+        mock_capture_stderr.return_value = ("", 0)
+        terraform.perform_init(self.config)
+
+        prefetch = terraform.InitPrefetch(self.config)
+        prefetch.start()
+
+        self.assertTrue(prefetch.wait())
+        mock_run_with_prefix.assert_not_called()
+
+
+class TestPerformApply(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.template_dir = tmpdir.name
+        with open(os.path.join(self.template_dir, "setup.auto.tfvars"),
+                  "w") as f:
+            f.write('foo="bar"\n')
+        self.config = ConfigLoader()
+        self.config._config_fields = {
+            "TERRAFORM_TEMPLATE_DIR": self.template_dir
+        }
+        self.plan_path = os.path.join(self.template_dir, "terraform_plan")
+
+        cache_dir = os.path.join(self.template_dir, ".cache")
+        env = patch.dict(
+            os.environ, {
+                "TERRAFORM_PLAN_OUT_FILE": "terraform_plan",
+                "SKIP_CONFIRMATIONS": "true",
+                "CIVIFORM_DEPLOY_CACHE_DIR": cache_dir
+            })
+        env.start()
+        self.addCleanup(env.stop)
+
+    def _perform_apply(self, plan_exit_code, **kwargs):
+        """Runs perform_apply against a fake terraform and returns its result
+        and the commands that were run."""
+        commands = []
+
+        def capture_stderr(cmd):
+            commands.append(cmd)
+            with open(self.plan_path, "w") as f:
+                f.write("plan")
+            return "", plan_exit_code
+
+        def capture_json_events(cmd, on_event):
+            commands.append(cmd)
+            hook = {
+                "resource": {
+                    "addr": "aws_db_instance.db"
+                },
+                "action": "update"
+            }
+            on_event({"type": "apply_start", "hook": hook})
+            on_event(
+                {
+                    "type": "apply_complete",
+                    "hook": dict(hook, elapsed_seconds=312)
+                })
+            return "", 0
+
+        changes = [
+            deploy_timings.PlannedChange(
+                "aws_db_instance.db", "update",
+                deploy_timings.RDS_ENGINE_UPGRADE)
+        ]
+        with patch('cloud.shared.bin.lib.terraform.capture_stderr',
+                   side_effect=capture_stderr), patch(
+                       'cloud.shared.bin.lib.terraform.capture_json_events',
+                       side_effect=capture_json_events), patch(
+                           'cloud.shared.bin.lib.terraform._planned_changes',
+                           return_value=changes):
+            result = terraform.perform_apply(
+                self.config, initialize=False, **kwargs)
+        return result, commands
+
+    def test_empty_plan_is_not_applied(self):
+        result, commands = self._perform_apply(terraform.PLAN_NO_CHANGES)
+
+        self.assertTrue(result)
+        self.assertEqual(len(commands), 1)
+        self.assertIn("-detailed-exitcode -out=terraform_plan", commands[0])
+        self.assertFalse(os.path.exists(self.plan_path))
+
+    def test_saved_plan_is_applied(self):
+        result, commands = self._perform_apply(terraform.PLAN_HAS_CHANGES)
+
+        self.assertTrue(result)
+        self.assertEqual(len(commands), 2)
+        self.assertTrue(
+            commands[1].endswith(
+                " apply -input=false -compact-warnings -json terraform_plan"))
+        self.assertFalse(os.path.exists(self.plan_path))
+
+        history = terraform_events.load_history()
+        self.assertEqual(len(history), 1)
+        self.assertEqual(
+            history[0]["resources"], [
+                {
+                    "address": "aws_db_instance.db",
+                    "action": "update",
+                    "seconds": 312,
+                    "status": "complete",
+                    "label": deploy_timings.RDS_ENGINE_UPGRADE
+                }
+            ])
+
+    def test_targeted_plan(self):
+        result, commands = self._perform_apply(
+            terraform.PLAN_NO_CHANGES,
+            targets=["module.pgadmin", "aws_security_group.rds"],
+            refresh=False)
+
+        self.assertTrue(result)
+        self.assertTrue(
+            commands[0].endswith(
+                " -target=module.pgadmin -target=aws_security_group.rds -refresh=false"
+            ))
+
+    @patch('cloud.shared.bin.lib.terraform.print')
+    @patch('cloud.shared.bin.lib.terraform._current_lock')
+    def test_waits_for_lock(self, mock_current_lock, mock_print):
+        mock_current_lock.return_value = state_lock.LockInfo(
+            "0b8d6b6e-8b8e-4d5a-9a3c-2f1e6f4f1a2b", "other@host")
+        commands = []
+
+        def capture_stderr(cmd):
+            commands.append(cmd)
+            if len(commands) == 1:
+                return "Error: Error acquiring the state lock", 1
+            return "", terraform.PLAN_NO_CHANGES
+
+        with patch.dict(os.environ, {state_lock.WAIT_ENV_VAR: "10"}), patch(
+                'cloud.shared.bin.lib.terraform.capture_stderr',
+                side_effect=capture_stderr), patch(
+                    'cloud.shared.bin.lib.terraform.force_unlock'
+                ) as mock_force_unlock:
+            result = terraform.perform_apply(self.config, initialize=False)
+
+        self.assertTrue(result)
+        self.assertNotIn("-lock-timeout", commands[0])
+        self.assertTrue(commands[1].endswith(" -lock-timeout=30s"))
+        mock_force_unlock.assert_not_called()
+
+    @patch('cloud.shared.bin.lib.terraform.print')
+    @patch(
+        'cloud.shared.bin.lib.state_lock._in_initial_pid_namespace',
+        return_value=True)
+    @patch(
+        'cloud.shared.bin.lib.state_lock._terraform_running',
+        return_value=False)
+    @patch('cloud.shared.bin.lib.terraform._current_lock')
+    def test_releases_stale_lock(
+            self, mock_current_lock, mock_terraform_running, mock_namespace,
+            mock_print):
+        mock_current_lock.return_value = state_lock.LockInfo(
+            "0b8d6b6e-8b8e-4d5a-9a3c-2f1e6f4f1a2b", state_lock.current_who())
+        results = [
+            ("Error: Error acquiring the state lock", 1),
+            ("", terraform.PLAN_NO_CHANGES)
+        ]
+
+        with patch.dict(os.environ, {state_lock.WAIT_ENV_VAR: "10"}), patch(
+                'cloud.shared.bin.lib.terraform.capture_stderr',
+                side_effect=results) as mock_capture_stderr, patch(
+                    'cloud.shared.bin.lib.terraform.force_unlock'
+                ) as mock_force_unlock:
+            result = terraform.perform_apply(self.config, initialize=False)
+
+        self.assertTrue(result)
+        self.assertEqual(
+            mock_force_unlock.call_args.args[1],
+            "0b8d6b6e-8b8e-4d5a-9a3c-2f1e6f4f1a2b")
+        self.assertNotIn("-lock-timeout", mock_capture_stderr.call_args.args[0])
+
+    @patch('cloud.shared.bin.lib.terraform.print')
+    @patch('sys.stdin.isatty', return_value=False)
+    @patch('cloud.shared.bin.lib.terraform.force_unlock')
+    @patch('cloud.shared.bin.lib.terraform.capture_stderr')
+    @patch('cloud.shared.bin.lib.terraform._current_lock')
+    def test_stops_waiting_for_old_lock(
+            self, mock_current_lock, mock_capture_stderr, mock_force_unlock,
+            mock_isatty, mock_print):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        mock_current_lock.return_value = state_lock.LockInfo(
+            "0b8d6b6e-8b8e-4d5a-9a3c-2f1e6f4f1a2b",
+            "other@host",
+            created=now - datetime.timedelta(hours=2))
+        mock_capture_stderr.return_value = (
+            "Error: Error acquiring the state lock", 1)
+        env = {state_lock.WAIT_ENV_VAR: "10", state_lock.STALE_ENV_VAR: "60"}
+
+        with patch.dict(os.environ, env), self.assertRaises(SystemExit):
+            terraform.perform_apply(self.config, initialize=False)
+
+        # The old lock is reported but not released.
+        mock_force_unlock.assert_not_called()
+        self.assertEqual(mock_capture_stderr.call_count, 1)
+
+    def test_failed_plan(self):
+        result, commands = self._perform_apply(1)
+
+        self.assertFalse(result)
+        self.assertEqual(len(commands), 1)
+
+
+class TestCaptureStderr(unittest.TestCase):
+
+    @patch('cloud.shared.bin.lib.terraform.print')
+    def test_run_with_prefix(self, mock_print):
+        script = "import sys; print('out'); print('err', file=sys.stderr)"
+
+        exit_code = terraform._run_with_prefix(
+            f'{sys.executable} -c "{script}"', "[setup] ")
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(
+            sorted(call.args[0] for call in mock_print.call_args_list),
+            ["[setup] err\n", "[setup] out\n"])
+
+    @patch('cloud.shared.bin.lib.terraform.print')
+    def test_json_events(self, mock_print):
+        script = "import json; print(json.dumps({'type': 'diagnostic', '@message': 'Error: lock', 'diagnostic': {'severity': 'error', 'summary': 'Error acquiring the state lock', 'detail': 'ID: 123'}})); print('not json')"
+        events = []
+        output, exit_code = terraform.capture_json_events(
+            f'{sys.executable} -c "{script}"', events.append)
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual([event["type"] for event in events], ["diagnostic"])
+        self.assertIn("Error acquiring the state lock", output)
+        self.assertIn("ID: 123", output)
+        printed = "".join(call.args[0] for call in mock_print.call_args_list)
+        self.assertIn("Error: Error acquiring the state lock", printed)
+        self.assertIn("ID: 123", printed)
+        self.assertNotIn("Error: lock", printed)
+
+    @patch('cloud.shared.bin.lib.terraform.print')
+    def test_large_output_does_not_block(self, mock_print):
+        # Far more than a pipe buffer of output.
+        script = "import sys; [sys.stderr.write(f'line {i}\\n') for i in range(100000)]; sys.exit(3)"
+        output, exit_code = terraform.capture_stderr(
+            f'{sys.executable} -c "{script}"')
+
+        self.assertEqual(exit_code, 3)
+        self.assertEqual(mock_print.call_count, 100000)
+        lines = output.splitlines()
+        self.assertEqual(len(lines), terraform.STDERR_TAIL_LINES)
+        self.assertEqual(lines[-1], "line 99999")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,451 @@
+"""
+Index of the variables declared in a Terraform template.
+
+The .tf files of the template are scanned for top level blocks, and the type,
+default and description of each variable block are read. Nested blocks like
+validation {} are skipped, and strings, comments and heredocs are tokenized,
+so braces inside them don't end a block early. Defaults are converted to
+python values: strings, numbers, booleans, None for null, and lists and dicts
+of those. Types are kept as the source text, e.g. "map(string)".
+
+The other top level blocks are kept with the references in their body, to
+variables, locals, resources, data sources and modules, see
+template_layers.py.
+
+Parsing a file is cached by the sha256 of its contents, so the index is only
+rebuilt for files that changed.
+"""
+
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+# Parsed blocks of a .tf file, keyed by the sha256 of its contents.
+_parsed_files: Dict[str, List["Block"]] = {}
+
+_IDENTIFIER_REGEX = re.compile(r'[A-Za-z_][A-Za-z0-9_-]*')
+_NUMBER_REGEX = re.compile(r'-?[0-9]+(\.[0-9]+)?([eE][+-]?[0-9]+)?')
+_HEREDOC_REGEX = re.compile(r'<<(-?)([A-Za-z_][A-Za-z0-9_]*)[ \t]*\n')
+_REFERENCE_REGEX = re.compile(
+    r'(?<![A-Za-z0-9_.])((?:data\.)?[A-Za-z_][A-Za-z0-9_-]*\.[A-Za-z_][A-Za-z0-9_-]*)'
+)
+_ESCAPES = {'n': '\n', 'r': '\r', 't': '\t', '"': '"', '\\': '\\'}
+
+_NO_DEFAULT = object()
+
+
+class ParseError(Exception):
+    pass
+
+
+class TerraformVariable:
+
+    def __init__(
+            self,
+            name: str,
+            file: str,
+            type: Optional[str] = None,
+            default: Any = _NO_DEFAULT,
+            description: Optional[str] = None):
+        self.name = name
+        self.file = file
+        self.type = type
+        self._default = default
+        self.description = description
+
+    @property
+    def has_default(self) -> bool:
+        """Whether the variable has a default, which may be null. Variables
+        without a default are required."""
+        return self._default is not _NO_DEFAULT
+
+    @property
+    def default(self) -> Any:
+        return None if self._default is _NO_DEFAULT else self._default
+
+
+class Block:
+    """A top level block of a .tf file, e.g. resource "aws_s3_bucket" "files"
+    {...}."""
+
+    def __init__(self, type: str, labels: List[str], body: str, file: str):
+        self.type = type
+        self.labels = labels
+        self.body = body
+        """Source text between the braces."""
+        self.file = file
+
+    @property
+    def address(self) -> Optional[str]:
+        """The address of the block for -target, or None for blocks that
+        can't be targeted like variables and outputs."""
+        if self.type == 'resource' and len(self.labels) == 2:
+            return '.'.join(self.labels)
+        if self.type == 'data' and len(self.labels) == 2:
+            return 'data.' + '.'.join(self.labels)
+        if self.type == 'module' and len(self.labels) == 1:
+            return 'module.' + self.labels[0]
+        return None
+
+    @property
+    def references(self) -> Set[str]:
+        """The references in the body, see references(). References in
+        comments and descriptions are included too, which only ever adds
+        references."""
+        return references(self.body)
+
+
+class VariableIndex:
+
+    def __init__(self, variables: List[TerraformVariable]):
+        self._variables = {variable.name: variable for variable in variables}
+
+    def get(self, name: str) -> Optional[TerraformVariable]:
+        return self._variables.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._variables
+
+    def __iter__(self) -> Iterator[TerraformVariable]:
+        return iter(self._variables.values())
+
+    def __len__(self) -> int:
+        return len(self._variables)
+
+
+def load_index(template_dir: str) -> VariableIndex:
+    """Returns the variables declared in the .tf files of template_dir."""
+    return VariableIndex(
+        [
+            _variable(block)
+            for block in load_blocks(template_dir)
+            if _is_variable(block)
+        ])
+
+
+def load_blocks(template_dir: str) -> List[Block]:
+    """Returns the top level blocks of the .tf files of template_dir."""
+    blocks = []
+    for name in sorted(os.listdir(template_dir)):
+        if name.endswith('.tf'):
+            with open(os.path.join(template_dir, name), 'rb') as f:
+                content = f.read()
+            digest = hashlib.sha256(content).hexdigest()
+            if digest not in _parsed_files:
+                _parsed_files[digest] = parse_blocks(
+                    content.decode('utf-8'), name)
+            blocks.extend(_parsed_files[digest])
+    return blocks
+
+
+def format_default(value: Any) -> Optional[str]:
+    """Formats a default the way it would be written in a config file, or
+    returns None for null."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return str(value)
+
+
+def parse_variables(content: str, file: str = '') -> List[TerraformVariable]:
+    """Returns the variable blocks in the content of a .tf file."""
+    return [
+        _variable(block)
+        for block in parse_blocks(content, file)
+        if _is_variable(block)
+    ]
+
+
+def parse_blocks(content: str, file: str = '') -> List[Block]:
+    """Returns the top level blocks in the content of a .tf file."""
+    scanner = _Scanner(content)
+    blocks = []
+    while True:
+        scanner.skip_space()
+        if scanner.at_end():
+            return blocks
+        block_type = scanner.identifier()
+        labels = []
+        scanner.skip_space()
+        while scanner.peek() == '"':
+            labels.append(scanner.string())
+            scanner.skip_space()
+        if scanner.peek() == '=':
+            # Not valid at the top level of a .tf file, but harmless.
+            scanner.advance()
+            scanner.expression()
+            continue
+        scanner.expect('{')
+        start = scanner.pos
+        scanner.skip_block()
+        blocks.append(
+            Block(block_type, labels, content[start:scanner.pos - 1], file))
+
+
+def parse_attributes(content: str) -> Dict[str, str]:
+    """Returns the source text of the attributes in the body of a block, or
+    in a .tfvars file, keyed by name. Nested blocks are skipped."""
+    scanner = _Scanner(content)
+    attributes = {}
+    while True:
+        scanner.skip_space()
+        if scanner.at_end():
+            return attributes
+        key = scanner.key()
+        scanner.skip_space(newlines=False)
+        if scanner.peek() == '=':
+            scanner.advance()
+            attributes[key] = scanner.expression()
+        else:
+            # A nested block like validation {}.
+            while scanner.peek() == '"':
+                scanner.string()
+                scanner.skip_space(newlines=False)
+            scanner.expect('{')
+            scanner.skip_block()
+
+
+def references(expression: str) -> Set[str]:
+    """Returns the references in an expression, e.g. "var.app_prefix",
+    "local.tags", "aws_s3_bucket.files", "data.aws_vpc.external" or
+    "module.vpc". Other dotted names, like each.value, are included too and
+    simply don't match any variable, local or block."""
+    return set(_REFERENCE_REGEX.findall(expression))
+
+
+def _is_variable(block: Block) -> bool:
+    return block.type == 'variable' and len(block.labels) == 1
+
+
+def _variable(block: Block) -> TerraformVariable:
+    attributes = parse_attributes(block.body)
+    variable = TerraformVariable(block.labels[0], block.file)
+    if 'type' in attributes:
+        variable.type = attributes['type']
+    if 'default' in attributes:
+        variable._default = parse_literal(attributes['default'])
+    if 'description' in attributes:
+        description = parse_literal(attributes['description'])
+        variable.description = description if isinstance(
+            description, str) else attributes['description']
+    return variable
+
+
+def parse_literal(expression: str) -> Any:
+    """Converts a literal expression to a python value. Expressions that are
+    not literals, e.g. references, are returned as source text."""
+    scanner = _Scanner(expression)
+    try:
+        value = scanner.literal()
+        scanner.skip_space()
+        if scanner.at_end():
+            return value
+    except ParseError:
+        pass
+    return expression
+
+
+class _Scanner:
+
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+
+    def at_end(self) -> bool:
+        return self.pos >= len(self.text)
+
+    def peek(self, length: int = 1) -> str:
+        return self.text[self.pos:self.pos + length]
+
+    def advance(self, length: int = 1):
+        self.pos += length
+
+    def error(self, message: str) -> ParseError:
+        line = self.text.count('\n', 0, self.pos) + 1
+        return ParseError(f'line {line}: {message}')
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise self.error(f'expected {char!r}, got {self.peek()!r}')
+        self.advance()
+
+    def skip_space(self, newlines: bool = True):
+        """Skips whitespace and comments, and newlines if requested."""
+        while not self.at_end():
+            char = self.peek()
+            if char in ' \t\r' or (newlines and char == '\n'):
+                self.advance()
+            elif char == '#' or self.peek(2) == '//':
+                end = self.text.find('\n', self.pos)
+                self.pos = len(self.text) if end == -1 else end
+            elif self.peek(2) == '/*':
+                end = self.text.find('*/', self.pos + 2)
+                if end == -1:
+                    raise self.error('unterminated comment')
+                self.pos = end + 2
+            else:
+                return
+
+    def identifier(self) -> str:
+        match = _IDENTIFIER_REGEX.match(self.text, self.pos)
+        if not match:
+            raise self.error(f'expected an identifier, got {self.peek()!r}')
+        self.pos = match.end()
+        return match.group(0)
+
+    def key(self) -> str:
+        """Returns an object key or attribute name, quoted or not."""
+        return self.string() if self.peek() == '"' else self.identifier()
+
+    def string(self) -> str:
+        self.expect('"')
+        parts = []
+        while True:
+            if self.at_end():
+                raise self.error('unterminated string')
+            char = self.peek()
+            if char == '"':
+                self.advance()
+                return ''.join(parts)
+            if char == '\\':
+                escaped = self.peek(2)[1:]
+                if escaped == 'u':
+                    parts.append(
+                        chr(int(self.text[self.pos + 2:self.pos + 6], 16)))
+                    self.advance(6)
+                    continue
+                parts.append(_ESCAPES.get(escaped, escaped))
+                self.advance(2)
+            elif self.peek(3) in ('$${', '%%{'):
+                parts.append(self.peek(3)[1:])
+                self.advance(3)
+            elif self.peek(2) in ('${', '%{'):
+                # Interpolations may contain strings with quotes and braces.
+                start = self.pos
+                self.advance(2)
+                self._skip_until_close('}')
+                parts.append(self.text[start:self.pos])
+            else:
+                parts.append(char)
+                self.advance()
+
+    def at_heredoc(self) -> bool:
+        return bool(_HEREDOC_REGEX.match(self.text, self.pos))
+
+    def heredoc(self) -> str:
+        match = _HEREDOC_REGEX.match(self.text, self.pos)
+        if not match:
+            raise self.error('invalid heredoc')
+        indented, marker = match.group(1), match.group(2)
+        end = re.compile(rf'^[ \t]*{re.escape(marker)}[ \t]*$', re.MULTILINE)
+        end_match = end.search(self.text, match.end())
+        if not end_match:
+            raise self.error(f'unterminated heredoc {marker}')
+        lines = self.text[match.end():end_match.start()].split('\n')[:-1]
+        self.pos = end_match.end()
+        if indented:
+            indents = [
+                len(line) - len(line.lstrip(' \t'))
+                for line in lines
+                if line.strip()
+            ]
+            strip = min(indents) if indents else 0
+            lines = [line[strip:] for line in lines]
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def skip_block(self):
+        """Skips to after the '}' that closes the block that was opened."""
+        self._skip_until_close('}')
+
+    def _skip_until_close(self, close: str):
+        closers = {'{': '}', '[': ']', '(': ')'}
+        stack = [close]
+        while stack:
+            self.skip_space()
+            if self.at_end():
+                raise self.error(f'expected {stack[-1]!r}')
+            char = self.peek()
+            if char == '"':
+                self.string()
+            elif self.at_heredoc():
+                self.heredoc()
+            elif char in closers:
+                stack.append(closers[char])
+                self.advance()
+            elif char == stack[-1]:
+                stack.pop()
+                self.advance()
+            else:
+                self.advance()
+
+    def expression(self) -> str:
+        """Returns the source text of the expression of an attribute, which
+        ends at the first newline outside of brackets."""
+        self.skip_space(newlines=False)
+        start = self.pos
+        closers = {'{': '}', '[': ']', '(': ')'}
+        while not self.at_end():
+            char = self.peek()
+            if char in ('\n', '}', '#') or self.peek(2) == '//':
+                break
+            if char == '"':
+                self.string()
+            elif self.at_heredoc():
+                self.heredoc()
+            elif char in closers:
+                self.advance()
+                self._skip_until_close(closers[char])
+            else:
+                self.advance()
+        return self.text[start:self.pos].strip()
+
+    def literal(self) -> Any:
+        self.skip_space()
+        char = self.peek()
+        if char == '"':
+            return self.string()
+        if self.peek(2) == '<<':
+            return self.heredoc()
+        if char == '[':
+            self.advance()
+            return list(self._items(']'))
+        if char == '{':
+            self.advance()
+            return dict(self._items('}', keyed=True))
+        number = _NUMBER_REGEX.match(self.text, self.pos)
+        if number:
+            self.pos = number.end()
+            text = number.group(0)
+            if number.group(1) or number.group(2):
+                return float(text)
+            return int(text)
+        keyword = self.identifier()
+        if keyword in ('true', 'false'):
+            return keyword == 'true'
+        if keyword == 'null':
+            return None
+        raise self.error(f'{keyword} is not a literal')
+
+    def _items(self, close: str, keyed: bool = False) -> Iterator:
+        while True:
+            self.skip_space()
+            if self.peek() == close:
+                self.advance()
+                return
+            if keyed:
+                key = self.key()
+                self.skip_space()
+                if self.peek() not in ('=', ':'):
+                    raise self.error('expected = or :')
+                self.advance()
+                yield key, self.literal()
+            else:
+                yield self.literal()
+            self.skip_space()
+            if self.peek() == ',':
+                self.advance()
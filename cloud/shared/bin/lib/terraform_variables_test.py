@@ -0,0 +1,173 @@
+import os
+import tempfile
+import unittest
+
+from cloud.shared.bin.lib import terraform_variables
+"""
+Tests for terraform_variables.py.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/shared/bin/lib/terraform_variables_test.py
+"""
+
+VARIABLES_TF = '''
+# A comment with a { brace
+variable "postgresql_version" {
+  type        = string
+  description = "Version of PostgreSQL. Must look like {major}.{minor}"
+  default     = "16"
+
+  validation {
+    condition     = can(regex("^[0-9]+", var.postgresql_version))
+    error_message = "Must start with a number, e.g. \\"16\\"."
+  }
+}
+
+variable "ecs_task_memory" {
+  type    = number
+  default = 6144 // Inline comment
+}
+
+variable "private_subnets" {
+  type = list(string)
+  default = [
+    "10.0.1.0/24",
+    "10.0.2.0/24", # Trailing comma below.
+  ]
+}
+
+variable "tags" {
+  type    = map(string)
+  default = { Name = "civiform", "app:prefix" : "test" }
+}
+
+variable "scraper_image" {
+  type    = string
+  default = null
+}
+
+variable "app_prefix" {
+  type        = string
+  description = <<-EOT
+    Prefix of all resources.
+      Indented line.
+    EOT
+}
+
+variable "dbaccess" { default = false }
+
+/* A block comment
+variable "commented_out" {}
+*/
+
+output "validate_memory" {
+  value = null
+  precondition {
+    condition     = var.ecs_task_memory > 0
+    error_message = "}"
+  }
+}
+'''
+
+
+class TestParseVariables(unittest.TestCase):
+
+    def setUp(self):
+        self.variables = {
+            variable.name: variable
+            for variable in terraform_variables.parse_variables(
+                VARIABLES_TF, "variables.tf")
+        }
+
+    def test_finds_all_variables(self):
+        self.assertEqual(
+            list(self.variables), [
+                "postgresql_version", "ecs_task_memory", "private_subnets",
+                "tags", "scraper_image", "app_prefix", "dbaccess"
+            ])
+
+    def test_nested_blocks_and_braces_in_strings(self):
+        variable = self.variables["postgresql_version"]
+
+        self.assertEqual(variable.type, "string")
+        self.assertEqual(variable.default, "16")
+        self.assertEqual(
+            variable.description,
+            "Version of PostgreSQL. Must look like {major}.{minor}")
+
+    def test_non_string_defaults(self):
+        self.assertEqual(self.variables["ecs_task_memory"].default, 6144)
+        self.assertEqual(
+            self.variables["private_subnets"].default,
+            ["10.0.1.0/24", "10.0.2.0/24"])
+        self.assertEqual(
+            self.variables["tags"].default, {
+                "Name": "civiform",
+                "app:prefix": "test"
+            })
+        self.assertIs(self.variables["dbaccess"].default, False)
+
+    def test_null_default_is_not_required(self):
+        self.assertTrue(self.variables["scraper_image"].has_default)
+        self.assertIsNone(self.variables["scraper_image"].default)
+        self.assertFalse(self.variables["app_prefix"].has_default)
+
+    def test_heredoc_description(self):
+        self.assertEqual(
+            self.variables["app_prefix"].description,
+            "Prefix of all resources.\n  Indented line.\n")
+
+    def test_parse_blocks(self):
+        blocks = terraform_variables.parse_blocks(
+            VARIABLES_TF + 'resource "aws_s3_bucket" "files" {\n'
+            '  bucket = "${var.app_prefix}-files"\n'
+            '  tags   = local.tags\n}\n')
+
+        self.assertEqual(
+            [block.address for block in blocks[-2:]],
+            [None, "aws_s3_bucket.files"])
+        self.assertEqual(
+            blocks[-1].references, {"var.app_prefix", "local.tags"})
+        self.assertEqual(
+            terraform_variables.parse_attributes(blocks[-1].body), {
+                "bucket": '"${var.app_prefix}-files"',
+                "tags": "local.tags"
+            })
+
+    def test_format_default(self):
+        self.assertIsNone(terraform_variables.format_default(None))
+        self.assertEqual(terraform_variables.format_default(False), "false")
+        self.assertEqual(terraform_variables.format_default(6144), "6144")
+        self.assertEqual(
+            terraform_variables.format_default(["a", "b"]), '["a", "b"]')
+
+
+class TestLoadIndex(unittest.TestCase):
+
+    def test_index_spans_files_and_follows_changes(self):
+        with tempfile.TemporaryDirectory() as template_dir:
+            with open(os.path.join(template_dir, "variables.tf"), "w") as f:
+                f.write(VARIABLES_TF)
+            extra_path = os.path.join(template_dir, "extra.tf")
+            with open(extra_path, "w") as f:
+                f.write('variable "extra" {\n  default = 1\n}\n')
+
+            index = terraform_variables.load_index(template_dir)
+            self.assertIn("extra", index)
+            self.assertEqual(index.get("extra").file, "extra.tf")
+            self.assertEqual(len(index), 8)
+
+            with open(extra_path, "w") as f:
+                f.write('variable "extra" {\n  default = 2\n}\n')
+            self.assertEqual(
+                terraform_variables.load_index(template_dir).get(
+                    "extra").default, 2)
+
+    def test_repo_templates_parse(self):
+        for template_dir in ["cloud/aws/templates/aws_oidc",
+                             "cloud/azure/templates/azure_saml_ses"]:
+            index = terraform_variables.load_index(template_dir)
+            self.assertIn("civiform_server_environment_variables", index)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+Compiles infra variable definitions into a validation plan.
+
+The variable_definitions.json files are interpreted once into a list of
+VariableValidators with frozenset enum values and regexes that are compiled
+once, on first use. Validating a config is then a tight loop over the validators,
+which matters when validating many configs against the same definitions.
+
+Plans loaded from files are cached by the files' modification time and size,
+and by their content hash, so repeatedly loading unchanged files is free.
+"""
+
+import hashlib
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+
+class VariableValidator:
+
+    __slots__ = (
+        "name", "required", "enum_values", "enum_set", "value_regex", "pattern",
+        "pattern_error_message")
+
+    def __init__(self, name: str, definition: dict):
+        self.name = name
+        self.required = definition.get("required", False)
+
+        self.enum_values = None
+        self.enum_set = None
+        if definition.get("type") == "enum":
+            self.enum_values = definition.get("values")
+            self.enum_set = frozenset(self.enum_values)
+
+        self.value_regex = definition.get("value_regex", None)
+        self.pattern_error_message = definition.get(
+            "value_regex_error_message", None)
+        # Compiled on first use so that definitions are only rejected when a
+        # value is actually checked against them.
+        self.pattern = None
+
+    def validate(self, config_value: Optional[str]) -> Optional[str]:
+        """Returns the validation error for the value, or None if it is
+        valid."""
+        if config_value is None:
+            if self.required:
+                return f"'{self.name}' is required but not set"
+            return None
+
+        if self.enum_set is not None and config_value not in self.enum_set:
+            return f"'{self.name}': '{config_value}' is not a valid enum value. Valid values are {self.enum_values}"
+
+        if not self.value_regex:
+            return None
+        if self.pattern is None:
+            # TODO(#2887): If we validate variable definitions prior to
+            # trying to validate an actual configuration, we can assume that
+            # this will always be set if value_regex is provided.
+            # There is currently a presumbit check (validate_variable_definitions)
+            # but no code that does the check at runtime to catch isses
+            # during development.
+            if not self.pattern_error_message:
+                raise ValueError(
+                    f"'{self.name}': no value_regex_error_message configured")
+            self.pattern = re.compile(self.value_regex)
+        if not self.pattern.fullmatch(config_value):
+            return f"'{self.name}': '{config_value}' not valid: {self.pattern_error_message}"
+
+        return None
+
+
+class ValidationPlan:
+
+    def __init__(self, definitions: dict):
+        self.definitions = definitions
+        """The variable definitions the plan was compiled from."""
+        self.validators = [
+            VariableValidator(name, definition)
+            for name, definition in definitions.items()
+        ]
+
+    def validate(self, config_fields: dict) -> List[str]:
+        """Returns any validation errors for fields in config_fields."""
+        errors = []
+        get = config_fields.get
+        for validator in self.validators:
+            error = validator.validate(get(validator.name))
+            if error is not None:
+                errors.append(error)
+        return errors
+
+
+_plans_by_stat: Dict[Tuple, ValidationPlan] = {}
+_plans_by_hash: Dict[str, ValidationPlan] = {}
+
+
+def load_plan(*definition_file_paths: str) -> ValidationPlan:
+    """Returns the plan for the merged definitions in the given files. Later
+    files override definitions in earlier ones."""
+    stat_key = tuple(_stat_signature(path) for path in definition_file_paths)
+    plan = _plans_by_stat.get(stat_key)
+    if plan is not None:
+        return plan
+
+    contents = []
+    for path in definition_file_paths:
+        with open(path, "rb") as f:
+            contents.append(f.read())
+    digest = hashlib.sha256(b"\0".join(contents)).hexdigest()
+
+    plan = _plans_by_hash.get(digest)
+    if plan is None:
+        definitions = {}
+        for content in contents:
+            # note: loading automatically removes duplicates
+            definitions.update(json.loads(content))
+        plan = ValidationPlan(definitions)
+        _plans_by_hash[digest] = plan
+    _plans_by_stat[stat_key] = plan
+    return plan
+
+
+def _stat_signature(path: str) -> Tuple:
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+import unittest
+
+from cloud.shared.bin.lib.validation_plan import ValidationPlan, load_plan
+"""
+Tests for the infra variable validation plan. Validation error messages are
+covered through ConfigLoader in config_loader_test.py.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/shared/bin/lib/validation_plan_test.py
+"""
+
+
+class TestValidationPlan(unittest.TestCase):
+
+    def test_integer_and_float_values_are_not_type_checked(self):
+        plan = ValidationPlan(
+            {
+                "COUNT": {
+                    "required": True,
+                    "type": "integer"
+                },
+                "RATIO": {
+                    "required": True,
+                    "type": "float"
+                },
+            })
+
+        self.assertEqual(plan.validate({"COUNT": "three", "RATIO": "half"}), [])
+
+    def test_invalid_enum_value_skips_regex(self):
+        definition = {
+            "required": True,
+            "type": "enum",
+            "values": ["abc"],
+            "value_regex": "[a-z]+",
+            "value_regex_error_message": "lowercase only"
+        }
+        plan = ValidationPlan({"FOO": definition})
+
+        self.assertEqual(
+            plan.validate({"FOO": "XYZ"}), [
+                "'FOO': 'XYZ' is not a valid enum value. Valid values are ['abc']"
+            ])
+
+    def test_regex_without_error_message_fails_when_value_is_set(self):
+        definition = {
+            "required": False,
+            "type": "string",
+            "value_regex": "[a-z]+"
+        }
+        plan = ValidationPlan({"FOO": definition})
+
+        self.assertEqual(plan.validate({}), [])
+        with self.assertRaises(ValueError):
+            plan.validate({"FOO": "abc"})
+
+    def test_load_plan_is_cached(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            shared = os.path.join(tmpdir, "shared.json")
+            template = os.path.join(tmpdir, "template.json")
+            with open(shared, "w") as f:
+                json.dump({"FOO": {"required": True, "type": "string"}}, f)
+            with open(template, "w") as f:
+                json.dump({"FOO": {"required": False, "type": "string"}}, f)
+
+            plan = load_plan(shared, template)
+            self.assertIs(load_plan(shared, template), plan)
+            # Touching a file without changing its content reuses the plan.
+            os.utime(template, (1, 1))
+            self.assertIs(load_plan(shared, template), plan)
+
+        # Template definitions override shared ones.
+        self.assertEqual(plan.validate({}), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,6 +6,8 @@ If we want to store non string values here we will need to add in the variables
 and do a lil more advanced file writing
 """
 
+import hashlib
+import io
 import json
 
 
@@ -15,24 +17,46 @@ class TfVarWriter:
         self.filepath = filepath
 
     # a json of key: vals to turn into a tfvars
-    def write_variables(self, config_vars: dict):
-        with open(self.filepath, "w") as tf_vars_file:
-            for name, definition in config_vars.items():
-                # Special key that has a dict value.
-                if name == "civiform_server_environment_variables":
-                    tf_vars_file.write(
-                        "civiform_server_environment_variables = {\n")
-                    for key, value in definition.items():
-                        if value is not None:
-                            tf_vars_file.write(f'  "{key}"="{value}"\n')
-                    tf_vars_file.write("}\n")
-                    continue
-
-                if definition is not None:
-                    try:
-                        parsed_definition = json.loads(definition)
-                    except json.JSONDecodeError as e:
-                        parsed_definition = definition
-                    formatted_value = definition if isinstance(
-                        parsed_definition, list) else f'"{definition}"'
-                    tf_vars_file.write(f'{name.lower()}={formatted_value}\n')
+    def write_variables(self, config_vars: dict) -> bool:
+        """Writes the variables to the file, unless the file already has the
+        same content. Leaving an unchanged file untouched keeps its mtime, so
+        anything keyed on the file does not see a change.
+
+        Returns whether the file was written.
+        """
+        content = self.render_variables(config_vars).encode("utf-8")
+        if self._existing_digest() == hashlib.sha256(content).hexdigest():
+            return False
+        with open(self.filepath, "wb") as tf_vars_file:
+            tf_vars_file.write(content)
+        return True
+
+    def render_variables(self, config_vars: dict) -> str:
+        tf_vars_file = io.StringIO()
+        for name, definition in config_vars.items():
+            # Special key that has a dict value.
+            if name == "civiform_server_environment_variables":
+                tf_vars_file.write(
+                    "civiform_server_environment_variables = {\n")
+                for key, value in definition.items():
+                    if value is not None:
+                        tf_vars_file.write(f'  "{key}"="{value}"\n')
+                tf_vars_file.write("}\n")
+                continue
+
+            if definition is not None:
+                try:
+                    parsed_definition = json.loads(definition)
+                except json.JSONDecodeError as e:
+                    parsed_definition = definition
+                formatted_value = definition if isinstance(
+                    parsed_definition, list) else f'"{definition}"'
+                tf_vars_file.write(f'{name.lower()}={formatted_value}\n')
+        return tf_vars_file.getvalue()
+
+    def _existing_digest(self):
+        try:
+            with open(self.filepath, "rb") as tf_vars_file:
+                return hashlib.sha256(tf_vars_file.read()).hexdigest()
+        except FileNotFoundError:
+            return None
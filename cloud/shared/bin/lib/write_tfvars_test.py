@@ -49,6 +49,17 @@ class TestWriteTfVars(unittest.TestCase):
                 'test="true"\nciviform_server_environment_variables = {\n  "MY_VAR"="Is cool"\n  "FEATURE_ENABLED"="false"\n}\n'
             )
 
+    def test_unchanged_content_is_not_rewritten(self):
+        config_loader = TfVarWriter(self.fake_tfvars_filename)
+        self.assertTrue(config_loader.write_variables({"test": "success"}))
+        os.utime(self.fake_tfvars_filename, (1, 1))
+
+        self.assertFalse(config_loader.write_variables({"test": "success"}))
+        self.assertEqual(os.stat(self.fake_tfvars_filename).st_mtime, 1)
+
+        self.assertTrue(config_loader.write_variables({"test": "changed"}))
+        self.assertNotEqual(os.stat(self.fake_tfvars_filename).st_mtime, 1)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,22 @@
+import importlib
+import os
+from typing import List
+
+from cloud.shared.bin.lib import command_requirements
+from cloud.shared.bin.lib.config_loader import ConfigLoader
+
+# The backend config is written with the locking from the config file.
+REQUIREMENTS = frozenset([command_requirements.BACKEND])
+
+
+def run(config: ConfigLoader, params: List[str]):
+    source = os.path.join(
+        'cloud', config.get_cloud_provider(), 'bin', 'migrate_state_locking.py')
+    if os.path.exists(source):
+        migrate_module = importlib.import_module(
+            f'cloud.{config.get_cloud_provider()}.bin.migrate_state_locking')
+        migrate_module.run(config, params)
+    else:
+        exit(
+            f'migrate_state_locking command not implemented for {config.get_cloud_provider()}'
+        )
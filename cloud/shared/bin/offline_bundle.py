@@ -0,0 +1,122 @@
+#! /usr/bin/env python3
+"""
+Exports and imports offline bundles, see lib/offline_bundle.py.
+
+On a machine with access to GitHub and PyPI, from the root of the repository:
+
+  cloud/shared/bin/offline_bundle.py export --tag v1.50.0 --output bundle.tgz
+
+Then copy bundle.tgz to the restricted network and set
+CIVIFORM_DEPLOY_BUNDLE=/path/to/bundle.tgz when running the deploy tool.
+cloud/shared/bin/run runs the import command itself to install the wheels.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# Need to add current directory to PYTHONPATH if this script is run directly.
+sys.path.append(os.getcwd())
+
+from cloud.shared.bin.lib import offline_bundle
+from cloud.shared.bin.lib.print import print
+
+DEPENDENCIES_FILE = "cloud/shared/bin/env-var-docs-python-dependencies.txt"
+PARSER_PACKAGE = "env-var-docs @ git+https://github.com/civiform/civiform.git@{commit_sha}#subdirectory=env-var-docs/parser-package"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    export_parser = subparsers.add_parser(
+        'export', help='Create a bundle for the given tags.')
+    export_parser.add_argument(
+        '--tag',
+        action='append',
+        required=True,
+        help='Civiform image tag to include. Can be repeated.')
+    export_parser.add_argument(
+        '--output', required=True, help='Path of the bundle to write.')
+    export_parser.add_argument(
+        '--no-wheels',
+        action='store_true',
+        help='Do not include python wheels, e.g. if PyPI is reachable.')
+
+    import_parser = subparsers.add_parser(
+        'import', help='Import a bundle into the local caches.')
+    import_parser.add_argument('bundle', help='Path of the bundle.')
+    import_parser.add_argument(
+        '--wheel-dir', help='Directory to extract the python wheels to.')
+
+    args = parser.parse_args()
+    if args.action == 'export':
+        export(args.tag, args.output, not args.no_wheels)
+    else:
+        try:
+            offline_bundle.import_bundle(args.bundle, args.wheel_dir)
+        except (offline_bundle.BundleError, OSError) as e:
+            exit(f"Could not import the offline bundle {args.bundle}: {e}")
+
+
+def export(tags, output_path, include_wheels):
+    # Exporting needs network access, which importing must not.
+    import requests
+    from cloud.shared.bin.lib.config_loader import ConfigLoader
+
+    if offline_bundle.is_offline():
+        exit(f"Unset {offline_bundle.BUNDLE_ENV_VAR} to export a bundle.")
+
+    config_loader = ConfigLoader()
+    resolved_tags = {}
+    env_var_docs = {}
+    for tag in tags:
+        try:
+            resolved_tag = config_loader.resolve_tag(tag)
+        except ConfigLoader.VersionNotFoundError as e:
+            exit(f"\n{e}")
+        except requests.RequestException as e:
+            exit(f"\nCould not reach the GitHub API to resolve {tag}: {e}")
+        resolved_tags[resolved_tag.tag] = resolved_tag.commit_sha
+        docs = config_loader._download_env_var_docs(resolved_tag.tag)
+        env_var_docs[resolved_tag.commit_sha] = docs.read()
+
+    with tempfile.TemporaryDirectory() as wheel_dir:
+        if include_wheels:
+            _build_wheels(wheel_dir, set(resolved_tags.values()))
+        offline_bundle.export_bundle(
+            output_path, resolved_tags, env_var_docs,
+            wheel_dir if include_wheels else None)
+    print(f"Wrote offline bundle {output_path}")
+
+
+def _build_wheels(wheel_dir, commit_shas):
+    """Builds the wheels into wheel_dir, laid out like the bundle."""
+    common_dir = os.path.join(wheel_dir, "common")
+    _pip_wheel(common_dir, "-r", DEPENDENCIES_FILE)
+    for commit_sha in sorted(commit_shas):
+        # The parser is built with its dependencies, which are shared.
+        build_dir = os.path.join(wheel_dir, f"build-{commit_sha}")
+        _pip_wheel(build_dir, PARSER_PACKAGE.format(commit_sha=commit_sha))
+        sha_dir = os.path.join(wheel_dir, commit_sha)
+        os.makedirs(sha_dir)
+        for name in os.listdir(build_dir):
+            is_parser = name.startswith("env_var_docs-")
+            shutil.move(
+                os.path.join(build_dir, name),
+                os.path.join(sha_dir if is_parser else common_dir, name))
+        os.rmdir(build_dir)
+
+
+def _pip_wheel(wheel_dir, *requirements):
+    subprocess.check_call(
+        [sys.executable, "-m", "pip", "wheel", "--wheel-dir", wheel_dir] +
+        list(requirements),
+        stdout=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#! /usr/bin/env python3
+"""
+Resolves a CiviForm image tag to the commit it was built from.
+
+Called once by cloud/shared/bin/run before run.py starts. The result is
+written to the --output file, which run.py reads through --resolved-tag-file
+so the tag is not resolved again, and printed to stdout for the bash wrapper,
+one field per line, in the order tag, short sha, commit sha.
+"""
+
+import argparse
+import os
+import sys
+
+import requests
+
+# Need to add current directory to PYTHONPATH if this script is run directly.
+sys.path.append(os.getcwd())
+
+from cloud.shared.bin.lib.config_loader import ConfigLoader
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tag', required=True, help='Civiform image tag.')
+    parser.add_argument(
+        '--image-digest',
+        help='Digest of the image the tag referred to when it was pulled.')
+    parser.add_argument(
+        '--output',
+        required=True,
+        help='Path of the file to write the resolved tag to.')
+    args = parser.parse_args()
+
+    try:
+        resolved_tag = ConfigLoader().resolve_tag(args.tag, args.image_digest)
+    except ConfigLoader.VersionNotFoundError as e:
+        # Adding a newline before the error message helps it stand out to the user
+        exit(f"\n{e}")
+    except requests.RequestException as e:
+        exit(f"\nCould not reach the GitHub API to resolve {args.tag}: {e}")
+
+    resolved_tag.save(args.output)
+    sys.stdout.write(
+        f"{resolved_tag.tag}\n{resolved_tag.short_sha}\n{resolved_tag.commit_sha}\n"
+    )
+
+
+if __name__ == "__main__":
+    main()
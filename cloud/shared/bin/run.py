@@ -5,7 +5,6 @@ import shlex
 import os
 import sys
 import importlib
-import re
 
 # Need to add current directory to PYTHONPATH if this script is run directly.
 sys.path.append(os.getcwd())
@@ -13,11 +12,11 @@ sys.path.append(os.getcwd())
 from cloud.shared.bin.lib.config_loader import ConfigLoader
 from cloud.shared.bin.lib.print import print
 from cloud.shared.bin.lib import backend_setup
+from cloud.shared.bin.lib import command_requirements
 from cloud.shared.bin.lib import terraform
+from cloud.shared.bin.lib.resolved_tag import ResolvedTag, is_release_tag, normalize_tag
 from cloud.aws.templates.aws_oidc.bin.aws_cli import AwsCli
 
-_CIVIFORM_RELEASE_TAG_REGEX = re.compile(r'^v?[0-9]+\.[0-9]+\.[0-9]+$')
-
 
 def main():
     parser = argparse.ArgumentParser()
@@ -38,6 +37,11 @@ def main():
         help=
         'Digest value for the Terraform lock table to set in DynamoDB. If multiple processes are doing a deploy, or an error occurred in a previous deploy that prevented Terraform from cleaning up after itself, this value may need updating. Only works on AWS deployments.'
     )
+    parser.add_argument(
+        '--resolved-tag-file',
+        help=
+        'File written by resolve_tag.py with the commit the tag resolves to. Avoids resolving the tag again.'
+    )
 
     args = parser.parse_args()
     if args.tag:
@@ -50,16 +54,33 @@ def main():
 
     os.environ['TERRAFORM_PLAN_OUT_FILE'] = 'terraform_plan'
 
+    command_module = None
+    if args.command:
+        cmd = shlex.split(args.command)[0]
+        params = shlex.split(args.command)[1:]
+        if not os.path.exists(f'cloud/shared/bin/{cmd}.py'):
+            exit(f'Command {cmd} not found.')
+        command_module = importlib.import_module(f'cloud.shared.bin.{cmd}')
+        if not command_module:
+            exit(f'Command {cmd} not found.')
+    requirements = command_requirements.for_command(command_module)
+
     config = ConfigLoader()
-    validation_errors = config.load_config(args.config)
+    if args.resolved_tag_file and os.path.exists(args.resolved_tag_file):
+        config.set_resolved_tag(ResolvedTag.load(args.resolved_tag_file))
+    validation_errors = config.load_config(
+        args.config,
+        load_server_env_var_docs=command_requirements.SERVER_ENV_VAR_DOCS
+        in requirements)
     if validation_errors:
         new_line = '\n\t'
         exit(
             f'Found the following validation errors: {new_line}{f"{new_line}".join(validation_errors)}'
         )
 
-    # Setup backend
-    backend_setup.setup_backend(config)
+    # Setup backend. Force unlocking runs terraform, which needs it too.
+    if command_requirements.BACKEND in requirements or args.force_unlock:
+        backend_setup.setup_backend(config)
 
     # Run the command to force unlock the TF state lock
     if args.force_unlock:
@@ -74,22 +95,16 @@ def main():
         aws.set_lock_table_digest_value(args.lock_table_digest_value)
 
     # Write the passthrough vars to a temporary file
-    print("Writing TF Vars file")
-    config.write_tfvars_file()
+    if command_requirements.TFVARS in requirements:
+        print("Writing TF Vars file")
+        config.write_tfvars_file()
 
-    if args.command:
-        cmd = shlex.split(args.command)[0]
-        params = shlex.split(args.command)[1:]
-        if not os.path.exists(f'cloud/shared/bin/{cmd}.py'):
-            exit(f'Command {cmd} not found.')
-        command_module = importlib.import_module(f'cloud.shared.bin.{cmd}')
-        if not command_module:
-            exit(f'Command {cmd} not found.')
+    if command_module:
         command_module.run(config, params)
 
 
 def validate_tag(tag):
-    if _CIVIFORM_RELEASE_TAG_REGEX.match(tag):
+    if is_release_tag(tag):
         return True
 
     print(
@@ -112,11 +127,5 @@ def validate_tag(tag):
     return resp.lower().strip() in ['y', 'yes']
 
 
-def normalize_tag(tag):
-    if _CIVIFORM_RELEASE_TAG_REGEX.match(tag) and not tag[0] == 'v':
-        return f'v{tag}'
-    return tag
-
-
 if __name__ == "__main__":
     main()
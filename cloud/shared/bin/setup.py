@@ -7,6 +7,7 @@ from typing import List
 from cloud.shared.bin.lib.config_loader import ConfigLoader
 from cloud.shared.bin.lib.setup_class_loader import get_config_specific_setup
 from cloud.shared.bin.lib.print import print
+from cloud.shared.bin.lib import deploy_timings
 from cloud.shared.bin.lib import terraform
 from cloud.shared.bin import destroy
 from cloud.shared.bin.lib.color import red, cyan
@@ -111,8 +112,13 @@ def run(config: ConfigLoader, params: List[str]):
                 exit(1)
 
         print("Starting pre-terraform setup")
+        # The main template's providers and modules don't depend on the
+        # backend resources, download them while those are set up.
+        init_prefetch = terraform.InitPrefetch(config)
+        init_prefetch.start()
         if not template_setup.pre_terraform_setup():
             raise Exception("Setting up terraform backend resources failed")
+        init_prefetch.wait()
 
         ###############################################################################
         # Terraform Init/Plan/Apply
@@ -127,7 +133,10 @@ def run(config: ConfigLoader, params: List[str]):
         ###############################################################################
         if template_setup.requires_post_terraform_setup():
             print("Starting post-terraform setup")
-            template_setup.post_terraform_setup()
+            with deploy_timings.phase('post_setup'):
+                template_setup.post_terraform_setup()
+        deploy_timings.record_deploy(
+            'setup', app_prefix=config.app_prefix, image_tag=image_tag)
 
         subprocess.run(
             [
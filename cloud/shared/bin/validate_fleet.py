@@ -0,0 +1,188 @@
+#! /usr/bin/env python3
+"""
+Validates many civiform_config.sh files at once and prints one JSON report.
+
+The variable definitions and env-var-docs are loaded once per distinct
+template directory and image tag rather than once per config, and the
+configs are then validated in parallel in a process pool. Run it from the
+root of the repository:
+
+  cloud/shared/bin/validate-fleet tenants/*/civiform_config.sh
+
+The image tag of each config is its CIVIFORM_VERSION, unless --tag is given.
+Release tags are normalized to their "v" prefixed form.
+Server variables can only be validated for tags that resolve to a commit;
+for other tags, e.g. "latest", only the infra variables are validated and a
+warning is added to the report.
+
+The exit code is 1 if any config is invalid.
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import json
+import os
+import re
+import sys
+from typing import Dict, List, Optional
+
+# Need to add current directory to PYTHONPATH if this script is run directly.
+sys.path.append(os.getcwd())
+
+from cloud.shared.bin.lib import validation_plan
+from cloud.shared.bin.lib.config_loader import ConfigLoader
+from cloud.shared.bin.lib.config_parser import ConfigParser
+from cloud.shared.bin.lib.print import print
+from cloud.shared.bin.lib.resolved_tag import normalize_tag
+
+_ANSI_ESCAPE_REGEX = re.compile(r'\x1b\[[0-9;]*m')
+
+# Set in each worker process by _init_worker.
+_plans: Dict[str, validation_plan.ValidationPlan] = {}
+_env_var_docs: Dict[str, dict] = {}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'configs', nargs='+', help='Paths to civiform_config.sh files.')
+    parser.add_argument(
+        '--tag',
+        help='Civiform image tag to validate every config against, instead '
+        'of the CIVIFORM_VERSION set in each config.')
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=os.cpu_count(),
+        help='Number of configs to validate in parallel.')
+    parser.add_argument(
+        '--output', help='Write the report to this file instead of stdout.')
+    args = parser.parse_args()
+
+    report = validate_fleet(args.configs, args.tag, args.jobs)
+    report_json = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report_json + '\n')
+    else:
+        sys.stdout.write(report_json + '\n')
+
+    summary = report['summary']
+    print(
+        f"Validated {summary['configs']} configs, {summary['invalid']} invalid."
+    )
+    if not report['valid']:
+        exit(1)
+
+
+def validate_fleet(
+        config_paths: List[str], tag: Optional[str], jobs: int) -> dict:
+    results = []
+    pending = []
+    plans = {}
+    env_var_docs = {}
+    config_loader = ConfigLoader()
+
+    for path in config_paths:
+        result = {
+            'path': path,
+            'tag': None,
+            'template_dir': None,
+            'valid': False,
+            'errors': [],
+            'warnings': [],
+        }
+        results.append(result)
+
+        try:
+            # ConfigParser prints progress to stdout, which holds the report.
+            with contextlib.redirect_stdout(sys.stderr):
+                config_fields = ConfigParser().parse_config(path)
+        except (SystemExit, OSError, ValueError, IndexError) as e:
+            result['errors'].append(f'Could not parse config: {e}')
+            continue
+
+        config_tag = tag or config_fields.get('CIVIFORM_VERSION')
+        if config_tag:
+            # "1.2.3" and "v1.2.3" name the same version and share its docs.
+            config_tag = normalize_tag(config_tag.strip())
+        template_dir = config_fields.get('TERRAFORM_TEMPLATE_DIR')
+        result['tag'] = config_tag
+        result['template_dir'] = template_dir
+
+        if not template_dir or not os.path.isdir(template_dir):
+            result['errors'].append(
+                f'Could not find template directory {template_dir}')
+            continue
+        if template_dir not in plans:
+            plans[template_dir] = validation_plan.load_plan(
+                os.path.join(
+                    os.getcwd(), 'cloud', 'shared',
+                    'variable_definitions.json'),
+                os.path.join(template_dir, 'variable_definitions.json'))
+
+        if config_tag and config_tag not in env_var_docs:
+            env_var_docs[config_tag] = _load_env_var_docs(
+                config_loader, config_tag)
+        if not env_var_docs.get(config_tag):
+            result['warnings'].append(
+                f'Server variables were not validated, could not load env-var-docs for tag {config_tag}'
+            )
+
+        pending.append((result, (template_dir, config_tag, config_fields)))
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker,
+            initargs=(plans, env_var_docs)) as executor:
+        futures = [
+            executor.submit(_validate_config, *task) for _, task in pending
+        ]
+        for (result, _), future in zip(pending, futures):
+            result['errors'].extend(future.result())
+            result['valid'] = not result['errors']
+
+    invalid = sum(1 for result in results if not result['valid'])
+    return {
+        'valid': invalid == 0,
+        'summary': {
+            'configs': len(results),
+            'invalid': invalid
+        },
+        'configs': results,
+    }
+
+
+def _load_env_var_docs(config_loader: ConfigLoader, tag: str) -> dict:
+    try:
+        return config_loader._load_civiform_server_env_vars(tag)
+    except SystemExit:
+        # _download_env_var_docs exits if the download fails.
+        return {}
+
+
+def _init_worker(
+        plans: Dict[str, validation_plan.ValidationPlan],
+        env_var_docs: Dict[str, dict]):
+    global _plans, _env_var_docs
+    _plans = plans
+    _env_var_docs = env_var_docs
+
+
+def _validate_config(
+        template_dir: str, tag: Optional[str],
+        config_fields: dict) -> List[str]:
+    plan = _plans[template_dir]
+    config_loader = ConfigLoader()
+    config_loader._config_fields = config_fields
+    config_loader._infra_variable_definitions = plan.definitions
+    config_loader._infra_validation_plan = plan
+    config_loader._civiform_server_env_var_docs = _env_var_docs.get(tag, {})
+    return [
+        _ANSI_ESCAPE_REGEX.sub('', error)
+        for error in config_loader.validate_config()
+    ]
+
+
+if __name__ == "__main__":
+    main()
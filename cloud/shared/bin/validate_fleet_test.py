@@ -0,0 +1,149 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cloud.shared.bin import validate_fleet
+from cloud.shared.bin.lib.config_loader import ConfigLoader
+from cloud.shared.bin.lib.env_var_docs_index import IndexedVariable
+"""
+Tests for validate_fleet.py. Run them from the root of the repository.
+
+To run the tests: PYTHONPATH="${PYTHONPATH}:${pwd}" python3 cloud/shared/bin/validate_fleet_test.py
+"""
+
+VALID_CONFIG = {
+    "CIVIFORM_APPLICANT_AUTH_PROTOCOL": "oidc",
+    "CIVIFORM_CLOUD_PROVIDER": "aws",
+    "CIVIFORM_MODE": "staging",
+    "SENDER_EMAIL_ADDRESS": "sender@example.com",
+    "STAGING_APPLICANT_NOTIFICATION_MAILING_LIST": "a@example.com",
+    "STAGING_PROGRAM_ADMIN_NOTIFICATION_MAILING_LIST": "b@example.com",
+    "STAGING_TI_NOTIFICATION_MAILING_LIST": "c@example.com",
+}
+
+ENV_VAR_DOCS = {
+    "MY_FLAG":
+        IndexedVariable(
+            type="bool",
+            mode="ADMIN_READABLE",
+            required=False,
+            values=[],
+            regex="")
+}
+
+
+class TestValidateFleet(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+        self.template_dir = os.path.join(self.tmpdir, "template")
+        os.mkdir(self.template_dir)
+        with open(os.path.join(self.template_dir, "variable_definitions.json"),
+                  "w") as f:
+            json.dump({}, f)
+
+        load = patch.object(
+            ConfigLoader,
+            "_load_civiform_server_env_vars",
+            return_value=ENV_VAR_DOCS)
+        self.mock_load = load.start()
+        self.addCleanup(load.stop)
+
+    def write_config(self, name: str, **fields) -> str:
+        config = dict(VALID_CONFIG, TERRAFORM_TEMPLATE_DIR=self.template_dir)
+        config.update(fields)
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "w") as f:
+            for key, value in config.items():
+                f.write(f'export {key}="{value}"\n')
+        return path
+
+    def validate(self, paths, tag=None) -> dict:
+        with contextlib.redirect_stderr(io.StringIO()):
+            return validate_fleet.validate_fleet(paths, tag, jobs=2)
+
+    def test_fleet_with_one_bad_config(self):
+        good = self.write_config("good.sh", CIVIFORM_VERSION="v1.2.3")
+        bad = self.write_config(
+            "bad.sh", CIVIFORM_VERSION="v1.2.3", CIVIFORM_MODE="dev")
+
+        report = self.validate([good, bad])
+
+        self.assertFalse(report["valid"])
+        self.assertEqual(report["summary"], {"configs": 2, "invalid": 1})
+        good_result, bad_result = report["configs"]
+        self.assertEqual(good_result["path"], good)
+        self.assertTrue(good_result["valid"])
+        self.assertEqual(good_result["errors"], [])
+        self.assertEqual(bad_result["path"], bad)
+        self.assertFalse(bad_result["valid"])
+        self.assertEqual(
+            bad_result["errors"], [
+                "'CIVIFORM_MODE': 'dev' is not a valid enum value. Valid values are ['prod', 'staging', 'test']"
+            ])
+
+    def test_server_variables_are_validated(self):
+        bad = self.write_config(
+            "bad.sh", CIVIFORM_VERSION="v1.2.3", MY_FLAG="maybe")
+
+        report = self.validate([bad])
+
+        self.assertFalse(report["valid"])
+        self.assertEqual(len(report["configs"][0]["errors"]), 1)
+        self.assertIn("MY_FLAG", report["configs"][0]["errors"][0])
+
+    def test_unparsable_config_is_reported(self):
+        good = self.write_config("good.sh", CIVIFORM_VERSION="v1.2.3")
+        bad = os.path.join(self.tmpdir, "bad.sh")
+        with open(bad, "w") as f:
+            f.write("CIVIFORM_MODE=staging\n")
+
+        report = self.validate([good, bad])
+
+        self.assertEqual(report["summary"], {"configs": 2, "invalid": 1})
+        self.assertTrue(report["configs"][0]["valid"])
+        self.assertTrue(
+            report["configs"][1]["errors"][0].startswith(
+                "Could not parse config"))
+
+    def test_tags_are_normalized(self):
+        with_prefix = self.write_config("a.sh", CIVIFORM_VERSION="v1.2.3")
+        without_prefix = self.write_config("b.sh", CIVIFORM_VERSION="1.2.3")
+
+        report = self.validate([with_prefix, without_prefix])
+
+        self.assertTrue(report["valid"])
+        self.assertEqual(
+            [result["tag"] for result in report["configs"]],
+            ["v1.2.3", "v1.2.3"])
+        self.mock_load.assert_called_once_with("v1.2.3")
+
+    def test_tag_argument_overrides_config_versions(self):
+        config = self.write_config("a.sh", CIVIFORM_VERSION="v1.2.3")
+
+        report = self.validate([config], tag="2.0.0")
+
+        self.assertEqual(report["configs"][0]["tag"], "v2.0.0")
+        self.mock_load.assert_called_once_with("v2.0.0")
+
+    def test_missing_env_var_docs_are_a_warning(self):
+        self.mock_load.return_value = {}
+        config = self.write_config("a.sh", CIVIFORM_VERSION="latest")
+
+        report = self.validate([config])
+
+        self.assertTrue(report["valid"])
+        self.assertEqual(
+            report["configs"][0]["warnings"], [
+                "Server variables were not validated, could not load env-var-docs for tag latest"
+            ])
+
+
+if __name__ == "__main__":
+    unittest.main()